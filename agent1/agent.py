@@ -2,28 +2,52 @@
 from google.adk.agents import LlmAgent
 from google.genai.types import HarmCategory, HarmBlockThreshold, SafetySetting
 from tools import log_reader_tool # Only LogReaderTool is needed now
-from google.adk.models.lite_llm import LiteLlm
 import os
+import sys
 from pydantic import BaseModel, Field
+import json
 from typing import Dict, Any
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for the shared `common` package
+from common.llm_cache import LlmResponseCache
+from common.router import model_from_env
+from common.telemetry import Telemetry
 
-# Initialize the model
-model = LiteLlm(
-    model="openrouter/google/gemma-3-27b-it:free",
+
+# Repeat runs with the same instruction and log_data are answered from disk instead of the model
+llm_cache = LlmResponseCache.from_env()
+# Per-event, per-run and per-tool timings and token counts, appended to telemetry.jsonl
+telemetry = Telemetry.from_env()
+log_reader_tool = telemetry.tool(log_reader_tool)
+
+# Initialize the model (hedged across MODEL_FALLBACKS when that is set)
+model = model_from_env(
+    "openrouter/google/gemma-3-27b-it:free",
     api_key="",
 )
 
 class JSONInput(BaseModel):
     # Changed logData to log_data and type to Dict[str, Any] to accept a JSON object
     instruction: str = Field(description="High-level instruction for the agent.")
-    log_data: Dict[str, Any] = Field(description="Raw customer session log data to be analyzed.")
+    log_data: Dict[str, Any] = Field(description="Per-user and per-fraud_scenario feature summary of the customer session logs to be analyzed.")
+
+ANALYSIS_INSTRUCTION = "Please analyze the provided per-user and per-scenario log features for distinct fraud patterns (referring to 'fraud_scenario' and associated data) and generate Rego policies in the exact JSON format for each unique fraud scenario. Make sure the Rego policies operate on a single 'user' object as input."
+
+
+def build_query(log_data: Dict[str, Any], instruction: str = ANALYSIS_INSTRUCTION) -> str:
+    """Serializes the {"instruction", "log_data"} message as compact JSON."""
+    return json.dumps({"instruction": instruction, "log_data": log_data}, separators=(",", ":"))
+
 
 class PolicyAnalystAgent(LlmAgent):
     def __init__(self, **kwargs):
+        # Extra model callbacks (e.g. a rate limiter) run after the cache, so cache hits skip them
+        before_model_callbacks = kwargs.pop("before_model_callback", None) or []
+        if not isinstance(before_model_callbacks, list):
+            before_model_callbacks = [before_model_callbacks]
         super().__init__(
             name="PolicyAnalyst",
-            model=model, # Using Pro for stronger reasoning capabilities on raw data
+            model=kwargs.pop("model", model), # Using Pro for stronger reasoning capabilities on raw data
             instruction="""
             You are an expert Security Policy Analyst specializing in Open Policy Agent (OPA) Rego policies.
             Your primary task is to deeply analyze raw customer session log data, identify distinct fraud patterns
@@ -33,19 +57,24 @@ class PolicyAnalystAgent(LlmAgent):
 
             ***Crucially, your input will be a JSON string with two main keys:**
             * `"instruction"`: This will contain your high-level directive (e.g., "analyze logs and generate Rego policies").
-            * `"log_data"`: This will contain the raw JSON log data itself, specifically the `fraud_detection_logs` object. This `log_data` will be a parsed JSON object (Python dictionary), not a string.
+            * `"log_data"`: This will contain a pre-computed feature summary of the `fraud_detection_logs` object (not the raw logs). This `log_data` will be a parsed JSON object (Python dictionary), not a string, with these keys:
+                * `"scenario_summary"`: one row per `fraud_scenario` with `n_users`, `unverified_share` and the min/median/max of every numeric feature.
+                * `"user_features"`: one row per user (`uid`, `fraud_scenario`, `risk_score` and the features).
+                * `"feature_sources"`: for each feature, the raw `input.*` fields it was computed from. Use these paths when writing Rego.
+                * Both tables use a compact `{"columns": [...], "rows": [[...], ...]}` layout.
 
             **Here's your refined workflow:**
             1.  **Understand the Request:** The user will provide a path to a JSON log file.
-            2.  **Read Logs:** Use the `log_reader_tool` to load the JSON log data. This tool will provide a raw list of user objects, each containing their 'user_profile', 'sessions', and 'fraud_scenario'.
+            2.  **Read Logs:** Start from the feature summary in `log_data`. Only if a pattern cannot be explained from the features, use the `log_reader_tool` to load the raw JSON log data. This tool will provide a raw list of user objects, each containing their 'user_profile', 'sessions', and 'fraud_scenario'.
             3.  **Perform Deep Analysis & Pattern Identification (Your Core Task):**
-                * Iterate through the provided list of user entries.
-                * For each user, identify their `fraud_scenario`.
+                * Compare each fraud scenario's row in `scenario_summary` against the "normal_behavior" row.
+                * Use `user_features` to check individual users and outliers within a scenario.
                 * **Crucially, for each unique `fraud_scenario` (excluding "normal_behavior"), examine the associated 'user_profile' and 'sessions' data (including 'device_info', 'network_info', and 'events' within sessions) to infer the specific conditions that define that fraud pattern.**
                 * **Examples of patterns to look for:**
                     * **Velocity Fraud:** How many "order_create" events occur in a short time within a session, especially for a user's total orders or account age? What are the declared values?
                     * **New User High Value Order:** Is the `account_age_days` very low (e.g., 0 or 1)? Is `verification_status` "unverified"? Is there a single, unusually high `declared_value` order in their initial session(s)?
                     * **IP Change Suspicious:** Are there multiple distinct `ip_address` values across different sessions for the same user, especially if these changes occur rapidly or are geographically disparate (infer from city/country)?
+                    * **Linked Accounts:** Does the user share a device, payment instrument, phone or delivery address with other accounts? `linked_accounts` (`input.link.component_size`) counts the accounts in that ring, 1 for a user who shares nothing.
                 * Identify concrete thresholds and conditions from the data.
             4.  **Generate Rego Policies:** For each distinct fraud scenario you identify (based on `fraud_scenario` field), generate a corresponding Rego policy.
                 * The output for each policy **must be a JSON object** with the following structure:
@@ -72,5 +101,7 @@ class PolicyAnalystAgent(LlmAgent):
             """,
             input_schema=JSONInput,
             output_key="rego policies",  # Store final JSON response
+            before_model_callback=[llm_cache.before_model, *before_model_callbacks],
+            after_model_callback=llm_cache.after_model,
         )
         
@@ -0,0 +1,188 @@
+# backtest.py
+"""
+Backtest of generated policies against logs labelled with `fraud_scenario`.
+
+Every policy is scored over all users at once (`PolicySet.deny_frame`) and compared with the
+labels: a policy named after a labelled scenario (e.g. "Velocity Fraud" for `velocity_fraud`) is
+scored against that scenario, any other policy against all non-`normal_behavior` users. The
+report has the confusion matrix, precision and recall per policy, the share of each scenario it
+flags, and the same for the whole bundle against "any fraud".
+
+With `sweep`, every numeric threshold of a vectorizable policy (`account_age_days < 30`,
+`declared_value > 40000`, `count(...) >= 5`, ...) is swept while the rest of the policy stays
+fixed. The policy engine reduces each threshold to one per-user statistic, so the confusion
+matrix for every candidate value comes from two sorted arrays and a `searchsorted`, not from
+re-running the policy per value.
+
+    python backtest.py agent_output.txt sample_logs_v2.json --sweep --out backtest.json
+"""
+import argparse
+import json
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from features import NORMAL_SCENARIO, LogFrames
+from log_cache import load_frames
+from policies import _slug, extract_policies
+from policy_engine import CompiledPolicy, PolicySet, RegoError, SweepTarget
+
+ANY_FRAUD = "any_fraud"
+
+
+def _rates(tp: Any, fp: Any, fn: Any) -> Dict[str, Any]:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        precision = np.where(tp + fp > 0, tp / np.maximum(tp + fp, 1), 0.0)
+        recall = np.where(tp + fn > 0, tp / np.maximum(tp + fn, 1), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / np.maximum(precision + recall, 1e-12), 0.0)
+    return {"precision": precision, "recall": recall, "f1": f1}
+
+
+def confusion(predicted: np.ndarray, actual: np.ndarray) -> Dict[str, Any]:
+    """Confusion matrix plus precision, recall and F1 of boolean predictions against boolean labels."""
+    tp = int(np.sum(predicted & actual))
+    fp = int(np.sum(predicted & ~actual))
+    fn = int(np.sum(~predicted & actual))
+    tn = int(np.sum(~predicted & ~actual))
+    rates = {k: round(float(v), 4) for k, v in _rates(tp, fp, fn).items()}
+    return {"tp": tp, "fp": fp, "fn": fn, "tn": tn, **rates}
+
+
+def target_label(scenario: str, labels: np.ndarray) -> Tuple[str, np.ndarray]:
+    """The label a policy named `scenario` is scored against, and the users carrying it."""
+    slug = _slug(scenario)
+    for label in np.unique(labels):
+        if _slug(label) == slug and label != NORMAL_SCENARIO:
+            return label, labels == label
+    return ANY_FRAUD, labels != NORMAL_SCENARIO
+
+
+def _flagged_by_label(predicted: np.ndarray, labels: np.ndarray) -> Dict[str, float]:
+    return {label: round(float(predicted[labels == label].mean()), 4) for label in np.unique(labels)}
+
+
+def sweep(policy: CompiledPolicy, target: SweepTarget, frames: LogFrames, actual: np.ndarray,
+          max_thresholds: int = 200) -> Dict[str, Any]:
+    """
+    Scores every candidate value of one threshold: the distinct values of its per-user statistic
+    (down-sampled to `max_thresholds` quantiles) plus the current one. Returns the curve and the
+    value with the best F1.
+    """
+    base, rest, statistic = policy.sweep_inputs(frames, target)
+    open_ = rest & ~base  # Users whose decision depends on this threshold
+    values = statistic[open_ & np.isfinite(statistic)]
+    candidates = np.unique(values)
+    if len(candidates) > max_thresholds:
+        candidates = np.unique(np.quantile(values, np.linspace(0, 1, max_thresholds), method="inverted_cdf"))
+    thresholds = np.union1d(candidates, [float(target.constant)])
+
+    def hits(mask: np.ndarray) -> np.ndarray:
+        # For each threshold, how many users in `mask` satisfy `statistic <op> threshold`.
+        ordered = np.sort(statistic[open_ & mask])
+        if target.op == ">":
+            return len(ordered) - np.searchsorted(ordered, thresholds, side="right")
+        if target.op == ">=":
+            return len(ordered) - np.searchsorted(ordered, thresholds, side="left")
+        if target.op == "<":
+            return np.searchsorted(ordered, thresholds, side="left")
+        return np.searchsorted(ordered, thresholds, side="right")
+
+    tp = int(np.sum(base & actual)) + hits(actual)
+    fp = int(np.sum(base & ~actual)) + hits(~actual)
+    fn = int(actual.sum()) - tp
+    tn = int((~actual).sum()) - fp
+    rates = _rates(tp, fp, fn)
+    best = int(np.argmax(rates["f1"]))
+    current = int(np.searchsorted(thresholds, float(target.constant)))
+
+    def point(i: int) -> Dict[str, Any]:
+        return {"threshold": float(thresholds[i]), "tp": int(tp[i]), "fp": int(fp[i]), "fn": int(fn[i]),
+                "tn": int(tn[i]), **{k: round(float(v[i]), 4) for k, v in rates.items()}}
+
+    return {
+        "body": target.body, "name": target.name, "op": target.op,
+        "current": point(current), "best": point(best),
+        "curve": {"thresholds": thresholds.tolist(), "tp": tp.tolist(), "fp": fp.tolist(),
+                  "precision": np.round(rates["precision"], 4).tolist(),
+                  "recall": np.round(rates["recall"], 4).tolist()},
+    }
+
+
+def backtest(policies: List[Dict[str, Any]], frames: LogFrames, sweeps: bool = False,
+             max_thresholds: int = 200) -> Dict[str, Any]:
+    """Scores `policies` against the `fraud_scenario` labels in `frames`; see the module docstring."""
+    started = time.perf_counter()
+    labels = frames.users["fraud_scenario"].fillna("unknown").astype(str).to_numpy()
+    policy_set = PolicySet(policies)
+    decisions = policy_set.deny_frame(frames)
+    report: Dict[str, Any] = {"n_users": len(labels),
+                              "labels": {label: int(n) for label, n in zip(*np.unique(labels, return_counts=True))},
+                              "policies": {}, "errors": policy_set.errors}
+    for scenario, policy in policy_set.compiled.items():
+        predicted = decisions[scenario].to_numpy()
+        label, actual = target_label(scenario, labels)
+        entry = {"label": label, **confusion(predicted, actual), "flagged_by_label": _flagged_by_label(predicted, labels)}
+        if sweeps:
+            entry["sweeps"] = []
+            for target in policy.sweep_targets():
+                try:
+                    entry["sweeps"].append(sweep(policy, target, frames, actual, max_thresholds))
+                except RegoError as e:
+                    entry["sweeps"].append({"body": target.body, "name": target.name, "error": str(e)})
+            if not entry["sweeps"]:
+                entry["sweep_error"] = "policy is not fully vectorizable; no thresholds swept"
+        report["policies"][scenario] = entry
+
+    predicted = decisions["any"].to_numpy() if policy_set.compiled else np.zeros(len(labels), dtype=bool)
+    report["bundle"] = {"label": ANY_FRAUD, **confusion(predicted, labels != NORMAL_SCENARIO),
+                        "flagged_by_label": _flagged_by_label(predicted, labels)}
+    report["seconds"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def _print_report(report: Dict[str, Any]) -> None:
+    columns = ["tp", "fp", "fn", "tn", "precision", "recall", "f1"]
+    print(f"{report['n_users']} users: " + ", ".join(f"{k}={v}" for k, v in report["labels"].items()))
+    print(f"{'policy':<32} {'label':<28} " + " ".join(f"{c:>9}" for c in columns))
+    rows = list(report["policies"].items()) + [("(bundle)", report["bundle"])]
+    for name, entry in rows:
+        print(f"{name[:32]:<32} {entry['label'][:28]:<28} " + " ".join(f"{entry[c]:>9}" for c in columns))
+    for name, entry in report["policies"].items():
+        for result in entry.get("sweeps", []):
+            if "error" in result:
+                print(f"  {name}: {result['name']}: {result['error']}")
+                continue
+            current, best = result["current"], result["best"]
+            print(f"  {name}: {result['name']} {result['op']} {current['threshold']:g} (f1 {current['f1']}) "
+                  f"-> best {best['threshold']:g} (f1 {best['f1']}, precision {best['precision']}, "
+                  f"recall {best['recall']}) over {len(result['curve']['thresholds'])} values")
+        if "sweep_error" in entry:
+            print(f"  {name}: {entry['sweep_error']}")
+    for name, error in report["errors"].items():
+        print(f"  {name}: does not compile: {error}")
+    print(f"({report['seconds']}s)")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Backtest generated policies against fraud_scenario labels.")
+    parser.add_argument("policies", help="Agent output or JSON file with the policy objects")
+    parser.add_argument("log_file", help="Labelled log file (JSON, JSONL, .gz or .zst)")
+    parser.add_argument("--sweep", action="store_true", help="Sweep every numeric threshold of each policy")
+    parser.add_argument("--max-thresholds", type=int, default=200, help="Candidate values per swept threshold")
+    parser.add_argument("--out", help="Write the full report (including sweep curves) as JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.policies, "r") as f:
+        policies = extract_policies(f.read())
+    if not policies:
+        parser.error(f"No policy objects found in {args.policies}")
+    report = backtest(policies, load_frames(args.log_file), args.sweep, args.max_thresholds)
+    _print_report(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
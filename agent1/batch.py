@@ -0,0 +1,164 @@
+# batch.py
+"""
+Runs policy generation over many log files (e.g. one per region or tenant) in one process.
+
+Jobs come from a directory of logs or a manifest, fan out over asyncio tasks under a concurrency
+limit, share one token bucket for the model endpoint, retry transient failures with backoff, and
+each get their own InMemorySessionService. Results are appended to a JSONL file as jobs finish.
+
+    python batch.py logs/ --out results.jsonl --concurrency 8 --rate 0.5 --burst 2
+    python batch.py manifest.jsonl --out results.jsonl
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from agent import PolicyAnalystAgent, build_query, telemetry
+from compaction import DEFAULT_TOKEN_BUDGET, budgeted_summary
+from log_cache import load_frames
+from common.ratelimit import TokenBucket, retry_async  # `common` is on sys.path once agent.py is imported
+
+APP_NAME = "fraud_policy_batch"
+USER_ID = "batch_runner"
+LOG_SUFFIXES = (".json", ".jsonl", ".ndjson", ".json.gz", ".jsonl.gz", ".json.zst", ".jsonl.zst")
+
+
+@dataclass
+class Job:
+    job_id: str
+    path: str
+    tenant: Optional[str] = None
+
+
+def load_jobs(source: str) -> List[Job]:
+    """
+    Builds the job list from a directory of log files, or from a manifest file.
+
+    A manifest is either plain text (one log path per line) or JSONL with `path` and optional
+    `job_id` / `tenant` keys; relative paths are resolved against the manifest's directory.
+    """
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source) if n.endswith(LOG_SUFFIXES))
+        return [Job(job_id=os.path.splitext(n)[0], path=os.path.join(source, n)) for n in names]
+
+    base = os.path.dirname(os.path.abspath(source))
+    jobs = []
+    with open(source, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            entry = json.loads(line) if line.startswith("{") else {"path": line}
+            path = entry["path"] if os.path.isabs(entry["path"]) else os.path.join(base, entry["path"])
+            job_id = entry.get("job_id") or os.path.splitext(os.path.basename(path))[0]
+            jobs.append(Job(job_id=job_id, path=path, tenant=entry.get("tenant")))
+    return jobs
+
+
+async def run_agent(agent: Any, query: str, session_id: str) -> Optional[str]:
+    """Runs one query through `agent` in its own session service and returns the stored output."""
+    session_service = InMemorySessionService()
+    await session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+    runner = Runner(agent=agent, app_name=APP_NAME, session_service=session_service)
+    content = types.Content(role="user", parts=[types.Part(text=query)])
+    final_text = None
+    async for event in telemetry.run(runner, user_id=USER_ID, session_id=session_id, new_message=content):
+        if event.is_final_response() and event.content and event.content.parts:
+            final_text = event.content.parts[0].text
+    session = await session_service.get_session(app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
+    return session.state.get(agent.output_key, final_text) if session else final_text
+
+
+class BatchRunner:
+    """Fans jobs out over asyncio tasks and streams one JSON line per finished job to `out_path`."""
+
+    def __init__(self, out_path: str, concurrency: int = 4, rate: float = 0.5, burst: float = 1.0,
+                 attempts: int = 4, agent_factory: Optional[Callable[..., Any]] = None,
+                 token_budget: int = DEFAULT_TOKEN_BUDGET):
+        self.out_path = out_path
+        self.token_budget = token_budget
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst)
+        self.attempts = attempts
+        self.agent_factory = agent_factory or PolicyAnalystAgent
+        self._write_lock = asyncio.Lock()
+        self._agent = None
+
+    def agent(self) -> Any:
+        # Agents are stateless between runs, so one instance serves every job.
+        if self._agent is None:
+            self._agent = self.agent_factory(before_model_callback=self.bucket.before_model)
+        return self._agent
+
+    async def run_job(self, job: Job) -> Dict[str, Any]:
+        started = time.perf_counter()
+        record: Dict[str, Any] = {"job_id": job.job_id, "path": job.path, "tenant": job.tenant}
+        async with self.semaphore:
+            try:
+                # Parsing is CPU-bound; keep it off the event loop so other jobs keep streaming.
+                log_data, report = await asyncio.to_thread(
+                    lambda: budgeted_summary(load_frames(job.path), self.token_budget)
+                )
+                record["compaction"] = {k: report[k] for k in ("users_in", "users_kept", "tokens_after", "tokens_saved")}
+                query = build_query(log_data)
+
+                def on_retry(attempt: int, exc: BaseException, delay: float) -> None:
+                    print(f"[{job.job_id}] attempt {attempt} failed ({exc!r}); retrying in {delay:.1f}s", file=sys.stderr)
+
+                async def attempt(n: int) -> Optional[str]:
+                    record["attempts"] = n
+                    return await run_agent(self.agent(), query, session_id=f"{job.job_id}-{n}")
+
+                record["output"] = await retry_async(attempt, attempts=self.attempts, on_retry=on_retry)
+                record["status"] = "ok"
+            except Exception as exc:
+                record["status"] = "error"
+                record["error"] = f"{type(exc).__name__}: {exc}"
+        record["elapsed_s"] = round(time.perf_counter() - started, 3)
+        await self._write(record)
+        return record
+
+    async def _write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str) + "\n"
+        async with self._write_lock:
+            with open(self.out_path, "a") as f:
+                f.write(line)
+
+    async def run(self, jobs: List[Job]) -> List[Dict[str, Any]]:
+        return await asyncio.gather(*(self.run_job(job) for job in jobs))
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate Rego policies for many log files concurrently.")
+    parser.add_argument("source", help="Directory of log files, or a manifest (.txt paths or .jsonl entries)")
+    parser.add_argument("--out", default="batch_results.jsonl", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=4, help="Jobs in flight at once")
+    parser.add_argument("--rate", type=float, default=0.5, help="Model calls per second across all jobs")
+    parser.add_argument("--burst", type=float, default=1.0, help="Model calls allowed back-to-back")
+    parser.add_argument("--attempts", type=int, default=4, help="Attempts per job for 429/5xx/timeouts")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET, help="Max tokens of log_data per call")
+    args = parser.parse_args(argv)
+
+    jobs = load_jobs(args.source)
+    print(f"Running {len(jobs)} jobs with concurrency {args.concurrency} -> {args.out}")
+    runner = BatchRunner(args.out, args.concurrency, args.rate, args.burst, args.attempts,
+                         token_budget=args.token_budget)
+    results = await runner.run(jobs)
+    failed = sum(r["status"] != "ok" for r in results)
+    print(f"Done: {len(results) - failed} ok, {failed} failed")
+    telemetry.print_summary()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    asyncio.run(main())
@@ -0,0 +1,226 @@
+# bench.py
+"""
+Scaling benchmark for the offline stages of policy generation, on synthetic logs from `synth`.
+
+For each log size the suite generates a log file and then measures:
+
+    read          streaming JSON parse of the log (`tools.iter_users`)
+    cache_build   parse + flatten + write of the columnar cache (`log_cache.load_frames`, cold)
+    cache_load    memory-mapped read of that cache entry (`log_cache.load_frames`, warm)
+    records       packing the frames into the interned columnar store (`records.CompactLog.from_frames`)
+    features      per-user feature extraction (`features.user_features`)
+    prompt        token-budgeted summary + query JSON (`compaction.budgeted_summary`, `agent.build_query`)
+    agent         one PolicyAnalystAgent run through the ADK Runner against a local stub model
+    policy_batch  vectorized scoring of every user (`policy_engine.PolicySet.deny_frame`)
+    policy_user   per-user interpreter calls (`PolicySet.deny`) on a sample of users
+
+Latency percentiles are over repeated whole-stage runs, except for `agent` and `policy_user`,
+which time each call. Peak memory is measured with tracemalloc in one extra untimed run; it covers
+Python and numpy allocations but not Arrow's own memory pool. No network access is needed.
+
+    python bench.py --users 1000 10000 100000 --repeat 5 --out bench.jsonl
+"""
+import os
+import sys
+import tempfile
+
+# Before `agent` is imported: the response cache would turn every stub call after the first into a cache hit
+os.environ.setdefault("LLM_CACHE_DISABLED", "1")
+
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import time
+import tracemalloc
+from typing import Any, AsyncGenerator, Callable, Dict, List, Optional
+
+import numpy as np
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from agent import PolicyAnalystAgent, build_query
+from batch import run_agent
+from compaction import budgeted_summary
+from features import unflatten_users, user_features
+from log_cache import load_frames
+from policy_engine import PolicySet
+from records import CompactLog
+from synth import SynthConfig, write_logs
+from tools import iter_users
+
+# Policies for the synthetic scenarios, in the format PolicyAnalystAgent emits; used by the stub model
+# and by the policy stages.
+STUB_POLICIES = [
+    {
+        "scenario": "velocity_fraud",
+        "description": "Young account placing many orders in one day.",
+        "rego_policy": "```rego\npackage fraud_detection\nimport future.keywords.in\n\n"
+                       "deny[msg] {\n    input.user_profile.account_age_days < 30\n"
+                       "    count([e | some s in input.sessions; some e in s.events; e.event_type == \"order_create\"]) >= 5\n"
+                       "    msg := \"velocity_fraud: many orders from a new account\"\n}\n```",
+    },
+    {
+        "scenario": "new_user_high_value_order",
+        "description": "Unverified account placing a high value order on its first days.",
+        "rego_policy": "```rego\npackage fraud_detection\nimport future.keywords.in\n\n"
+                       "deny[msg] {\n    input.user_profile.account_age_days <= 1\n"
+                       "    input.user_profile.verification_status == \"unverified\"\n"
+                       "    some s in input.sessions\n    some e in s.events\n    e.event_type == \"order_create\"\n"
+                       "    e.details.declared_value > 40000\n    msg := \"new_user_high_value_order\"\n}\n```",
+    },
+    {
+        "scenario": "ip_change_suspicious",
+        "description": "Sessions from three or more IP addresses.",
+        "rego_policy": "```rego\npackage fraud_detection\nimport future.keywords.in\n\n"
+                       "deny[msg] {\n    count({s.network_info.ip_address | some s in input.sessions}) >= 3\n"
+                       "    msg := \"ip_change_suspicious\"\n}\n```",
+    },
+]
+
+
+class StubLlm(BaseLlm):
+    """Local stand-in for the model: answers every request with `STUB_POLICIES` after `delay` seconds."""
+
+    delay: float = 0.0
+
+    async def generate_content_async(self, llm_request: LlmRequest, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        text = "\n\n".join("```json\n" + json.dumps(p, indent=2) + "\n```" for p in STUB_POLICIES)
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {"p50_ms": round(p50 * 1e3, 3), "p95_ms": round(p95 * 1e3, 3), "p99_ms": round(p99 * 1e3, 3)}
+
+
+def _peak_mb(fn: Callable[[], Any]) -> float:
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def measure(stage: str, fn: Callable[[], Any], users: int, repeat: int, memory: bool = True) -> Dict[str, Any]:
+    """Times `repeat` runs of `fn` over a log of `users` users, after one untimed (traced) run."""
+    peak = None
+    if memory:
+        peak = _peak_mb(fn)
+    else:
+        fn()  # Warm-up
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    median = float(np.median(samples))
+    return {"stage": stage, "users": users, "runs": repeat, **_percentiles(samples),
+            "users_per_s": round(users / median) if median else None, "peak_mb": peak}
+
+
+def measure_calls(stage: str, call: Callable[[int], Any], calls: int, users: int, memory: bool = True) -> Dict[str, Any]:
+    """Times `calls` individual calls `call(i)`; throughput is calls (not users) per second."""
+    peak = _peak_mb(lambda: call(0)) if memory else None
+    samples = []
+    for i in range(calls):
+        started = time.perf_counter()
+        call(i)
+        samples.append(time.perf_counter() - started)
+    return {"stage": stage, "users": users, "runs": calls, **_percentiles(samples),
+            "calls_per_s": round(calls / sum(samples)) if sum(samples) else None, "peak_mb": peak}
+
+
+def bench_size(n_users: int, workdir: str, repeat: int = 3, config: Optional[SynthConfig] = None, seed: int = 0,
+               sample_users: int = 1000, agent_calls: int = 10, model_delay: float = 0.0,
+               memory: bool = True) -> List[Dict[str, Any]]:
+    """Generates an `n_users` log in `workdir` and returns one result row per stage."""
+    path = os.path.join(workdir, f"synth_{n_users}.json")
+    started = time.perf_counter()
+    write_logs(path, n_users, config, seed)
+    results = [{"stage": "generate", "users": n_users, "runs": 1, "seconds": round(time.perf_counter() - started, 3),
+                "file_mb": round(os.path.getsize(path) / 2 ** 20, 1)}]
+
+    def cold_cache():
+        cache_dir = tempfile.mkdtemp(dir=workdir)
+        try:
+            return load_frames(path, cache_dir=cache_dir)
+        finally:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    cache_dir = os.path.join(workdir, "cache")
+    frames = load_frames(path, cache_dir=cache_dir)
+    results.append(measure("read", lambda: sum(1 for _ in iter_users(path)), n_users, repeat, memory))
+    results.append(measure("cache_build", cold_cache, n_users, repeat, memory))
+    results.append(measure("cache_load", lambda: load_frames(path, cache_dir=cache_dir), n_users, repeat, memory))
+    results.append(measure("records", lambda: CompactLog.from_frames(frames), n_users, repeat, memory))
+    results[-1]["store_mb"] = round(CompactLog.from_frames(frames).nbytes() / 2 ** 20, 1)
+    results.append(measure("features", lambda: user_features(frames), n_users, repeat, memory))
+    results.append(measure("prompt", lambda: build_query(budgeted_summary(frames)[0]), n_users, repeat, memory))
+
+    query = build_query(budgeted_summary(frames)[0])
+    agent = PolicyAnalystAgent(model=StubLlm(model="stub", delay=model_delay))
+    results.append(measure_calls("agent", lambda i: asyncio.run(run_agent(agent, query, session_id=f"bench-{i}")),
+                                 agent_calls, n_users, memory))
+
+    policies = PolicySet(STUB_POLICIES)
+    results.append(measure("policy_batch", lambda: policies.deny_frame(frames), n_users, repeat, memory))
+    sample_idx = sorted(random.Random(seed).sample(range(n_users), min(sample_users, n_users)))
+    sample = unflatten_users(frames, sample_idx)
+    if sample:
+        results.append(measure_calls("policy_user", lambda i: policies.deny(sample[i % len(sample)]),
+                                     len(sample), n_users, memory))
+    return results
+
+
+def _print_table(rows: List[Dict[str, Any]]) -> None:
+    columns = ["stage", "users", "runs", "p50_ms", "p95_ms", "p99_ms", "users_per_s", "calls_per_s", "peak_mb"]
+    widths = {c: max(len(c), *(len(str(r.get(c, ""))) for r in rows)) for c in columns}
+    print("  ".join(c.rjust(widths[c]) for c in columns))
+    for row in rows:
+        if row["stage"] == "generate":
+            print(f"generate  {row['users']} users in {row['seconds']}s ({row['file_mb']} MB)")
+            continue
+        print("  ".join(str(row.get(c, "") if row.get(c) is not None else "").rjust(widths[c]) for c in columns))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Benchmark log reading, features, prompt building and policy evaluation.")
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000], help="Log sizes to benchmark")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per whole-log stage")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--agent-calls", type=int, default=10, help="Stub model calls to time")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Seconds the stub model waits per call")
+    parser.add_argument("--sample-users", type=int, default=1000, help="Users timed one by one in policy_user")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run (faster on large logs)")
+    parser.add_argument("--workdir", help="Where generated logs and caches go (default: a temporary directory)")
+    parser.add_argument("--out", help="Append result rows to this JSONL file")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="fraud_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    rows = []
+    try:
+        for n in args.users:
+            print(f"--- {n} users", file=sys.stderr)
+            rows.extend(bench_size(n, workdir, args.repeat, seed=args.seed, sample_users=args.sample_users,
+                                   agent_calls=args.agent_calls, model_delay=args.model_latency,
+                                   memory=not args.no_memory))
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    _print_table(rows)
+    if args.out:
+        with open(args.out, "a") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+
+
+if __name__ == "__main__":
+    main()
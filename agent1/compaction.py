@@ -0,0 +1,224 @@
+# compaction.py
+"""
+Token-budgeted compaction of the `log_data` sent to PolicyAnalystAgent.
+
+Payloads are encoded as minified JSON and trimmed to a token budget by a stratified sample: users
+are taken round-robin across `fraud_scenario`s, and each scenario's outliers (the users holding
+the min/max of every numeric feature) come first, so rare scenarios and extreme values survive
+however small the budget. Raw user logs additionally lose fields no policy uses (`email`, `phone`,
+`payment_id`, ...) and have structurally identical sessions collapsed into one. Every entry point
+returns a report with the tokens saved against the old pretty-printed payload.
+"""
+import json
+import os
+import random
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, List, Tuple, Union
+
+import pandas as pd
+
+from features import FEATURE_COLUMNS, flatten_users, summarize_features, user_features
+from records import CompactLog, RecordView
+
+DEFAULT_TOKEN_BUDGET = int(os.getenv("LOG_TOKEN_BUDGET", "8000"))
+# Identifiers and contact details: unique per record, never useful as a policy condition.
+DROP_FIELDS = frozenset({"email", "phone", "payment_id", "order_id"})
+# Ignored when deciding whether two sessions show the same behaviour.
+SESSION_IDENTITY_FIELDS = frozenset({"session_id", "start_time", "end_time", "timestamp"})
+# Stop scanning for smaller users once this many in a row did not fit the remaining budget.
+MAX_MISSES = 32
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Counts tokens with tiktoken's cl100k_base when available, else estimates 4 characters per token."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:  # Not installed, or the encoding cannot be fetched offline
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def _plain(value: Any) -> Any:
+    # json.dumps fallback: a `records.CompactLog` is encoded one user view at a time, anything else as str
+    if isinstance(value, CompactLog):
+        return list(value)
+    if isinstance(value, RecordView):
+        return value.to_dict()
+    return str(value)
+
+
+def compact_json(data: Any) -> str:
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False, default=_plain)
+
+
+def drop_fields(obj: Any, fields: Iterable[str] = DROP_FIELDS) -> Any:
+    """Returns a copy of `obj` without the given keys, at any depth."""
+    fields = frozenset(fields)
+    if isinstance(obj, Mapping):
+        return {k: drop_fields(v, fields) for k, v in obj.items() if k not in fields}
+    if isinstance(obj, list):
+        return [drop_fields(v, fields) for v in obj]
+    return obj
+
+
+def _signature(obj: Any) -> Any:
+    if isinstance(obj, Mapping):
+        return tuple(sorted((k, _signature(v)) for k, v in obj.items() if k not in SESSION_IDENTITY_FIELDS))
+    if isinstance(obj, list):
+        return tuple(_signature(v) for v in obj)
+    return obj
+
+
+def dedupe_sessions(user: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """
+    Collapses sessions that differ only in ids and timestamps into their first occurrence, which
+    gets a `repeat_count`. Returns the new user object and the number of sessions removed.
+    """
+    sessions = user.get("sessions") or []
+    kept: Dict[Any, Dict[str, Any]] = {}
+    for session in sessions:
+        signature = _signature(session)
+        if signature in kept:
+            kept[signature]["repeat_count"] = kept[signature].get("repeat_count", 1) + 1
+        else:
+            kept[signature] = dict(session)
+    return {**user, "sessions": list(kept.values())}, len(sessions) - len(kept)
+
+
+def stratified_order(features: pd.DataFrame, seed: int = 0) -> List[int]:
+    """
+    Orders the rows of a `user_features` frame (as positions) for sampling: round-robin across
+    fraud scenarios, each scenario yielding its outliers first and then its other users at random.
+    Any prefix of the result is a stratified sample that covers as many scenarios as it can.
+    """
+    rng = random.Random(seed)
+    scenarios = features["fraud_scenario"].fillna("unknown").to_numpy()
+    numeric = [c for c in ["risk_score"] + FEATURE_COLUMNS if c in features and c != "verification_status"]
+    queues = []
+    for scenario in sorted(set(scenarios)):
+        members = [int(i) for i in (scenarios == scenario).nonzero()[0]]
+        group = features.iloc[members].reset_index(drop=True)
+        outliers: List[int] = []
+        for column in numeric:
+            values = pd.to_numeric(group[column], errors="coerce").dropna()
+            if values.empty or values.min() == values.max():
+                continue
+            for pos in (values.idxmax(), values.idxmin()):
+                if members[pos] not in outliers:
+                    outliers.append(members[pos])
+        seen = set(outliers)
+        rest = [i for i in members if i not in seen]
+        rng.shuffle(rest)
+        queues.append(outliers + rest)
+
+    order = []
+    for rank in range(max(map(len, queues), default=0)):
+        order.extend(queue[rank] for queue in queues if rank < len(queue))
+    return order
+
+
+def _fill(order: List[int], cost, budget: int) -> List[int]:
+    # Greedy over the stratified order; skips items that no longer fit but keeps looking for smaller ones.
+    chosen, spent, misses = [], 0, 0
+    for i in order:
+        c = cost(i)
+        if spent + c > budget:
+            misses += 1
+            if misses >= MAX_MISSES:
+                break
+            continue
+        chosen.append(i)
+        spent += c
+        misses = 0
+    return sorted(chosen)
+
+
+def _report(scenarios: pd.Series, chosen: List[int], before: int, after: int, **extra: Any) -> Dict[str, Any]:
+    totals = scenarios.fillna("unknown").value_counts()
+    kept = scenarios.iloc[chosen].fillna("unknown").value_counts()
+    return {
+        "users_in": len(scenarios),
+        "users_kept": len(chosen),
+        **extra,
+        "per_scenario": {s: {"kept": int(kept.get(s, 0)), "total": int(n)} for s, n in totals.sort_index().items()},
+        "tokens_before": before,
+        "tokens_after": after,
+        "tokens_saved": before - after,
+    }
+
+
+def compact_logs(fraud_detection_logs: Dict[str, Any], token_budget: int = DEFAULT_TOKEN_BUDGET,
+                 fields: Iterable[str] = DROP_FIELDS, seed: int = 0) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Compacts a raw `fraud_detection_logs` object (header plus `users`, a list of user objects or a
+    `records.CompactLog`) to at most about `token_budget` tokens of minified JSON. Returns
+    (compacted logs, report).
+
+    The report's `tokens_before` (the log pretty-printed) is extrapolated from the chosen users, so
+    the rest of the log is never serialized.
+    """
+    header = drop_fields({k: v for k, v in fraud_detection_logs.items() if k != "users"}, fields)
+    users = fraud_detection_logs.get("users") or []
+    features = user_features(users.to_frames() if isinstance(users, CompactLog) else flatten_users(users))
+
+    compacted: Dict[int, Dict[str, Any]] = {}
+
+    def cost(i: int) -> int:
+        compacted[i], _ = dedupe_sessions(drop_fields(users[i], fields))
+        return count_tokens(compact_json(compacted[i])) + 1
+
+    budget = token_budget - count_tokens(compact_json({**header, "users": []}))
+    chosen = _fill(stratified_order(features, seed), cost, budget)
+    result = {**header, "users": [compacted[i] for i in chosen]}
+
+    raw_header = {k: v for k, v in fraud_detection_logs.items() if k != "users"}
+    before = count_tokens(json.dumps(raw_header, indent=2, default=_plain))
+    if chosen:
+        sampled = sum(count_tokens(json.dumps(users[i], indent=2, default=_plain)) for i in chosen)
+        before += round(sampled * len(users) / len(chosen))
+    after = count_tokens(compact_json(result))
+    sessions_removed = sum(len(users[i].get("sessions") or []) - len(compacted[i]["sessions"]) for i in chosen)
+    return result, _report(features["fraud_scenario"], chosen, before, after, sessions_deduped=sessions_removed)
+
+
+def compact_users(users: Union[List[Dict[str, Any]], CompactLog], token_budget: int = DEFAULT_TOKEN_BUDGET,
+                  fields: Iterable[str] = DROP_FIELDS, seed: int = 0) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """`compact_logs` for a bare list of user objects. Returns (compacted users, report)."""
+    result, report = compact_logs({"users": users}, token_budget, fields, seed)
+    return result["users"], report
+
+
+def budgeted_summary(frames: Any, token_budget: int = DEFAULT_TOKEN_BUDGET, max_users: int = 200,
+                     seed: int = 0, **header: Any) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Builds the `summarize_frames` payload with its per-user rows chosen by stratified sampling
+    (instead of the first `max_users`) and cut to fit `token_budget`. Returns (log_data, report).
+    """
+    return budgeted_feature_summary(user_features(frames), token_budget, max_users, seed, **header)
+
+
+def budgeted_feature_summary(features: pd.DataFrame, token_budget: int = DEFAULT_TOKEN_BUDGET, max_users: int = 200,
+                             seed: int = 0, **header: Any) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """`budgeted_summary` from an already computed `user_features` frame."""
+    features = features.reset_index(drop=True)
+    order = stratified_order(features, seed)[:max_users]
+    # Counts and the scenario summary cover the whole log; only the per-user rows are sampled
+    full = summarize_features(features, sample=order, **header)
+    rows = full["user_features"]["rows"]
+
+    fixed = count_tokens(compact_json({**full, "user_features": {**full["user_features"], "rows": []}}))
+    chosen = _fill(list(range(len(rows))), lambda i: count_tokens(compact_json(rows[i])) + 1, token_budget - fixed)
+    # Back to input order, so the table reads like the original log
+    kept = sorted((order[i], rows[i]) for i in chosen)
+    log_data = {**full, "user_features": {**full["user_features"], "rows": [row for _, row in kept]}}
+
+    before = count_tokens(json.dumps(full, indent=2, default=str))
+    after = count_tokens(compact_json(log_data))
+    return log_data, _report(features["fraud_scenario"], [pos for pos, _ in kept], before, after)
@@ -0,0 +1,328 @@
+# features.py
+"""
+Vectorized feature extraction over fraud_detection_logs.
+
+Users, sessions and events are flattened into three pandas frames whose column names are the
+dotted paths of the original JSON (e.g. `user_profile.account_age_days`, `network_info.ip_address`,
+`details.declared_value`), so they line up with the `input.*` paths used in the Rego policies.
+Per-user and per-`fraud_scenario` aggregates are computed from those frames and handed to the
+PolicyAnalystAgent as a compact table instead of the raw log JSON.
+"""
+import datetime
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+NORMAL_SCENARIO = "normal_behavior"  # The `fraud_scenario` label of legitimate users
+
+TIME_COLUMNS = {
+    "users": ["user_profile.account_created"],
+    "sessions": ["start_time", "end_time"],
+    "events": ["timestamp"],
+}
+
+# Per-user features sent to the agent, in display order.
+FEATURE_COLUMNS = [
+    "account_age_days",
+    "total_orders",
+    "verification_status",
+    "n_sessions",
+    "n_orders",
+    "max_orders_per_minute",
+    "min_order_gap_seconds",
+    "distinct_ips",
+    "distinct_cities",
+    "distinct_countries",
+    "distinct_devices",
+    "max_declared_value",
+    "total_declared_value",
+    "min_session_gap_minutes",
+    "linked_accounts",
+]
+
+# Where each feature comes from in a single user object, so the agent can write Rego against raw input.
+FEATURE_SOURCES = {
+    "account_age_days": "input.user_profile.account_age_days",
+    "total_orders": "input.user_profile.total_orders",
+    "verification_status": "input.user_profile.verification_status",
+    "n_sessions": "count(input.sessions)",
+    "n_orders": "count of input.sessions[_].events[_] with event_type == \"order_create\"",
+    "max_orders_per_minute": "max over sessions of order_create events / session duration_minutes",
+    "min_order_gap_seconds": "smallest gap between consecutive order_create timestamps",
+    "distinct_ips": "distinct input.sessions[_].network_info.ip_address",
+    "distinct_cities": "distinct input.sessions[_].network_info.location.city",
+    "distinct_countries": "distinct input.sessions[_].network_info.location.country",
+    "distinct_devices": "distinct input.sessions[_].device_info.device_id",
+    "max_declared_value": "max input.sessions[_].events[_].details.declared_value",
+    "total_declared_value": "sum input.sessions[_].events[_].details.declared_value",
+    "min_session_gap_minutes": "smallest gap between one session's end_time and the next start_time",
+    "linked_accounts": "input.link.component_size: accounts sharing a device_id, payment_id, phone or "
+                       "delivery_address with this one, directly or through others (1 if none)",
+}
+
+
+class LogFrames(NamedTuple):
+    users: pd.DataFrame
+    sessions: pd.DataFrame
+    events: pd.DataFrame
+
+
+def _flatten(obj: Dict[str, Any], prefix: str = "", out: Dict[str, Any] = None) -> Dict[str, Any]:
+    # Nested dicts become dotted columns; lists (sessions, events) are flattened into their own frames.
+    if out is None:
+        out = {}
+    for key, value in obj.items():
+        if isinstance(value, dict):
+            _flatten(value, f"{prefix}{key}.", out)
+        elif not isinstance(value, list):
+            out[prefix + key] = value
+    return out
+
+
+def _parse_times(frame: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    for column in columns:
+        if column in frame.columns:
+            frame[column] = pd.to_datetime(frame[column], utc=True, errors="coerce")
+    return frame
+
+
+def flatten_users(users: Iterable[Dict[str, Any]]) -> LogFrames:
+    """
+    Flattens user objects (e.g. from `tools.iter_users`) into user, session and event frames.
+
+    Sessions carry a `user_idx` and events carry both `user_idx` and `session_idx`, each pointing
+    at the row position in the parent frame.
+    """
+    user_rows, session_rows, event_rows = [], [], []
+    for user in users:
+        user_idx = len(user_rows)
+        user_rows.append(_flatten(user))
+        for session in user.get("sessions", []):
+            session_idx = len(session_rows)
+            row = _flatten(session)
+            row["user_idx"] = user_idx
+            session_rows.append(row)
+            for event in session.get("events", []):
+                row = _flatten(event)
+                row["user_idx"] = user_idx
+                row["session_idx"] = session_idx
+                event_rows.append(row)
+
+    frames = LogFrames(
+        users=pd.DataFrame(user_rows),
+        sessions=pd.DataFrame(session_rows, columns=None if session_rows else ["user_idx"]),
+        events=pd.DataFrame(event_rows, columns=None if event_rows else ["user_idx", "session_idx", "event_type"]),
+    )
+    for name, frame in frames._asdict().items():
+        _parse_times(frame, TIME_COLUMNS[name])
+    return frames
+
+
+def subset_frames(frames: LogFrames, user_idx: Sequence[int]) -> LogFrames:
+    """
+    Returns the frames restricted to `user_idx` (in that order), renumbering `user_idx` and
+    `session_idx` so the result is a self-contained LogFrames.
+    """
+    user_idx = np.asarray(user_idx, dtype=np.int64)
+    users = frames.users.iloc[user_idx].reset_index(drop=True)
+    user_map = pd.Series(np.arange(len(user_idx)), index=user_idx)
+
+    sessions = frames.sessions[frames.sessions["user_idx"].isin(user_idx)]
+    session_map = pd.Series(np.arange(len(sessions)), index=sessions.index)
+    sessions = sessions.reset_index(drop=True)
+    sessions["user_idx"] = user_map.reindex(sessions["user_idx"]).to_numpy()
+
+    events = frames.events[frames.events["session_idx"].isin(session_map.index)].reset_index(drop=True)
+    events["user_idx"] = user_map.reindex(events["user_idx"]).to_numpy()
+    events["session_idx"] = session_map.reindex(events["session_idx"]).to_numpy()
+    return LogFrames(users, sessions, events)
+
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, datetime.datetime):
+        return value.strftime("%Y-%m-%dT%H:%M:%SZ" if not value.microsecond else "%Y-%m-%dT%H:%M:%S.%fZ")
+    if isinstance(value, float) and value.is_integer():
+        return int(value)  # Integer fields that shared a column with nulls come back as floats
+    return value
+
+
+def _unflatten(row: Dict[str, Any], skip: tuple = ()) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for key, value in row.items():
+        if value is None or value is pd.NaT or value != value or key in skip:  # value != value: NaN
+            continue
+        node = out
+        *parents, leaf = key.split(".")
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[leaf] = _json_value(value)
+    return out
+
+
+def nest_rows(user_rows: Sequence[Dict[str, Any]], session_rows: Sequence[Dict[str, Any]],
+              event_rows: Sequence[Dict[str, Any]], user_idx: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+    """
+    Inverse of `flatten_users`: rebuilds nested user objects from flattened row dicts.
+
+    Missing and null fields are omitted and timestamps are rendered back to ISO-8601 strings. If
+    `user_idx` is given only those users are rebuilt, in that order.
+    """
+    wanted = range(len(user_rows)) if user_idx is None else user_idx
+    users = {}
+    for idx in wanted:
+        user = _unflatten(user_rows[idx])
+        user["sessions"] = []
+        users[idx] = user
+    sessions = {}
+    for session_idx, row in enumerate(session_rows):
+        user = users.get(row["user_idx"])
+        if user is not None:
+            session = _unflatten(row, skip=("user_idx",))
+            session["events"] = []
+            user["sessions"].append(session)
+            sessions[session_idx] = session
+    for row in event_rows:
+        session = sessions.get(row["session_idx"])
+        if session is not None:
+            session["events"].append(_unflatten(row, skip=("user_idx", "session_idx")))
+    return list(users.values())
+
+
+def unflatten_users(frames: LogFrames, user_idx: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+    """Rebuilds nested user objects from flattened frames (all users, or just `user_idx`)."""
+    return nest_rows(*(frame.to_dict("records") for frame in frames), user_idx=user_idx)
+
+
+def _column(frame: pd.DataFrame, name: str, default=np.nan) -> pd.Series:
+    if name in frame.columns:
+        return frame[name]
+    return pd.Series(default, index=frame.index)
+
+
+def user_features(frames: LogFrames) -> pd.DataFrame:
+    """
+    Computes one row of behavioural features per user, indexed by `user_idx`.
+    """
+    users, sessions, events = frames
+    n_users = len(users)
+    index = pd.RangeIndex(n_users, name="user_idx")
+
+    def per_user(series: pd.Series, fill=0) -> pd.Series:
+        return series.reindex(index, fill_value=fill)
+
+    features = pd.DataFrame(index=index)
+    features["uid"] = _column(users, "uid").to_numpy()
+    features["fraud_scenario"] = _column(users, "fraud_scenario").to_numpy()
+    features["risk_score"] = _column(users, "risk_score").to_numpy()
+    features["account_age_days"] = _column(users, "user_profile.account_age_days").to_numpy()
+    features["total_orders"] = _column(users, "user_profile.total_orders").to_numpy()
+    features["verification_status"] = _column(users, "user_profile.verification_status").to_numpy()
+
+    features["n_sessions"] = per_user(sessions.groupby("user_idx").size())
+    for feature, column in (
+        ("distinct_ips", "network_info.ip_address"),
+        ("distinct_cities", "network_info.location.city"),
+        ("distinct_countries", "network_info.location.country"),
+        ("distinct_devices", "device_info.device_id"),
+    ):
+        features[feature] = per_user(_column(sessions, column).groupby(sessions["user_idx"]).nunique())
+
+    orders = events[_column(events, "event_type", "") == "order_create"]
+    features["n_orders"] = per_user(orders.groupby("user_idx").size())
+
+    declared = pd.to_numeric(_column(orders, "details.declared_value"), errors="coerce")
+    features["max_declared_value"] = per_user(declared.groupby(orders["user_idx"]).max(), np.nan)
+    features["total_declared_value"] = per_user(declared.groupby(orders["user_idx"]).sum())
+
+    # Orders per minute of session time; sessions shorter than a minute count as one minute.
+    if len(sessions):
+        duration = pd.to_numeric(_column(sessions, "duration_minutes"), errors="coerce")
+        span = (_column(sessions, "end_time") - _column(sessions, "start_time")).dt.total_seconds() / 60
+        duration = duration.fillna(span).clip(lower=1).fillna(1)
+        per_session = orders.groupby("session_idx").size().reindex(sessions.index, fill_value=0)
+        rate = per_session / duration
+        features["max_orders_per_minute"] = per_user(rate.groupby(sessions["user_idx"]).max())
+    else:
+        features["max_orders_per_minute"] = 0.0
+
+    if len(orders):
+        ordered = orders.sort_values(["user_idx", "timestamp"])
+        gaps = ordered.groupby("user_idx")["timestamp"].diff().dt.total_seconds()
+        features["min_order_gap_seconds"] = per_user(gaps.groupby(ordered["user_idx"]).min(), np.nan)
+    else:
+        features["min_order_gap_seconds"] = np.nan
+
+    if len(sessions) and "start_time" in sessions.columns:
+        ordered = sessions.sort_values(["user_idx", "start_time"])
+        previous_end = ordered.groupby("user_idx")["end_time"].shift()
+        gaps = (ordered["start_time"] - previous_end).dt.total_seconds() / 60
+        features["min_session_gap_minutes"] = per_user(gaps.groupby(ordered["user_idx"]).min(), np.nan)
+    else:
+        features["min_session_gap_minutes"] = np.nan
+
+    if "link.component_size" not in users.columns:
+        from links import link_frames  # links imports this module
+        users = link_frames(frames).users
+    features["linked_accounts"] = users["link.component_size"].to_numpy()
+
+    return features
+
+
+def scenario_summary(features: pd.DataFrame) -> pd.DataFrame:
+    """
+    Aggregates user features per `fraud_scenario`: user count plus min/median/max of each numeric feature.
+    """
+    numeric = [c for c in FEATURE_COLUMNS if c != "verification_status" and c in features.columns]
+    grouped = features.groupby("fraud_scenario")
+    summary = grouped[numeric].agg(["min", "median", "max"]) if len(features) else pd.DataFrame()
+    summary.columns = [f"{feature}_{stat}" for feature, stat in summary.columns]
+    summary.insert(0, "n_users", grouped.size())
+    if "verification_status" in features.columns:
+        unverified = features["verification_status"].ne("verified")
+        summary.insert(1, "unverified_share", unverified.groupby(features["fraud_scenario"]).mean())
+    return summary.rename_axis("fraud_scenario").reset_index()
+
+
+def _table(frame: pd.DataFrame) -> Dict[str, Any]:
+    # Column-major "split" layout: keys appear once instead of once per row.
+    frame = frame.round(3).astype(object).where(frame.notna(), None)
+    return {"columns": list(frame.columns), "rows": frame.to_numpy().tolist()}
+
+
+def summarize_frames(frames: LogFrames, max_users: int = 200, **header: Any) -> Dict[str, Any]:
+    """
+    Builds the compact `log_data` payload for PolicyAnalystAgent from flattened log frames.
+
+    At most `max_users` per-user rows are included; the per-scenario summary always covers every user.
+    Extra keyword arguments (e.g. `analysis_date`, `platform`) are copied to the top of the payload.
+    """
+    return summarize_features(user_features(frames), max_users, **header)
+
+
+def summarize_features(features: pd.DataFrame, max_users: int = 200, sample: Optional[Sequence[int]] = None,
+                       **header: Any) -> Dict[str, Any]:
+    """
+    Same as `summarize_frames`, from an already computed `user_features` frame (rows kept in its order).
+
+    `n_users` and `scenario_summary` always cover every user; `sample` (row positions) picks the
+    per-user rows listed instead of the first `max_users`.
+    """
+    per_user = features[["uid", "fraud_scenario", "risk_score"] + FEATURE_COLUMNS]
+    return {
+        **header,
+        "n_users": len(features),
+        "feature_sources": FEATURE_SOURCES,
+        "scenario_summary": _table(scenario_summary(features)),
+        "user_features": _table(per_user.iloc[list(sample)] if sample is not None else per_user.head(max_users)),
+    }
+
+
+def summarize_logs(fraud_detection_logs: Dict[str, Any], max_users: int = 200) -> Dict[str, Any]:
+    """Builds the `log_data` payload from an in-memory `fraud_detection_logs` object."""
+    return summarize_frames(
+        flatten_users(fraud_detection_logs.get("users", [])),
+        max_users=max_users,
+        analysis_date=fraud_detection_logs.get("analysis_date"),
+        platform=fraud_detection_logs.get("platform"),
+    )
@@ -0,0 +1,243 @@
+# geo.py
+"""
+Geo-temporal index of session locations, for impossible-travel and IP-hop detection.
+
+`GeoIndex` sorts every session by (user, `start_time`) once and precomputes, per session, the hop
+from the same user's previous session: haversine distance between `network_info.location`
+coordinates, the gap since the previous `end_time`, the implied speed, and whether the
+`ip_address` or `city` changed. Prefix sums of the changes plus a (user, time) search key make
+rolling-window questions such as "more than 3 IP changes within 30 minutes" a couple of
+`searchsorted` calls over the index, without going back to the sessions frame; results are
+memoized per window.
+
+    index = GeoIndex(load_frames("sample_logs_v2.json"))
+    index.query("30min", ip_changes_over=3)          # user_idx of matching users
+    index.query("1h", speed_over_kmh=900)            # impossible travel
+    index.user_table("30min")                        # per-user maxima, indexed by user_idx
+
+    python geo.py sample_logs_v2.json --window 30min --ip-changes-over 3 --speed-over 900
+"""
+import argparse
+import time
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+from features import LogFrames, _column
+
+EARTH_RADIUS_KM = 6371.0088
+# Hops closer together than this are timed as this long, as with session durations in `features`.
+MIN_GAP_SECONDS = 60.0
+# Above airliner cruising speed; used by the command line when --speed-over is given without a value.
+IMPOSSIBLE_SPEED_KMH = 900.0
+
+Window = Union[str, float, int, pd.Timedelta]
+
+
+def haversine_km(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km between coordinate arrays given in degrees; NaN where any is missing."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def window_seconds(window: Window) -> float:
+    """Seconds in a window given as seconds or a pandas timedelta string ("30min", "2h", ...)."""
+    if isinstance(window, (int, float)):
+        return float(window)
+    return pd.Timedelta(window).total_seconds()
+
+
+def _times_ns(series: pd.Series) -> np.ndarray:
+    # Epoch nanoseconds, with NaT as the int64 minimum
+    return pd.DatetimeIndex(pd.to_datetime(series, utc=True)).as_unit("ns").asi8
+
+
+def _codes(series: pd.Series) -> np.ndarray:
+    return pd.factorize(series)[0].astype(np.int64)  # -1 where missing
+
+
+class GeoIndex:
+    """Sessions in (user, start time) order with their hop metrics; see the module docstring."""
+
+    def __init__(self, frames: LogFrames):
+        users, sessions = frames.users, frames.sessions
+        self.n_users = len(users)
+        self.uids = _column(users, "uid").to_numpy()
+
+        user = sessions["user_idx"].to_numpy(dtype=np.int64) if len(sessions) else np.zeros(0, dtype=np.int64)
+        start = _times_ns(_column(sessions, "start_time", pd.NaT))
+        order = np.lexsort((start, user))  # NaT start times sort first within their user
+        self.session_idx = sessions.index.to_numpy()[order]
+        self.user = user[order]
+        self.start = start[order]
+        end = _times_ns(_column(sessions, "end_time", pd.NaT))[order]
+        self.end = np.where(end == np.iinfo(np.int64).min, self.start, end)
+        self.lat = pd.to_numeric(_column(sessions, "network_info.location.latitude"), errors="coerce").to_numpy(np.float64)[order]
+        self.lon = pd.to_numeric(_column(sessions, "network_info.location.longitude"), errors="coerce").to_numpy(np.float64)[order]
+        self.ip = _codes(_column(sessions, "network_info.ip_address"))[order]
+        self.city = _codes(_column(sessions, "network_info.location.city"))[order]
+        # Rows of user u are offsets[u]:offsets[u + 1]
+        self.offsets = np.concatenate(([0], np.cumsum(np.bincount(self.user, minlength=self.n_users))))
+
+        n = len(self.user)
+        has_previous = np.zeros(n, dtype=bool)
+        has_previous[1:] = self.user[1:] == self.user[:-1]
+        previous = np.maximum(np.arange(n) - 1, 0)
+        self.has_previous = has_previous
+
+        # Hop from the previous session of the same user (NaN / False for a user's first session)
+        self.distance_km = np.where(has_previous, haversine_km(self.lat[previous], self.lon[previous],
+                                                               self.lat, self.lon), np.nan)
+        gap = (self.start - self.end[previous]) / 1e9
+        self.gap_seconds = np.where(has_previous, gap, np.nan)
+        self.speed_kmh = self.distance_km / (np.maximum(np.nan_to_num(gap, nan=0.0), MIN_GAP_SECONDS) / 3600)
+        self.ip_change = has_previous & (self.ip != self.ip[previous]) & (self.ip >= 0) & (self.ip[previous] >= 0)
+        self.city_change = has_previous & (self.city != self.city[previous]) & (self.city >= 0) & (self.city[previous] >= 0)
+        self._ip_changes = np.concatenate(([0], np.cumsum(self.ip_change)))
+        self._city_changes = np.concatenate(([0], np.cumsum(self.city_change)))
+
+        # One sorted search key for (user, start second): rows of a user occupy a disjoint key range.
+        seconds = np.where(self.start == np.iinfo(np.int64).min, 0, self.start // 10 ** 9)
+        base = seconds.min() if n else 0
+        span = int(seconds.max() - base + 1) if n else 1
+        self._key = self.user * span + (seconds - base)
+        self._cache: Dict[Any, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self.user)
+
+    # Rolling windows: each session's window covers the same user's sessions that started at most
+    # `window` before it, up to and including the session itself.
+
+    def window_start(self, window: Window) -> np.ndarray:
+        """For each row, the first row of its window."""
+        seconds = window_seconds(window)
+        key = ("start", seconds)
+        if key not in self._cache:
+            lo = np.searchsorted(self._key, self._key - int(np.ceil(seconds)), side="left")
+            self._cache[key] = np.maximum(lo, self.offsets[self.user])  # Never reach into the previous user
+        return self._cache[key]
+
+    def changes_in_window(self, window: Window, field: str = "ip") -> np.ndarray:
+        """Per row: IP (or city, with field="city") changes between consecutive sessions inside its window."""
+        prefix = self._ip_changes if field == "ip" else self._city_changes
+        lo = self.window_start(window)
+        # A change at row j is the hop from j - 1, so only j in (lo, i] lies inside the window
+        return prefix[np.arange(len(self)) + 1] - prefix[lo + 1]
+
+    def distinct_in_window(self, window: Window, field: str = "ip") -> np.ndarray:
+        """Per row: distinct IPs (or cities) among the sessions of its window."""
+        key = ("distinct", field, window_seconds(window))
+        if key in self._cache:
+            return self._cache[key]
+        codes = self.ip if field == "ip" else self.city
+        lo = self.window_start(window)
+        n = len(self)
+        # Row j adds a new value to row i's window when the same value did not occur in [lo_i, j)
+        rows = np.arange(n)
+        order = np.lexsort((rows, codes, self.user))
+        same = np.zeros(n, dtype=bool)
+        same[1:] = (self.user[order][1:] == self.user[order][:-1]) & (codes[order][1:] == codes[order][:-1])
+        previous = np.full(n, -1, dtype=np.int64)
+        previous[order[1:][same[1:]]] = order[:-1][same[1:]]
+        counted = codes >= 0
+        count = (counted & (previous < lo)).astype(np.int64)  # Row i itself, unless its value is already in [lo_i, i)
+        width = int((rows - lo).max()) + 1 if n else 0
+        for k in range(1, width):  # Bounded by the most sessions any one window holds
+            j = rows - k
+            inside = j >= lo
+            if not inside.any():
+                break
+            j = np.maximum(j, 0)
+            count += inside & counted[j] & (previous[j] < lo)
+        self._cache[key] = count
+        return count
+
+    def per_user(self, values: np.ndarray, fill: float = 0) -> np.ndarray:
+        """Per-user maximum of a per-row array (`fill` for users without sessions or values)."""
+        out = np.full(self.n_users, -np.inf)
+        values = np.asarray(values, dtype=np.float64)
+        valid = ~np.isnan(values)
+        np.maximum.at(out, self.user[valid], values[valid])
+        out[np.isneginf(out)] = fill
+        return out
+
+    def user_table(self, window: Window = "30min") -> pd.DataFrame:
+        """Per-user travel and hop maxima, indexed by `user_idx` like `features.user_features`."""
+        label = f"{window}" if isinstance(window, str) else f"{window_seconds(window):g}s"
+        table = pd.DataFrame(index=pd.RangeIndex(self.n_users, name="user_idx"))
+        table["uid"] = self.uids
+        table["max_speed_kmh"] = self.per_user(self.speed_kmh, np.nan)
+        table["max_hop_km"] = self.per_user(self.distance_km, np.nan)
+        table["ip_changes"] = self._ip_changes[self.offsets[1:]] - self._ip_changes[self.offsets[:-1]]
+        table["city_changes"] = self._city_changes[self.offsets[1:]] - self._city_changes[self.offsets[:-1]]
+        table[f"max_ip_changes_{label}"] = self.per_user(self.changes_in_window(window, "ip")).astype(np.int64)
+        table[f"max_distinct_ips_{label}"] = self.per_user(self.distinct_in_window(window, "ip")).astype(np.int64)
+        table[f"max_distinct_cities_{label}"] = self.per_user(self.distinct_in_window(window, "city")).astype(np.int64)
+        return table
+
+    def query(self, window: Window = "30min", ip_changes_over: Optional[int] = None,
+              distinct_ips_over: Optional[int] = None, distinct_cities_over: Optional[int] = None,
+              speed_over_kmh: Optional[float] = None) -> np.ndarray:
+        """
+        `user_idx` of the users meeting every given condition: more than `ip_changes_over` IP changes
+        (or more than `distinct_ips_over` distinct IPs / `distinct_cities_over` cities) inside one
+        `window`, or a hop between consecutive sessions faster than `speed_over_kmh`.
+        """
+        hits = np.ones(self.n_users, dtype=bool)
+        for threshold, values in ((ip_changes_over, lambda: self.changes_in_window(window, "ip")),
+                                  (distinct_ips_over, lambda: self.distinct_in_window(window, "ip")),
+                                  (distinct_cities_over, lambda: self.distinct_in_window(window, "city")),
+                                  (speed_over_kmh, lambda: np.nan_to_num(self.speed_kmh, nan=-np.inf))):
+            if threshold is not None:
+                match = values() > threshold
+                user_hits = np.zeros(self.n_users, dtype=bool)
+                user_hits[self.user[match]] = True
+                hits &= user_hits
+        return np.flatnonzero(hits)
+
+    def hops(self, user_idx: int) -> pd.DataFrame:
+        """One user's sessions in time order with the hop from the previous one."""
+        rows = slice(self.offsets[user_idx], self.offsets[user_idx + 1])
+        return pd.DataFrame({
+            "session_idx": self.session_idx[rows],
+            "start_time": pd.to_datetime(self.start[rows], utc=True),
+            "latitude": self.lat[rows], "longitude": self.lon[rows],
+            "ip_change": self.ip_change[rows], "city_change": self.city_change[rows],
+            "gap_seconds": self.gap_seconds[rows], "distance_km": self.distance_km[rows],
+            "speed_kmh": self.speed_kmh[rows],
+        })
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from log_cache import load_frames
+
+    parser = argparse.ArgumentParser(description="Find users with rapid IP changes or impossible travel.")
+    parser.add_argument("log_file", help="Log file (JSON, JSONL, .gz or .zst)")
+    parser.add_argument("--window", default="30min", help="Rolling window, e.g. 30min, 2h (default 30min)")
+    parser.add_argument("--ip-changes-over", type=int, help="More than this many IP changes in one window")
+    parser.add_argument("--distinct-ips-over", type=int, help="More than this many distinct IPs in one window")
+    parser.add_argument("--distinct-cities-over", type=int, help="More than this many distinct cities in one window")
+    parser.add_argument("--speed-over", type=float, nargs="?", const=IMPOSSIBLE_SPEED_KMH, metavar="KMH",
+                        help=f"A hop faster than this (default {IMPOSSIBLE_SPEED_KMH:g} km/h)")
+    parser.add_argument("--show", type=int, default=20, help="Matching users to print")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    index = GeoIndex(load_frames(args.log_file))
+    built = time.perf_counter() - started
+    started = time.perf_counter()
+    matched = index.query(args.window, args.ip_changes_over, args.distinct_ips_over, args.distinct_cities_over,
+                          args.speed_over)
+    queried = time.perf_counter() - started
+    print(f"{len(index)} sessions of {index.n_users} users loaded and indexed in {built * 1e3:.1f} ms; "
+          f"{len(matched)} users matched in {queried * 1e3:.1f} ms")
+    if len(matched):
+        with pd.option_context("display.width", 200, "display.max_columns", 20):
+            print(index.user_table(args.window).iloc[matched[:args.show]].round(1).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+# incremental.py
+"""
+Incremental policy regeneration: only new sessions are analyzed, and only drifted scenarios are re-sent.
+
+A state directory keeps, per `uid`, a watermark (the `start_time` of the latest session already
+analyzed) and mergeable aggregates of every feature in `features.FEATURE_COLUMNS`: sums and counts,
+maxima, minima plus the last order time and last session end for the gaps that straddle two runs,
+and the distinct IPs/cities/countries/devices seen so far. `linked_accounts` comes from a
+`links.LinkIndex` kept with the state, so rings form across runs and every member's count is
+updated when a new account joins. It also keeps, per fraud scenario, the `scenario_summary` row
+the current policies were generated from, and those policies.
+
+Each run reads a log (a full export or just the latest delta), keeps only sessions that start after
+their user's watermark, computes their features with `features.user_features` and merges them into
+the stored aggregates. The per-scenario summary is then recomputed from the merged state and
+compared with the stored one; only scenarios whose user count, unverified share or any feature
+median/max moved by more than `drift_threshold` (relative) get a new `mapreduce`-style agent call.
+The other scenarios keep their previous policies, and everything is merged into one bundle.
+
+    python incremental.py logs/2025-07-12.json --state .incremental --out policies.rego
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import sys
+import tempfile
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from agent import telemetry
+from compaction import DEFAULT_TOKEN_BUDGET, budgeted_feature_summary
+from features import FEATURE_COLUMNS, NORMAL_SCENARIO, LogFrames, _column, scenario_summary, user_features
+from links import LinkIndex
+from log_cache import load_frames
+from mapreduce import run_scenarios
+from policies import extract_policies, merge_policies
+
+STATE_DIR = os.environ.get("INCREMENTAL_STATE_DIR",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), ".incremental"))
+STATE_VERSION = 2
+DEFAULT_DRIFT = 0.2
+
+PROFILE_COLUMNS = ["fraud_scenario", "risk_score", "account_age_days", "total_orders", "verification_status"]
+SUM_COLUMNS = ["n_sessions", "n_orders", "total_declared_value"]
+MAX_COLUMNS = ["max_orders_per_minute", "max_declared_value"]
+DISTINCT_COLUMNS = {
+    "distinct_ips": "network_info.ip_address",
+    "distinct_cities": "network_info.location.city",
+    "distinct_countries": "network_info.location.country",
+    "distinct_devices": "device_info.device_id",
+}
+TIME_STATE_COLUMNS = ["watermark", "last_order_time", "last_session_end"]
+STATE_COLUMNS = PROFILE_COLUMNS + [c for c in FEATURE_COLUMNS if c not in PROFILE_COLUMNS]
+TEXT_COLUMNS = {"fraud_scenario", "verification_status"}
+
+
+class IncrementalState:
+    """
+    Per-user aggregates (`users`, indexed by uid), distinct session values (`distinct`: uid, feature,
+    value), the shared-identifier `links` and `meta` (per-scenario `baselines` and `policies`),
+    stored under `path`.
+
+    Tables are written under a new generation number and `state.json` is switched to it last, so
+    an interrupted save leaves the previous state intact.
+    """
+
+    def __init__(self, path: str = STATE_DIR):
+        self.path = path
+        self.meta: Dict[str, Any] = {"version": STATE_VERSION, "generation": 0, "baselines": {}, "policies": {}}
+        columns = {c: pd.Series(dtype=object if c in TEXT_COLUMNS else float) for c in STATE_COLUMNS}
+        columns.update({c: pd.Series(dtype="datetime64[ns, UTC]") for c in TIME_STATE_COLUMNS})
+        self.users = pd.DataFrame(columns, index=pd.Index([], name="uid", dtype=object))
+        self.distinct = pd.DataFrame({"uid": pd.Series(dtype=object), "feature": pd.Series(dtype=object),
+                                      "value": pd.Series(dtype=object)})
+        self.links = LinkIndex()
+
+    @classmethod
+    def load(cls, path: str = STATE_DIR) -> "IncrementalState":
+        state = cls(path)
+        try:
+            with open(os.path.join(path, "state.json"), "r") as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return state
+        if meta.get("version") != STATE_VERSION:
+            return state  # Layout changed; start over with a full analysis
+        state.meta = meta
+        generation = meta["generation"]
+        state.users = pd.read_feather(os.path.join(path, f"users-{generation}.feather")).set_index("uid")
+        state.distinct = pd.read_feather(os.path.join(path, f"distinct-{generation}.feather"))
+        state.links = LinkIndex.from_frame(pd.read_feather(os.path.join(path, f"links-{generation}.feather")))
+        return state
+
+    def save(self) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        previous = self.meta["generation"]
+        generation = previous + 1
+        self.users.reset_index().to_feather(os.path.join(self.path, f"users-{generation}.feather"))
+        self.distinct.reset_index(drop=True).to_feather(os.path.join(self.path, f"distinct-{generation}.feather"))
+        self.links.to_frame().to_feather(os.path.join(self.path, f"links-{generation}.feather"))
+        self.meta = {**self.meta, "generation": generation,
+                     "updated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")}
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=self.path)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.meta, f, indent=2, default=str)
+        os.replace(tmp_path, os.path.join(self.path, "state.json"))
+        for name in ("users", "distinct", "links"):
+            try:
+                os.remove(os.path.join(self.path, f"{name}-{previous}.feather"))
+            except FileNotFoundError:
+                pass
+
+    def features(self) -> pd.DataFrame:
+        """The merged state in `user_features` layout."""
+        return self.users.reset_index()[["uid"] + STATE_COLUMNS]
+
+
+def new_activity(frames: LogFrames, watermarks: pd.Series) -> Tuple[LogFrames, int]:
+    """
+    Restricts frames to sessions starting after their user's watermark (every session of a user
+    not in `watermarks`), and to the users that are new or have such sessions. Returns the
+    renumbered frames and how many sessions were skipped as already analyzed.
+    """
+    users, sessions, events = frames
+    uids = _column(users, "uid")
+    seen = uids.isin(watermarks.index).to_numpy()
+    marks = watermarks.reindex(uids).reset_index(drop=True)
+    owner = sessions["user_idx"].to_numpy() if len(sessions) else np.zeros(0, dtype=np.int64)
+    session_marks = marks.iloc[owner].set_axis(sessions.index)
+    start = _column(sessions, "start_time", pd.NaT)
+    # Sessions without a start_time are only taken from users seen for the first time.
+    fresh = (~seen[owner] | (start > session_marks).to_numpy()
+             | (session_marks.isna() & start.notna()).to_numpy())
+
+    active = np.zeros(len(users), dtype=bool)
+    active[~seen] = True
+    active[sessions["user_idx"].to_numpy()[fresh]] = True
+    user_idx = np.flatnonzero(active)
+    user_map = pd.Series(np.arange(len(user_idx)), index=user_idx)
+
+    kept = sessions[fresh]
+    session_map = pd.Series(np.arange(len(kept)), index=kept.index)
+    kept = kept.reset_index(drop=True)
+    kept["user_idx"] = user_map.reindex(kept["user_idx"]).to_numpy()
+    kept_events = events[events["session_idx"].isin(session_map.index)].reset_index(drop=True)
+    kept_events["user_idx"] = user_map.reindex(kept_events["user_idx"]).to_numpy()
+    kept_events["session_idx"] = session_map.reindex(kept_events["session_idx"]).to_numpy()
+    return LogFrames(users.iloc[user_idx].reset_index(drop=True), kept, kept_events), int((~fresh).sum())
+
+
+def _activity_bounds(frames: LogFrames) -> pd.DataFrame:
+    # Per user: first/last session start, end of the last session, first/last order time.
+    users, sessions, events = frames
+    index = pd.RangeIndex(len(users), name="user_idx")
+    bounds = pd.DataFrame(index=index)
+    start = _column(sessions, "start_time", pd.NaT)
+    ordered = sessions.assign(start_time=start).sort_values(["user_idx", "start_time"])
+    by_user = ordered.groupby("user_idx")
+    bounds["first_session_start"] = by_user["start_time"].min().reindex(index)
+    bounds["watermark"] = by_user["start_time"].max().reindex(index)
+    bounds["last_session_end"] = (_column(ordered, "end_time", pd.NaT).groupby(ordered["user_idx"]).last()
+                                  .reindex(index))
+    orders = events[_column(events, "event_type", "") == "order_create"]
+    order_times = _column(orders, "timestamp", pd.NaT).groupby(orders["user_idx"])
+    bounds["first_order_time"] = order_times.min().reindex(index)
+    bounds["last_order_time"] = order_times.max().reindex(index)
+    for column in bounds.columns:
+        bounds[column] = pd.to_datetime(bounds[column], utc=True)
+    return bounds
+
+
+def _distinct_values(frames: LogFrames) -> pd.DataFrame:
+    users, sessions, _ = frames
+    uids = _column(users, "uid").to_numpy()
+    parts = []
+    for feature, column in DISTINCT_COLUMNS.items():
+        values = _column(sessions, column).dropna()
+        parts.append(pd.DataFrame({"uid": uids[sessions.loc[values.index, "user_idx"].to_numpy()],
+                                   "feature": feature, "value": values.astype(str).to_numpy()}))
+    return pd.concat(parts, ignore_index=True)
+
+
+def _fmin(*columns: pd.Series) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        return np.fmin.reduce([np.asarray(c, dtype=float) for c in columns])
+
+
+def merge_activity(state: IncrementalState, frames: LogFrames) -> Dict[str, int]:
+    """Folds new-session frames (from `new_activity`) into `state`; returns new/updated user counts."""
+    delta = user_features(frames)
+    bounds = _activity_bounds(frames)
+    uids = delta["uid"]
+    old = state.users.reindex(uids)
+    merged = pd.DataFrame(index=pd.Index(uids, name="uid"))
+    for column in PROFILE_COLUMNS:
+        merged[column] = delta[column].to_numpy()  # Latest profile wins
+    for column in SUM_COLUMNS:
+        merged[column] = (pd.to_numeric(old[column]).fillna(0).to_numpy() + delta[column].to_numpy())
+    for column in MAX_COLUMNS:
+        merged[column] = np.fmax(pd.to_numeric(old[column]).to_numpy(dtype=float), delta[column].to_numpy(dtype=float))
+
+    # Gaps between the last analyzed order/session and the first new one.
+    order_gap = (bounds["first_order_time"].to_numpy() - old["last_order_time"].to_numpy()) / np.timedelta64(1, "s")
+    session_gap = ((bounds["first_session_start"].to_numpy() - old["last_session_end"].to_numpy())
+                   / np.timedelta64(1, "m"))
+    merged["min_order_gap_seconds"] = _fmin(old["min_order_gap_seconds"], delta["min_order_gap_seconds"], order_gap)
+    merged["min_session_gap_minutes"] = _fmin(old["min_session_gap_minutes"], delta["min_session_gap_minutes"],
+                                              session_gap)
+
+    for column in TIME_STATE_COLUMNS:
+        merged[column] = bounds[column].fillna(old[column].reset_index(drop=True)).to_numpy()
+
+    distinct = pd.concat([state.distinct, _distinct_values(frames)], ignore_index=True).drop_duplicates()
+    touched = distinct[distinct["uid"].isin(uids)]
+    counts = touched.groupby(["uid", "feature"]).size().unstack(fill_value=0)
+    for feature in DISTINCT_COLUMNS:
+        merged[feature] = (counts[feature] if feature in counts.columns else pd.Series(dtype=int)) \
+            .reindex(merged.index, fill_value=0).to_numpy()
+
+    state.links.add_frames(frames)
+    merged["linked_accounts"] = state.links.components(uids)["component_size"].to_numpy()
+
+    new_users = int(old["n_sessions"].isna().sum())
+    state.users = pd.concat([state.users.drop(index=uids, errors="ignore"), merged[state.users.columns]])
+    # Joining a ring changes the count of every member, not only of the users in this delta
+    state.users["linked_accounts"] = state.links.components(state.users.index)["component_size"].to_numpy(dtype=float)
+    state.distinct = distinct.reset_index(drop=True)
+    return {"new_users": new_users, "updated_users": len(uids) - new_users}
+
+
+def drift(current: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> Tuple[float, Optional[str]]:
+    """
+    Largest relative change, |new - old| / max(|new|, |old|), between two `scenario_summary` rows over
+    `n_users`, `unverified_share` and every `*_median`/`*_max`, with the statistic that moved most.
+    A scenario without a baseline has drift 1.
+    """
+    if baseline is None:
+        return 1.0, None
+    worst, worst_stat = 0.0, None
+    for stat, value in current.items():
+        if not (stat in ("n_users", "unverified_share") or stat.endswith(("_median", "_max"))):
+            continue
+        old = baseline.get(stat)
+        if _missing(value) and _missing(old):
+            continue
+        if _missing(value) or _missing(old):
+            change = 1.0
+        else:
+            scale = max(abs(value), abs(old))
+            change = abs(value - old) / scale if scale else 0.0
+        if change > worst:
+            worst, worst_stat = change, stat
+    return worst, worst_stat
+
+
+def _missing(value: Any) -> bool:
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+def _summary_rows(features: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    summary = scenario_summary(features)
+    rows = summary.astype(object).where(summary.notna(), None).to_dict("records")
+    return {row.pop("fraud_scenario"): {k: (float(v) if v is not None else None) for k, v in row.items()}
+            for row in rows}
+
+
+async def refresh(log_file: str, state_dir: str = STATE_DIR, drift_threshold: float = DEFAULT_DRIFT,
+                  contrast_users: int = 20, max_users: int = 200, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                  concurrency: int = 4, rate: float = 0.5, attempts: int = 4, seed: int = 0,
+                  agent_factory: Optional[Callable[..., Any]] = None, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Merges the new sessions of `log_file` into the state, regenerates policies for drifted
+    scenarios and saves the state (unless `dry_run`, which also skips the agent calls).
+
+    Returns the `merge_policies` result over current and reused policies, plus `drift` per
+    scenario, the `regenerated` and `reused` scenarios, agent `errors` and activity counts.
+    """
+    state = IncrementalState.load(state_dir)
+    frames = load_frames(log_file)
+    delta, skipped = new_activity(frames, state.users["watermark"])
+    counts = merge_activity(state, delta)
+    counts.update(new_sessions=len(delta.sessions), skipped_sessions=skipped)
+
+    features = state.features()
+    current = _summary_rows(features)
+    baselines, stored = state.meta["baselines"], state.meta["policies"]
+    report = {scenario: drift(row, baselines.get(scenario)) for scenario, row in current.items()
+              if scenario != NORMAL_SCENARIO}
+    drifted = [s for s, (score, _) in report.items() if score > drift_threshold or s not in stored]
+
+    outputs, errors = {}, {}
+    if drifted and not dry_run:
+        rng = np.random.default_rng(seed)
+        normal = np.flatnonzero(features["fraud_scenario"].to_numpy() == NORMAL_SCENARIO)
+        if len(normal) > contrast_users:
+            normal = np.sort(rng.choice(normal, contrast_users, replace=False))
+        payloads = {}
+        for scenario in drifted:
+            members = np.flatnonzero(features["fraud_scenario"].to_numpy() == scenario)
+            rows = features.iloc[np.concatenate([members, normal])]
+            payloads[scenario] = budgeted_feature_summary(rows, token_budget, max_users, seed)[0]
+        result = await run_scenarios(payloads, concurrency, rate, attempts=attempts, agent_factory=agent_factory)
+        outputs, errors = result["outputs"], result["errors"]
+        for scenario, output in outputs.items():
+            policies = extract_policies(output)
+            if policies:
+                stored[scenario] = policies
+                baselines[scenario] = current[scenario]
+            else:
+                errors[scenario] = "no policies in the agent response"
+
+    merged = merge_policies([p for policies in stored.values() for p in policies])
+    if not dry_run:
+        state.save()
+    return {
+        **merged,
+        "drift": {s: {"score": round(score, 4), "stat": stat} for s, (score, stat) in report.items()},
+        "regenerated": sorted(s for s in outputs if s not in errors),
+        "reused": sorted(s for s in stored if s not in outputs or s in errors),
+        "errors": errors,
+        **counts,
+    }
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Merge new sessions into the saved state and regenerate "
+                                                 "policies only for scenarios that drifted.")
+    parser.add_argument("log_file", help="Log file (JSON, JSONL, .gz or .zst); full export or only new data")
+    parser.add_argument("--state", default=STATE_DIR, help="State directory (watermarks, aggregates, policies)")
+    parser.add_argument("--out", default="policies.rego", help="Where to write the merged Rego bundle")
+    parser.add_argument("--drift", type=float, default=DEFAULT_DRIFT,
+                        help="Relative change of a scenario statistic that triggers a new agent call")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0.5, help="Model calls per second")
+    parser.add_argument("--contrast-users", type=int, default=20, help="normal_behavior users sent with each scenario")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET, help="Max tokens of log_data per call")
+    parser.add_argument("--dry-run", action="store_true", help="Report drift only; no agent calls, state unchanged")
+    args = parser.parse_args(argv)
+
+    result = await refresh(args.log_file, args.state, args.drift, contrast_users=args.contrast_users,
+                           token_budget=args.token_budget, concurrency=args.concurrency, rate=args.rate,
+                           dry_run=args.dry_run)
+    print(f"{result['new_users']} new users, {result['updated_users']} updated, {result['new_sessions']} new sessions "
+          f"({result['skipped_sessions']} already analyzed)")
+    for scenario, info in sorted(result["drift"].items()):
+        action = "regenerated" if scenario in result["regenerated"] else "reused"
+        print(f"  {scenario}: drift {info['score']} ({info['stat'] or 'new scenario'}) -> {action}")
+    for scenario, error in result["errors"].items():
+        print(f"  {scenario}: {error}", file=sys.stderr)
+    if not args.dry_run:
+        with open(args.out, "w") as f:
+            f.write(result["bundle"])
+        print(f"{len(result['policies'])} policies -> {args.out}")
+    if "compile_error" in result:
+        print(f"  merged bundle does not compile locally: {result['compile_error']}", file=sys.stderr)
+    telemetry.print_summary()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    asyncio.run(main())
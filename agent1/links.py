@@ -0,0 +1,302 @@
+# links.py
+"""
+Entity link graph: accounts that share a device, payment instrument, phone number or delivery
+address, clustered into connected components (fraud rings).
+
+`LinkIndex` is an incremental union-find over users. Each identifier (`IDENTIFIER_FIELDS`,
+normalized) remembers the users seen with it; a user arriving with an identifier that is already
+known is unioned with that identifier's first user. Adding a user, a streamed event or a whole
+batch of frames therefore costs one near-constant `find`/`union` per identifier, and every user's
+component (size, members, a stable label) is available after any number of batches without
+comparing users pairwise.
+
+An identifier used by more than `max_identifier_users` accounts (a depot address, a shared test
+card) does not identify a ring and would chain unrelated users together. Once one crosses that
+limit it stops linking, and the components are rebuilt without it on the next read.
+
+    index = LinkIndex()
+    index.add_frames(load_frames("day1.json")); index.add_frames(load_frames("day2.json"))
+    index.size("USER_001"), index.members("USER_001"), index.rings(min_size=3)
+    frames = link_frames(frames)  # users gain `link.component_id` and `link.component_size`
+
+    python links.py sample_logs_v2.json --min-size 2
+"""
+import argparse
+import os
+import re
+import time
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from features import LogFrames, _column
+
+# kind: (frame, column). `payment_method` ("credit_card", ...) names a category, not an instrument.
+IDENTIFIER_FIELDS = {
+    "phone": ("users", "user_profile.phone"),
+    "device": ("sessions", "device_info.device_id"),
+    "payment": ("events", "details.payment_id"),
+    "address": ("events", "details.delivery_address"),
+}
+MAX_IDENTIFIER_USERS = int(os.getenv("LINK_MAX_IDENTIFIER_USERS", "20"))
+
+
+def identifier_key(kind: str, value: Any) -> Optional[str]:
+    """Normalized "kind:value" key, or None for a missing value. Phones keep only their digits,
+    addresses are case- and whitespace-insensitive."""
+    if value is None or value != value or value == "":  # value != value: NaN
+        return None
+    text = str(value)
+    if kind == "phone":
+        text = re.sub(r"\D", "", text)
+    elif kind == "address":
+        text = " ".join(text.casefold().replace(",", " ").split())
+    return f"{kind}:{text}" if text else None
+
+
+def _event_identifiers(event: Mapping) -> Iterator[Optional[str]]:
+    details = event.get("details") or {}
+    yield identifier_key("payment", details.get("payment_id"))
+    yield identifier_key("address", details.get("delivery_address"))
+
+
+def user_identifiers(user: Mapping) -> Iterator[Optional[str]]:
+    """Identifier keys of one nested user object, or of one `stream.py` feed record (a single event
+    with optional `session` and `user_profile`)."""
+    yield identifier_key("phone", (user.get("user_profile") or {}).get("phone"))
+    if "sessions" not in user:  # Feed record
+        yield identifier_key("device", ((user.get("session") or {}).get("device_info") or {}).get("device_id"))
+        yield from _event_identifiers(user)
+        return
+    for session in user.get("sessions") or []:
+        yield identifier_key("device", (session.get("device_info") or {}).get("device_id"))
+        for event in session.get("events") or []:
+            yield from _event_identifiers(event)
+
+
+class LinkIndex:
+    """Users clustered by shared identifiers; see the module docstring."""
+
+    def __init__(self, max_identifier_users: int = MAX_IDENTIFIER_USERS):
+        self.max_identifier_users = max_identifier_users
+        self.uids: List[str] = []  # Node -> uid
+        self._nodes: Dict[str, int] = {}
+        self._parent = array("q")
+        self._size = array("q")  # Users in the component, valid at roots
+        self._first = array("q")  # Earliest node in the component, valid at roots: the component's label
+        # Identifier -> its user node, or list of user nodes once shared (at most max_identifier_users)
+        self._linked: Dict[str, Union[int, List[int]]] = {}
+        self.hubs: Set[str] = set()
+        self._stale = False
+
+    def __len__(self) -> int:
+        return len(self.uids)
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._nodes
+
+    def _node(self, uid: str) -> int:
+        node = self._nodes.get(uid)
+        if node is None:
+            node = self._nodes[uid] = len(self.uids)
+            self.uids.append(uid)
+            self._parent.append(node)
+            self._size.append(1)
+            self._first.append(node)
+        return node
+
+    def _find(self, node: int) -> int:
+        parent = self._parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]  # Path halving
+            node = parent[node]
+        return node
+
+    def _union(self, a: int, b: int) -> None:
+        a, b = self._find(a), self._find(b)
+        if a == b:
+            return
+        if self._size[a] < self._size[b]:
+            a, b = b, a
+        self._parent[b] = a
+        self._size[a] += self._size[b]
+        self._first[a] = min(self._first[a], self._first[b])
+
+    def _link(self, node: int, key: str) -> None:
+        users = self._linked.get(key)
+        if users is None:
+            if key not in self.hubs:
+                self._linked[key] = node
+        elif isinstance(users, int):
+            if users != node:
+                self._linked[key] = [users, node]
+                self._union(node, users)
+        elif node not in users:
+            if len(users) >= self.max_identifier_users:
+                del self._linked[key]
+                self.hubs.add(key)
+                self._stale = True  # Its earlier unions must be undone: rebuild on the next read
+            else:
+                users.append(node)
+                self._union(node, users[0])
+
+    def _rebuild(self) -> None:
+        n = len(self.uids)
+        self._parent = array("q", range(n))
+        self._size = array("q", [1]) * n
+        self._first = array("q", range(n))
+        for users in self._linked.values():
+            if not isinstance(users, int):
+                for node in users[1:]:
+                    self._union(node, users[0])
+        self._stale = False
+
+    def _root(self, uid: str) -> int:
+        if self._stale:
+            self._rebuild()
+        return self._find(self._nodes[uid])
+
+    def add(self, uid: str, identifiers: Iterable[Optional[str]] = ()) -> None:
+        """Adds `uid` (if new) and links it through each identifier key (see `identifier_key`)."""
+        node = self._node(uid)
+        for key in identifiers:
+            if key is not None:
+                self._link(node, key)
+
+    def add_user(self, user: Mapping) -> None:
+        """Adds one nested user object, or one stream record (see `stream.py`)."""
+        self.add(user["uid"], user_identifiers(user))
+
+    def add_frames(self, frames: LogFrames) -> None:
+        """Adds every user of flattened frames, extracting identifiers column by column."""
+        users = frames.users
+        uids = _column(users, "uid").to_numpy()
+        pairs = []
+        for kind, (scope, column) in IDENTIFIER_FIELDS.items():
+            frame = getattr(frames, scope)
+            values = _column(frame, column).dropna()
+            if not len(values):
+                continue
+            user_idx = users.index.get_indexer(values.index) if scope == "users" \
+                else frame.loc[values.index, "user_idx"].to_numpy()
+            unique = values.unique()  # Normalize each distinct value once
+            keys = values.map(dict(zip(unique, (identifier_key(kind, value) for value in unique))))
+            pairs.append(pd.DataFrame({"user_idx": user_idx, "key": keys.to_numpy()}))
+        for uid in uids:
+            self._node(uid)
+        if not pairs:
+            return
+        pairs = pd.concat(pairs, ignore_index=True).dropna().drop_duplicates()
+        for user_idx, key in zip(pairs["user_idx"].to_numpy(), pairs["key"].to_numpy()):
+            self._link(self._nodes[uids[user_idx]], key)
+
+    def component(self, uid: str) -> str:
+        """Label of `uid`'s component: the uid of its earliest-added member."""
+        return self.uids[self._first[self._root(uid)]]
+
+    def size(self, uid: str) -> int:
+        """Accounts in `uid`'s component (1 when it shares nothing), 0 for an unknown uid."""
+        return self._size[self._root(uid)] if uid in self._nodes else 0
+
+    def members(self, uid: str) -> List[str]:
+        root = self._root(uid)
+        return [other for node, other in enumerate(self.uids) if self._find(node) == root]
+
+    def roots(self) -> np.ndarray:
+        """Component root of every node, in node order."""
+        if self._stale:
+            self._rebuild()
+        return np.fromiter((self._find(node) for node in range(len(self.uids))), dtype=np.int64,
+                           count=len(self.uids))
+
+    def components(self, uids: Iterable[str]) -> pd.DataFrame:
+        """`component_id` and `component_size` for each uid (unknown uids get size 0), indexed by uid."""
+        uids = list(uids)
+        roots = self.roots()
+        nodes = np.array([self._nodes.get(uid, -1) for uid in uids], dtype=np.int64)  # -1 picks the appended default
+        labels = np.array(self.uids, dtype=object)[np.array(self._first, dtype=np.int64)[roots]]
+        sizes = np.array(self._size, dtype=np.int64)[roots]
+        return pd.DataFrame({"component_id": np.append(labels, None)[nodes],
+                             "component_size": np.append(sizes, 0)[nodes]}, index=pd.Index(uids, name="uid"))
+
+    def rings(self, min_size: int = 2) -> Dict[str, List[str]]:
+        """Components of at least `min_size` accounts, largest first: label -> member uids."""
+        roots = self.roots()
+        counts = np.bincount(roots, minlength=len(roots)) if len(roots) else roots
+        groups: Dict[int, List[str]] = {}
+        for node in np.flatnonzero(counts[roots] >= min_size):
+            groups.setdefault(int(roots[node]), []).append(self.uids[node])
+        ordered = sorted(groups.items(), key=lambda item: (-len(item[1]), self._first[item[0]]))
+        return {self.uids[self._first[root]]: members for root, members in ordered}
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = np.bincount(self.roots()) if self.uids else np.zeros(0, dtype=np.int64)
+        sizes = sizes[sizes > 0]
+        return {"users": len(self.uids), "identifiers": len(self._linked), "hub_identifiers": len(self.hubs),
+                "components": len(sizes), "linked_components": int((sizes > 1).sum()),
+                "largest_component": int(sizes.max()) if len(sizes) else 0}
+
+    # Persistence: the identifier memberships are the whole state; unions are replayed on load.
+
+    def to_frame(self) -> pd.DataFrame:
+        rows: List[Tuple[Optional[str], Optional[str]]] = [(uid, None) for uid in self.uids]
+        for key, users in self._linked.items():
+            for node in ([users] if isinstance(users, int) else users):
+                rows.append((self.uids[node], key))
+        rows.extend((None, key) for key in self.hubs)
+        return pd.DataFrame(rows, columns=["uid", "key"], dtype=object)
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, max_identifier_users: int = MAX_IDENTIFIER_USERS) -> "LinkIndex":
+        index = cls(max_identifier_users)
+        index.hubs.update(frame.loc[frame["uid"].isna(), "key"])
+        for uid, key in zip(frame["uid"].to_numpy(), frame["key"].to_numpy()):
+            if uid is not None:
+                index.add(uid, () if key is None else (key,))
+        return index
+
+
+def link_frames(frames: LogFrames, index: Optional[LinkIndex] = None) -> LogFrames:
+    """
+    Returns `frames` with `link.component_id` and `link.component_size` on every user, so features
+    and policies (`input.link.component_size`) see each account's ring. Without an `index` the
+    components are those within `frames` alone.
+    """
+    if index is None:
+        index = LinkIndex()
+        index.add_frames(frames)
+    users = frames.users.copy()
+    uids = _column(users, "uid").to_numpy()
+    components = index.components(uids)
+    users["link.component_id"] = components["component_id"].to_numpy()
+    users["link.component_size"] = components["component_size"].to_numpy()
+    return LogFrames(users, frames.sessions, frames.events)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    from log_cache import load_frames
+
+    parser = argparse.ArgumentParser(description="Cluster users that share devices, payments, phones or addresses.")
+    parser.add_argument("log_files", nargs="+", help="Log files (JSON, JSONL, .gz or .zst), added in order")
+    parser.add_argument("--min-size", type=int, default=2, help="Smallest component to list")
+    parser.add_argument("--max-identifier-users", type=int, default=MAX_IDENTIFIER_USERS,
+                        help="Identifiers shared by more accounts than this do not link")
+    parser.add_argument("--show", type=int, default=20, help="Components to print")
+    args = parser.parse_args(argv)
+
+    index = LinkIndex(args.max_identifier_users)
+    started = time.perf_counter()
+    for path in args.log_files:
+        index.add_frames(load_frames(path))
+    rings = index.rings(args.min_size)
+    print(f"{index.stats()} in {(time.perf_counter() - started) * 1e3:.1f} ms")
+    for label, members in list(rings.items())[:args.show]:
+        shown = ", ".join(members[:10]) + (", ..." if len(members) > 10 else "")
+        print(f"{label}: {len(members)} accounts: {shown}")
+
+
+if __name__ == "__main__":
+    main()
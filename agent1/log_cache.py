@@ -0,0 +1,154 @@
+# log_cache.py
+"""
+Columnar on-disk cache of parsed session logs.
+
+The first read of a log file flattens it (into the frames of `features.flatten_users`, built
+through a `records.CompactLog`), tags each user with its shared-identifier component
+(`links.link_frames`) and writes the user, session and event frames as Arrow IPC files under a
+directory named after the file's SHA-256.
+An index keyed by absolute path, size and mtime maps unchanged files straight to their digest,
+so repeat reads neither hash nor parse the log: the Arrow files are memory-mapped and served
+zero-copy.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Dict, List
+
+import pyarrow as pa
+import pandas as pd
+
+from features import LogFrames, nest_rows
+from links import link_frames
+from records import CompactLog
+
+CACHE_DIR = os.environ.get("LOG_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".log_cache"))
+CACHE_VERSION = 2  # Bump when the flattened layout changes so stale entries are ignored
+TABLES = ("users", "sessions", "events")
+_HASH_CHUNK = 1 << 20
+_index_lock = threading.Lock()
+
+
+def file_digest(file_path: str) -> str:
+    """Returns the SHA-256 hex digest of a file, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _index_path(cache_dir: str) -> str:
+    return os.path.join(cache_dir, "index.json")
+
+
+def _load_index(cache_dir: str) -> Dict[str, Any]:
+    try:
+        with open(_index_path(cache_dir), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _atomic_write_json(path: str, data: Any) -> None:
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def cache_key(file_path: str, cache_dir: str = CACHE_DIR) -> str:
+    """
+    Returns the content digest for `file_path`, hashing it only if its size or mtime changed since
+    the last lookup.
+    """
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+    with _index_lock:
+        index = _load_index(cache_dir)
+        entry = index.get(file_path)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return entry["digest"]
+    digest = file_digest(file_path)
+    with _index_lock:
+        os.makedirs(cache_dir, exist_ok=True)
+        index = _load_index(cache_dir)
+        index[file_path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digest": digest}
+        _atomic_write_json(_index_path(cache_dir), index)
+    return digest
+
+
+def _entry_dir(digest: str, cache_dir: str) -> str:
+    return os.path.join(cache_dir, f"v{CACHE_VERSION}", digest)
+
+
+def _to_arrow(frame: pd.DataFrame) -> pa.Table:
+    try:
+        return pa.Table.from_pandas(frame, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # A column mixing types (e.g. numbers and strings in `details.*`) is stored as strings.
+        columns = {}
+        for name in frame.columns:
+            try:
+                columns[name] = pa.array(frame[name], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                columns[name] = pa.array(frame[name].map(lambda v: None if pd.isna(v) else str(v)), type=pa.string())
+        return pa.table(columns)
+
+
+def _write_entry(frames: LogFrames, entry_dir: str) -> None:
+    # Unique per writer: concurrent jobs may be filling the same entry from identical files.
+    tmp_dir = tempfile.mkdtemp(suffix=".tmp", dir=os.path.dirname(entry_dir))
+    for name, frame in zip(TABLES, frames):
+        table = _to_arrow(frame)
+        with pa.OSFile(os.path.join(tmp_dir, f"{name}.arrow"), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    try:
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        # Another process filled the entry first; its copy is identical.
+        for name in os.listdir(tmp_dir):
+            os.remove(os.path.join(tmp_dir, name))
+        os.rmdir(tmp_dir)
+
+
+def _read_entry(entry_dir: str) -> Dict[str, pa.Table]:
+    tables = {}
+    for name in TABLES:
+        source = pa.memory_map(os.path.join(entry_dir, f"{name}.arrow"), "r")
+        tables[name] = pa.ipc.open_file(source).read_all()
+    return tables
+
+
+def load_tables(file_path: str, cache_dir: str = CACHE_DIR) -> Dict[str, pa.Table]:
+    """
+    Returns the users/sessions/events Arrow tables for a log file, building the cache entry on a miss.
+
+    On a hit the tables are memory-mapped views of the cache files; no data is copied or parsed.
+    """
+    entry_dir = _entry_dir(cache_key(file_path, cache_dir), cache_dir)
+    if not os.path.isdir(entry_dir):
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        # Built through the compact log so a large file never exists as one dict per row; users also get
+        # their shared-identifier component within the file (`links.link_frames`)
+        _write_entry(link_frames(CompactLog.from_file(file_path).to_frames()), entry_dir)
+    return _read_entry(entry_dir)
+
+
+def load_frames(file_path: str, cache_dir: str = CACHE_DIR) -> LogFrames:
+    """Like `load_tables`, but converted to the pandas frames used by `features`."""
+    tables = load_tables(file_path, cache_dir)
+    return LogFrames(*(tables[name].to_pandas(split_blocks=True) for name in TABLES))
+
+
+def load_users(file_path: str, cache_dir: str = CACHE_DIR) -> List[Dict[str, Any]]:
+    """
+    Rebuilds the nested user objects of a log file from its cached tables.
+
+    Fields that were absent (or null) in the source are omitted.
+    """
+    tables = load_tables(file_path, cache_dir)
+    return nest_rows(*(tables[name].to_pylist() for name in TABLES))
@@ -1,22 +1,49 @@
 # main.py
 import asyncio
-from google.adk.sessions import InMemorySessionService
 from google.adk.runners import Runner
 from google.genai import types
 import json
 import os
+import sys
+import uuid
 from dotenv import load_dotenv
-from agent import PolicyAnalystAgent
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from agent import PolicyAnalystAgent, build_query, telemetry
+from common.session_store import get_or_create_session, session_service_from_env  # `common` is on sys.path once agent.py is imported
+from backtest import confusion, target_label
+from compaction import DEFAULT_TOKEN_BUDGET, budgeted_summary
+from features import flatten_users
+from log_cache import load_frames
+from policies import PolicyStream
+from policy_engine import PolicySet
 
 load_dotenv() # Load environment variables from .env
 
+STREAMING = RunConfig(streaming_mode=StreamingMode.SSE)
 
-async def main():
+
+def check_policy(policy, frames):
+    """Compiles one streamed policy and, if the logs are labelled, scores it against them."""
+    policy_set = PolicySet([policy])
+    scenario = policy["scenario"]
+    if scenario in policy_set.errors:
+        return f"--- {scenario}: does not compile: {policy_set.errors[scenario]}"
+    if "fraud_scenario" not in frames.users:
+        return f"--- {scenario}: compiles"
+    labels = frames.users["fraud_scenario"].fillna("unknown").astype(str).to_numpy()
+    label, actual = target_label(scenario, labels)
+    result = confusion(policy_set.deny_frame(frames)[scenario].to_numpy(), actual)
+    return (f"--- {scenario}: compiles; vs {label}: precision {result['precision']}, recall {result['recall']} "
+            f"(tp={result['tp']} fp={result['fp']} fn={result['fn']})")
+
+
+async def main(log_file: str = None, token_budget: int = DEFAULT_TOKEN_BUDGET):
     
-    session_service = InMemorySessionService()
+    # Persistent and size-capped; each run gets its own session, so one analysis never carries another's turns
+    session_service = session_service_from_env()
     app_name = "fraud_policy_generator_app_v2"
     user_id = "user_rego_gen"
-    session_id = "policy_gen_session_v2_001"
+    session_id = f"policy_gen_session_v2_{uuid.uuid4().hex}"
     sample_logs_content = {
           "fraud_detection_logs": {
             "analysis_date": "2025-07-11",
@@ -34,8 +61,8 @@ async def main():
           }
         }
 
-    # Create a session
-    await session_service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
+    # Create this run's session
+    await get_or_create_session(session_service, app_name=app_name, user_id=user_id, session_id=session_id)
 
     # Initialize your agent
     policy_agent = PolicyAnalystAgent()
@@ -56,36 +83,62 @@ async def main():
         user_content = types.Content(role='user', parts=[types.Part(text=query_json_string)])
 
         final_response_content = "No final response received."
-        async for event in runner_instance.run_async(user_id=user_id, session_id=session_id, new_message=user_content):
-            if event.is_final_response() and event.content and event.content.parts:
-                final_response_content = event.content.parts[0].text
+        # Policies are picked out of the partial events as each object closes and checked in the
+        # background, so compilation and backtesting overlap with the rest of the generation.
+        policy_stream = PolicyStream()
+        checks = []
+        streamed = False
+        async for event in telemetry.run(runner_instance, user_id=user_id, session_id=session_id,
+                                         new_message=user_content, run_config=STREAMING):
+            text = event.content.parts[0].text if event.content and event.content.parts else None
+            if event.partial:
+                ready = policy_stream.feed(text or "")
+                streamed = True
+            elif event.is_final_response() and text:
+                final_response_content = text
+                ready = [] if streamed else policy_stream.feed(text)  # Cached or non-streamed responses
+            else:
+                ready = []
+            for policy in ready:
+                print(f"--- Policy ready: {policy['scenario']}")
+                checks.append(asyncio.create_task(asyncio.to_thread(check_policy, policy, frames)))
 
         print(f"<<< Agent '{agent_instance.name}' Response: {final_response_content}")
+        for line in await asyncio.gather(*checks):
+            print(line)
+        for rejected in policy_stream.rejected:
+            print(f"--- Skipped {rejected.get('scenario') or 'object'}: {rejected['reason']}")
 
-        current_session = session_service.get_session(app_name=app_name,
+        current_session = await session_service.get_session(app_name=app_name,
                                                     user_id=user_id,
                                                     session_id=session_id)
         stored_output = current_session.state.get(agent_instance.output_key)
 
         print(f"--- Session State ['{agent_instance.output_key}']: ", end="")
-        try:
-            parsed_output = json.loads(stored_output)
-            print(json.dumps(parsed_output, indent=2))
-        except (json.JSONDecodeError, TypeError):
+        if policy_stream.policies:
+            print(json.dumps(policy_stream.policies, indent=2))
+        else:
             print(stored_output)
         print("-" * 30)
 
-    # Construct the query JSON as requested: {"instruction": "...", "log_data": {...}}
-    query_payload = {
-        "instruction": "Please analyze the provided raw log data for distinct fraud patterns (referring to 'fraud_scenario' and associated data) and generate Rego policies in the exact JSON format for each unique fraud scenario. Make sure the Rego policies operate on a single 'user' object as input.",
-        "log_data": sample_logs_content # Directly embed the Python dictionary
-    }
+    if log_file:
+        # Parsed once into the columnar cache; later runs over the same file skip the JSON parse
+        frames, header = load_frames(log_file), {}
+    else:
+        logs = sample_logs_content["fraud_detection_logs"]
+        frames = flatten_users(logs["users"])
+        header = {"analysis_date": logs.get("analysis_date"), "platform": logs.get("platform")}
+    # Stratified sample of per-user rows cut to the token budget, so cost per call does not grow with the log
+    log_data, report = budgeted_summary(frames, token_budget, **header)
+    print(f"log_data: {report['users_kept']}/{report['users_in']} users, {report['tokens_after']} tokens "
+          f"({report['tokens_saved']} saved vs. pretty-printed)")
 
-    # Convert the entire payload to a JSON string before passing to the agent
-    user_message_json_string = json.dumps(query_payload, indent=2)
+    # Construct the query JSON as requested: {"instruction": "...", "log_data": {...}}, compact feature table instead of the raw logs
+    user_message_json_string = build_query(log_data)
 
     await call_agent_and_print(runner, policy_agent, session_id, user_message_json_string)
+    telemetry.print_summary()
 
 if __name__ == "__main__":
     print("Starting Fraud Policy Generation Agent...")
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else None))
\ No newline at end of file
@@ -0,0 +1,125 @@
+# mapreduce.py
+"""
+Map-reduce policy generation: one smaller agent call per `fraud_scenario`, merged into one bundle.
+
+Map: users are grouped by `fraud_scenario`; each fraud scenario gets its own feature summary plus
+a small sample of `normal_behavior` users as contrast, and the per-scenario agent calls run in
+parallel under a shared rate limit. Reduce: the policy JSON blocks from every call are extracted,
+deduplicated and merged into a single `package fraud_detection` module.
+
+    python mapreduce.py sample_logs_v2.json --out policies.rego
+"""
+import argparse
+import asyncio
+import json
+import sys
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+from agent import PolicyAnalystAgent, build_query, telemetry
+from batch import run_agent
+from compaction import DEFAULT_TOKEN_BUDGET, budgeted_summary
+from features import NORMAL_SCENARIO, LogFrames, subset_frames
+from log_cache import load_frames
+from policies import extract_policies, merge_policies
+from common.ratelimit import TokenBucket, retry_async
+
+SCENARIO_INSTRUCTION = (
+    "Please analyze the provided per-user and per-scenario log features and generate Rego policies in the exact "
+    "JSON format for the '{scenario}' fraud scenario only. Rows labelled '" + NORMAL_SCENARIO + "' are legitimate "
+    "users included as contrast: choose thresholds that flag '{scenario}' users but not them. Make sure the Rego "
+    "policies operate on a single 'user' object as input."
+)
+
+
+def shard_by_scenario(frames: LogFrames, contrast_users: int = 20, max_users: int = 200,
+                      seed: int = 0) -> Dict[str, LogFrames]:
+    """
+    Splits frames into one shard per fraud scenario, each with up to `max_users` scenario users
+    and up to `contrast_users` randomly sampled `normal_behavior` users.
+    """
+    rng = np.random.default_rng(seed)
+    scenarios = frames.users["fraud_scenario"].fillna("unknown").to_numpy()
+    normal = np.flatnonzero(scenarios == NORMAL_SCENARIO)
+    if len(normal) > contrast_users:
+        normal = np.sort(rng.choice(normal, contrast_users, replace=False))
+    shards = {}
+    for scenario in sorted(set(scenarios) - {NORMAL_SCENARIO}):
+        members = np.flatnonzero(scenarios == scenario)
+        if len(members) > max_users:
+            members = np.sort(rng.choice(members, max_users, replace=False))
+        shards[scenario] = subset_frames(frames, np.concatenate([members, normal]))
+    return shards
+
+
+async def generate_policies(frames: LogFrames, concurrency: int = 4, rate: float = 0.5, burst: float = 1.0,
+                            attempts: int = 4, agent_factory: Optional[Callable[..., Any]] = None,
+                            token_budget: int = DEFAULT_TOKEN_BUDGET, **shard_options: Any) -> Dict[str, Any]:
+    """
+    Runs one agent call per scenario shard in parallel and merges the results.
+
+    Returns the `merge_policies` result plus the raw `outputs` and any `errors`, keyed by scenario.
+    """
+    shards = shard_by_scenario(frames, **shard_options)
+    payloads = {scenario: budgeted_summary(shard, token_budget)[0] for scenario, shard in shards.items()}
+    return await run_scenarios(payloads, concurrency, rate, burst, attempts, agent_factory)
+
+
+async def run_scenarios(payloads: Dict[str, Dict[str, Any]], concurrency: int = 4, rate: float = 0.5,
+                        burst: float = 1.0, attempts: int = 4,
+                        agent_factory: Optional[Callable[..., Any]] = None) -> Dict[str, Any]:
+    """The map and reduce steps of `generate_policies` for prepared `log_data` payloads keyed by scenario."""
+    bucket = TokenBucket(rate, burst)
+    agent = (agent_factory or PolicyAnalystAgent)(before_model_callback=bucket.before_model)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def map_one(scenario: str, log_data: Dict[str, Any]) -> Optional[str]:
+        query = build_query(log_data, SCENARIO_INSTRUCTION.format(scenario=scenario))
+        async with semaphore:
+            return await retry_async(
+                lambda n: run_agent(agent, query, session_id=f"scenario-{scenario}-{n}"), attempts=attempts
+            )
+
+    results = await asyncio.gather(*(map_one(s, data) for s, data in payloads.items()), return_exceptions=True)
+    outputs, errors, collected = {}, {}, []
+    for scenario, result in zip(payloads, results):
+        if isinstance(result, BaseException):
+            errors[scenario] = f"{type(result).__name__}: {result}"
+            continue
+        outputs[scenario] = result
+        collected.extend(extract_policies(result))
+    merged = merge_policies(collected)
+    merged["outputs"] = outputs
+    merged["errors"] = errors
+    return merged
+
+
+async def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate one merged Rego bundle with one agent call per fraud scenario.")
+    parser.add_argument("log_file", help="Log file (JSON, JSONL, .gz or .zst)")
+    parser.add_argument("--out", default="policies.rego", help="Where to write the merged Rego bundle")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0.5, help="Model calls per second")
+    parser.add_argument("--contrast-users", type=int, default=20, help="normal_behavior users sent with each scenario")
+    parser.add_argument("--token-budget", type=int, default=DEFAULT_TOKEN_BUDGET, help="Max tokens of log_data per call")
+    args = parser.parse_args(argv)
+
+    frames = load_frames(args.log_file)
+    result = await generate_policies(frames, concurrency=args.concurrency, rate=args.rate,
+                                     token_budget=args.token_budget, contrast_users=args.contrast_users)
+    with open(args.out, "w") as f:
+        f.write(result["bundle"])
+    print(f"{len(result['policies'])} policies from {len(result['outputs'])} scenarios -> {args.out}")
+    for scenario, error in result["errors"].items():
+        print(f"  {scenario}: {error}", file=sys.stderr)
+    if "compile_error" in result:
+        print(f"  merged bundle does not compile locally: {result['compile_error']}", file=sys.stderr)
+    print(json.dumps([{k: p[k] for k in ("scenario", "description")} for p in result["policies"]], indent=2))
+    telemetry.print_summary()
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    asyncio.run(main())
@@ -0,0 +1,218 @@
+# policies.py
+"""
+Extraction and merging of the `{"scenario", "description", "rego_policy"}` objects the agents emit.
+"""
+import hashlib
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from policy_engine import RegoError, compile_policy, rename_refs, strip_fence
+
+PACKAGE = "fraud_detection"
+_PACKAGE_LINE = re.compile(r"^\s*package\s+[\w.]+\s*$", re.M)
+_IMPORT_LINE = re.compile(r"^\s*import\s+([\w.]+)(\s+as\s+\w+)?\s*$", re.M)
+_RULE_HEAD = re.compile(r"^(?:default\s+)?([A-Za-z_]\w*)\s*(?=:=|=|\{|\[|\bif\b|\bcontains\b)", re.M)
+_SET_RULES = {"deny"}
+
+
+class _ObjectScanner:
+    """
+    Finds balanced {...} spans in text that arrives in pieces, skipping braces inside JSON strings.
+    `feed` returns `(depth, span)` for every object closed by the new text, innermost first; depth
+    0 is a top-level object. Text before the outermost open object is dropped as it is passed.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.starts: List[int] = []  # Buffer offsets of the open objects, outermost first
+        self.in_string = self.escaped = False
+
+    def feed(self, text: str) -> List[Tuple[int, str]]:
+        closed = []
+        offset = len(self.buffer)
+        self.buffer += text
+        for i in range(offset, len(self.buffer)):
+            ch = self.buffer[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"' and self.starts:
+                self.in_string = True
+            elif ch == "{":
+                self.starts.append(i)
+            elif ch == "}" and self.starts:
+                start = self.starts.pop()
+                closed.append((len(self.starts), self.buffer[start:i + 1]))
+        # Keep only what an open object still needs.
+        cut = self.starts[0] if self.starts else len(self.buffer)
+        if cut:
+            self.buffer = self.buffer[cut:]
+            self.starts = [start - cut for start in self.starts]
+        return closed
+
+
+def _json_objects(text: str) -> Iterator[str]:
+    # Yields each balanced top-level {...} span.
+    for depth, span in _ObjectScanner().feed(text):
+        if depth == 0:
+            yield span
+
+
+def is_policy(obj: Any) -> bool:
+    return isinstance(obj, dict) and isinstance(obj.get("scenario"), str) and isinstance(obj.get("rego_policy"), str)
+
+
+def extract_policies(text: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Returns every policy object found in an agent response, whether it is a single JSON object,
+    a JSON list, or several JSON blocks (fenced or not) mixed with prose.
+    """
+    if not text:
+        return []
+    policies = []
+    for candidate in _json_objects(text):
+        try:
+            obj = json.loads(candidate)
+        except json.JSONDecodeError:
+            continue
+        if is_policy(obj):
+            policies.append(obj)
+        elif isinstance(obj, dict):
+            # Wrappers such as {"policies": [...]}
+            policies.extend(p for value in obj.values() if isinstance(value, list) for p in value if is_policy(p))
+    return policies
+
+
+class PolicyStream:
+    """
+    Incremental `extract_policies` for a response that is still being generated.
+
+    `feed` takes each new piece of text (e.g. the partial events of a streaming run) and returns
+    the policy objects that closed in it, at any nesting depth, so each one can be compiled or
+    backtested while the model is still writing the rest. Returned policies have the ```rego
+    fence stripped and a `description` (possibly empty); repeats of an earlier Rego body are
+    dropped, and objects that are not usable policies are kept in `rejected` with why.
+
+        stream = PolicyStream()
+        async for event in runner.run_async(..., run_config=RunConfig(streaming_mode=StreamingMode.SSE)):
+            if event.partial and event.content:
+                for policy in stream.feed(event.content.parts[0].text or ""):
+                    ...
+    """
+
+    def __init__(self):
+        self.policies: List[Dict[str, Any]] = []
+        self.rejected: List[Dict[str, Any]] = []
+        self._scanner = _ObjectScanner()
+        self._seen = set()
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        ready = []
+        for _, span in self._scanner.feed(text):
+            if '"rego_policy"' not in span:
+                continue  # Only objects that mention the field can be (or contain) a policy
+            try:
+                obj = json.loads(span)
+            except json.JSONDecodeError as e:
+                self.rejected.append({"text": span[:200], "reason": f"invalid JSON: {e}"})
+                continue
+            if not isinstance(obj, dict) or "rego_policy" not in obj:
+                continue  # A wrapper whose policies were already seen as they closed
+            policy = self._validate(obj)
+            if policy is not None:
+                self.policies.append(policy)
+                ready.append(policy)
+        return ready
+
+    def _validate(self, obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        scenario = obj.get("scenario")
+        if not is_policy(obj) or not scenario.strip():
+            self.rejected.append({"scenario": scenario, "reason": "needs string scenario and rego_policy"})
+            return None
+        rego = strip_fence(obj["rego_policy"]).strip()
+        if not re.search(r"^\s*deny\b", rego, re.M):
+            self.rejected.append({"scenario": scenario, "reason": "rego_policy has no deny rule"})
+            return None
+        key = _body_key(rego)
+        if key in self._seen:
+            return None
+        self._seen.add(key)
+        return {**obj, "description": obj.get("description") or "", "rego_policy": rego + "\n"}
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or "policy"
+
+
+def _normalized_rego(rego: str) -> str:
+    body = _PACKAGE_LINE.sub("", _IMPORT_LINE.sub("", strip_fence(rego)))
+    return "\n".join(line.rstrip() for line in body.strip().splitlines())
+
+
+def _body_key(rego_policy: str) -> str:
+    return hashlib.sha256(re.sub(r"\s+", " ", _normalized_rego(rego_policy)).encode()).hexdigest()
+
+
+def dedupe_policies(policies: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Drops policies whose Rego body (ignoring package/imports/whitespace) repeats. Policies that only
+    share a scenario name are kept; `merge_policies` renames their clashing rules apart.
+    """
+    seen, unique = set(), []
+    for policy in policies:
+        key = _body_key(policy["rego_policy"])
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(policy)
+    return unique
+
+
+def merge_policies(policies: List[Dict[str, Any]], package: str = PACKAGE) -> Dict[str, Any]:
+    """
+    Merges policy objects into one Rego module under `package`.
+
+    `deny` rules from every policy are unioned; helper rules that more than one policy defines
+    are renamed with a per-scenario suffix (numbered when a scenario name repeats) so they do not
+    clash (only references to the rule; field paths such as `input.user_profile.<name>` and string
+    literals are left alone). Returns the deduplicated policies, the merged `bundle` text and, if
+    the bundle does not compile locally, the `compile_error`.
+    """
+    policies = dedupe_policies(policies)
+    bodies = [(p, _normalized_rego(p["rego_policy"])) for p in policies]
+
+    owners: Dict[str, int] = {}
+    for _, body in bodies:
+        for name in set(_RULE_HEAD.findall(body)) - _SET_RULES:
+            owners[name] = owners.get(name, 0) + 1
+
+    imports = set()
+    for policy, _ in bodies:
+        imports.update(m.group(0).strip() for m in _IMPORT_LINE.finditer(strip_fence(policy["rego_policy"])))
+
+    sections = [f"package {package}"]
+    if imports:
+        sections.append("\n".join(sorted(imports)))
+    suffixes: Dict[str, int] = {}
+    for policy, body in bodies:
+        suffix = _slug(policy["scenario"])
+        suffixes[suffix] = suffixes.get(suffix, 0) + 1
+        if suffixes[suffix] > 1:
+            suffix = f"{suffix}_{suffixes[suffix]}"
+        clashing = {name: f"{name}_{suffix}" for name in set(_RULE_HEAD.findall(body)) - _SET_RULES if owners[name] > 1}
+        if clashing:
+            body = rename_refs(body, clashing)
+        sections.append(f"# --- {policy['scenario']} ---\n{body}")
+    bundle = "\n\n".join(sections) + "\n"
+
+    result = {"policies": policies, "bundle": bundle}
+    try:
+        compile_policy(bundle)
+    except RegoError as e:
+        result["compile_error"] = str(e)
+    return result
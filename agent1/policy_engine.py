@@ -0,0 +1,1466 @@
+# policy_engine.py
+"""
+In-process evaluator for the subset of Rego that PolicyAnalystAgent generates.
+
+Each policy is parsed and compiled once into Python closures. A single `deny` lookup on one user
+object runs in microseconds, and `deny_mask` scores a whole batch of users at once: rules made of
+comparisons on `input.*`, `some ... in input.sessions` / `session.events` iteration and `count(...)`
+comprehensions (also when wrapped in single-definition helper rules) are evaluated as vectorized
+column operations over `features.LogFrames`; anything else falls back to the per-user interpreter.
+`sweep_targets`/`sweep_inputs` expose the numeric thresholds of vectorizable policies so every
+value of one threshold can be scored in one pass (see `backtest`).
+
+`input.link` (the user's shared-identifier component, see `links`) is derived across users, so a
+policy that reads it gets it added by `deny_mask`/`PolicySet.deny_frame` (`with_links`) when the
+frames do not already carry it; callers of `deny` on single users (e.g. `stream`) supply it.
+
+Supported Rego: `package`/`import` (ignored), `default` values, partial set rules
+(`deny[msg] { ... }`, `deny contains msg if { ... }`), complete and boolean helper rules,
+`some`/`not`, `:=`/`=`, comparisons, `in`, arithmetic, array/set/object literals and
+comprehensions, and the builtins listed in `BUILTINS`. User-defined functions, `every`, `with`,
+`else` and `data.*` references raise `RegoError`.
+"""
+import copy
+import functools
+import json
+import math
+import re
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from features import LogFrames, unflatten_users
+from links import link_frames
+
+
+class RegoError(Exception):
+    """Raised for Rego text outside the supported subset, or that fails to parse."""
+
+
+_UNDEFINED = object()
+_LINK_REF = re.compile(r'\binput\s*(?:\.\s*link\b|\[\s*"link"\s*\])')
+_FENCE = re.compile(r"```(?:rego)?\s*\n?(.*?)```", re.S)
+
+
+def strip_fence(rego_policy: str) -> str:
+    """Returns the Rego source from a `rego_policy` field, unwrapping a ```rego fenced block if present."""
+    match = _FENCE.search(rego_policy)
+    return match.group(1) if match else rego_policy
+
+
+# --- Tokenizer ---
+
+_TOKEN = re.compile(r"""
+    (?P<ws>[ \t\r]+) | (?P<comment>\#[^\n]*) | (?P<nl>\n)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<string>"(?:[^"\\\n]|\\.)*") | (?P<raw>`[^`]*`)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>:=|==|!=|<=|>=|[<>=+\-*/%|&()\[\]{},;.:])
+""", re.X)
+
+
+def _tokenize(text: str) -> List[Tuple[str, Any]]:
+    tokens = []
+    depth = 0  # Newlines inside (...) and [...] do not terminate statements
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match:
+            raise RegoError(f"Unexpected character {text[pos]!r} at offset {pos}")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group()
+        if kind in ("ws", "comment"):
+            continue
+        if kind == "nl":
+            if depth == 0 and tokens and tokens[-1][0] != "nl":
+                tokens.append(("nl", "\n"))
+            continue
+        if kind == "number":
+            tokens.append(("const", float(value) if any(c in value for c in ".eE") else int(value)))
+        elif kind == "string":
+            tokens.append(("const", json.loads(value)))
+        elif kind == "raw":
+            tokens.append(("const", value[1:-1]))
+        elif kind == "ident" and value in ("true", "false", "null"):
+            tokens.append(("const", {"true": True, "false": False, "null": None}[value]))
+        else:
+            if value in "([":
+                depth += 1
+            elif value in ")]":
+                depth = max(depth - 1, 0)
+            tokens.append((kind, value))
+    tokens.append(("eof", None))
+    return tokens
+
+
+def rename_refs(text: str, names: Dict[str, str]) -> str:
+    """
+    Returns `text` with every variable or rule reference in `names` replaced by its new name.
+
+    Only identifier tokens are rewritten, so strings, comments and field segments (`input.x.name`)
+    keep the old name. Unknown characters are copied through for `compile_policy` to report.
+    """
+    out = []
+    pos = 0
+    after_dot = False
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match:
+            out.append(text[pos])
+            pos += 1
+            after_dot = False
+            continue
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "ident" and not after_dot and value in names:
+            value = names[value]
+        out.append(value)
+        if kind not in ("ws", "comment", "nl"):
+            after_dot = value == "."
+    return "".join(out)
+
+
+# --- Parser ---
+# Expressions: ("const", v) ("var", name) ("ref", base, [segments]) ("call", name, [args])
+#   ("array", [items]) ("set", [items]) ("object", [(k, v)]) ("arraycomp", head, body)
+#   ("setcomp", head, body) ("binop", op, left, right) ("neg", expr)
+# Statements: ("expr", e) ("assign", name, e) ("unify", l, r) ("some", [names])
+#   ("some_in", key_name, value_name, coll) ("not", stmt)
+
+_COMPARISONS = ("==", "!=", "<", "<=", ">", ">=")
+_UNSUPPORTED = ("every", "with", "else")
+
+
+class _Parser:
+    def __init__(self, text: str):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+
+    def peek(self, offset: int = 0) -> Tuple[str, Any]:
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)]
+
+    def next(self) -> Tuple[str, Any]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def at(self, value: str) -> bool:
+        kind, tok = self.peek()
+        return kind in ("op", "ident") and tok == value
+
+    def accept(self, value: str) -> bool:
+        if self.at(value):
+            self.pos += 1
+            return True
+        return False
+
+    def expect(self, value: str) -> None:
+        if not self.accept(value):
+            raise RegoError(f"Expected {value!r}, found {self.peek()[1]!r}")
+
+    def ident(self) -> str:
+        kind, value = self.next()
+        if kind != "ident":
+            raise RegoError(f"Expected identifier, found {value!r}")
+        if value in _UNSUPPORTED:
+            raise RegoError(f"'{value}' is not supported")
+        return value
+
+    def skip_newlines(self) -> None:
+        while self.peek()[0] == "nl":
+            self.pos += 1
+
+    # Module level
+
+    def module(self) -> Tuple[str, List[dict]]:
+        package = ""
+        rules = []
+        while True:
+            self.skip_newlines()
+            if self.peek()[0] == "eof":
+                return package, rules
+            if self.accept("package"):
+                package = self.dotted_name()
+            elif self.accept("import"):
+                self.dotted_name()
+                if self.accept("as"):
+                    self.ident()
+            else:
+                rules.append(self.rule())
+
+    def dotted_name(self) -> str:
+        parts = [self.next()[1]]
+        while self.accept("."):
+            parts.append(self.next()[1])
+        return ".".join(parts)
+
+    def rule(self) -> dict:
+        if self.accept("default"):
+            name = self.ident()
+            if not (self.accept(":=") or self.accept("=")):
+                raise RegoError(f"Expected value for default rule {name}")
+            return {"name": name, "default": self.expr()}
+        name = self.ident()
+        if self.at("("):
+            raise RegoError(f"User-defined functions are not supported ({name})")
+        if self.at("."):
+            raise RegoError(f"Dotted rule heads are not supported ({name})")
+        rule = {"name": name, "key": None, "value": None, "body": []}
+        if self.accept("["):
+            rule["key"] = self.expr()
+            self.expect("]")
+        elif self.accept("contains"):
+            rule["key"] = self.expr()
+        if self.accept(":=") or self.accept("="):
+            rule["value"] = self.expr()
+        if self.accept("if"):
+            rule["body"] = self.block() if self.at("{") else [self.statement()]
+        elif self.at("{"):
+            rule["body"] = self.block()
+        if self.at("else"):
+            raise RegoError("'else' is not supported")
+        return rule
+
+    def block(self) -> List[tuple]:
+        self.expect("{")
+        return self.statements("}")
+
+    def statements(self, end: str) -> List[tuple]:
+        body = []
+        while True:
+            while self.peek()[0] == "nl" or self.at(";"):
+                self.pos += 1
+            if self.accept(end):
+                return body
+            body.append(self.statement())
+
+    def statement(self) -> tuple:
+        if self.accept("not"):
+            return ("not", self.statement())
+        if self.accept("some"):
+            names = [self.ident()]
+            while self.accept(","):
+                names.append(self.ident())
+            if self.accept("in"):
+                if len(names) > 2:
+                    raise RegoError("'some' binds at most a key and a value")
+                key, value = (None, names[0]) if len(names) == 1 else names
+                return ("some_in", key, value, self.expr())
+            return ("some", names)
+        left = self.expr()
+        if self.accept(":="):
+            if left[0] != "var":
+                raise RegoError("Only plain variables can be assigned with ':='")
+            return ("assign", left[1], self.expr())
+        if self.accept("="):
+            return ("unify", left, self.expr())
+        return ("expr", left)
+
+    # Expressions, lowest precedence first
+
+    def expr(self) -> tuple:
+        left = self.arith()
+        while True:
+            kind, value = self.peek()
+            if kind == "op" and value in _COMPARISONS:
+                self.pos += 1
+                left = ("binop", value, left, self.arith())
+            elif self.at("in"):
+                self.pos += 1
+                left = ("binop", "in", left, self.arith())
+            else:
+                return left
+
+    def arith(self) -> tuple:
+        left = self.term()
+        while self.peek()[0] == "op" and self.peek()[1] in ("+", "-"):
+            op = self.next()[1]
+            left = ("binop", op, left, self.term())
+        return left
+
+    def term(self) -> tuple:
+        left = self.unary()
+        while self.peek()[0] == "op" and self.peek()[1] in ("*", "/", "%"):
+            op = self.next()[1]
+            left = ("binop", op, left, self.unary())
+        return left
+
+    def unary(self) -> tuple:
+        if self.accept("-"):
+            return ("neg", self.unary())
+        return self.postfix(self.primary())
+
+    def postfix(self, node: tuple) -> tuple:
+        segments = []
+        while True:
+            if self.at(".") and self.peek(1)[0] == "ident":
+                self.pos += 1
+                segments.append(("const", self.next()[1]))
+            elif self.at("["):
+                self.pos += 1
+                segments.append(self.expr())
+                self.expect("]")
+            else:
+                break
+        return ("ref", node, segments) if segments else node
+
+    def primary(self) -> tuple:
+        kind, value = self.peek()
+        if kind == "const":
+            self.pos += 1
+            return ("const", value)
+        if self.accept("("):
+            node = self.expr()
+            self.expect(")")
+            return node
+        if self.accept("["):
+            return self.collection("]", "array")
+        if self.accept("{"):
+            return self.collection("}", "set")
+        name = self.ident()
+        # Dotted builtin calls such as time.parse_rfc3339_ns(...)
+        probe = 0
+        dotted = [name]
+        while self.peek(probe) == ("op", ".") and self.peek(probe + 1)[0] == "ident":
+            dotted.append(self.peek(probe + 1)[1])
+            probe += 2
+        if self.peek(probe) == ("op", "("):
+            self.pos += probe + 1
+            args = []
+            self.skip_newlines()
+            while not self.accept(")"):
+                args.append(self.expr())
+                self.skip_newlines()
+                self.accept(",")
+                self.skip_newlines()
+            return ("call", ".".join(dotted), args)
+        return ("var", name)
+
+    def collection(self, end: str, kind: str) -> tuple:
+        self.skip_newlines()
+        if self.accept(end):
+            return ("object", []) if kind == "set" else ("array", [])
+        first = self.expr()
+        self.skip_newlines()
+        if self.accept("|"):
+            return ("arraycomp" if kind == "array" else "setcomp", first, self.statements(end))
+        if kind == "set" and self.accept(":"):
+            items = [(first, self.expr())]
+            self.skip_newlines()
+            while self.accept(","):
+                self.skip_newlines()
+                if self.at(end):
+                    break
+                key = self.expr()
+                self.expect(":")
+                items.append((key, self.expr()))
+                self.skip_newlines()
+            self.expect(end)
+            return ("object", items)
+        items = [first]
+        while self.accept(","):
+            self.skip_newlines()
+            if self.at(end):
+                break
+            items.append(self.expr())
+            self.skip_newlines()
+        self.expect(end)
+        return (kind, items)
+
+
+# --- Values and builtins ---
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(_freeze(v) for v in value)
+    return value
+
+
+def _make_set(items: Sequence[Any]) -> frozenset:
+    try:
+        return frozenset(items)
+    except TypeError:
+        return frozenset(_freeze(v) for v in items)
+
+
+def _children(value: Any) -> Iterator[Tuple[Any, Any]]:
+    if isinstance(value, dict):
+        return iter(value.items())
+    if isinstance(value, list):
+        return enumerate(value)
+    if isinstance(value, frozenset):
+        return ((v, v) for v in value)
+    return iter(())
+
+
+def _lookup(value: Any, key: Any) -> Any:
+    if isinstance(value, dict):
+        return value.get(key, _UNDEFINED) if not isinstance(key, (list, dict)) else _UNDEFINED
+    if isinstance(value, list):
+        if isinstance(key, int) and not isinstance(key, bool) and 0 <= key < len(value):
+            return value[key]
+        return _UNDEFINED
+    if isinstance(value, frozenset):
+        try:
+            return key if key in value else _UNDEFINED
+        except TypeError:
+            return _UNDEFINED
+    return _UNDEFINED
+
+
+def _eq(a: Any, b: Any) -> bool:
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    return a == b
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _member(elem: Any, coll: Any) -> bool:
+    if isinstance(coll, dict):
+        return any(_eq(elem, v) for v in coll.values())
+    if isinstance(coll, (list, frozenset)):
+        return any(_eq(elem, v) for v in coll)
+    return False
+
+
+def _arith(op: str, a: Any, b: Any) -> Any:
+    if op == "-" and isinstance(a, frozenset) and isinstance(b, frozenset):
+        return a - b
+    if not (_is_number(a) and _is_number(b)):
+        return _UNDEFINED
+    if op == "+":
+        return a + b
+    if op == "-":
+        return a - b
+    if op == "*":
+        return a * b
+    if b == 0:
+        return _UNDEFINED
+    if op == "/":
+        result = a / b
+        return int(result) if result.is_integer() else result
+    return a % b
+
+
+_BINOPS: Dict[str, Callable[[Any, Any], Any]] = {
+    "==": _eq,
+    "!=": lambda a, b: not _eq(a, b),
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "in": _member,
+}
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool) or value is None:
+        return json.dumps(value)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, frozenset):
+        return json.dumps(sorted(value, key=repr), default=str)
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=str)
+    return str(value)
+
+
+_VERB = re.compile(r"%(\.\d+)?([vdsfqx%])")
+
+
+def _sprintf(fmt: str, args: list) -> str:
+    args = iter(args)
+
+    def verb(match):
+        precision, kind = match.groups()
+        if kind == "%":
+            return "%"
+        value = next(args, "%!MISSING")
+        if kind == "d" and _is_number(value):
+            return str(int(value))
+        if kind == "f" and _is_number(value):
+            return f"{value:{precision or '.6'}f}"
+        if kind == "q":
+            return json.dumps(_format_value(value))
+        if kind == "x" and isinstance(value, int):
+            return format(value, "x")
+        return _format_value(value)
+
+    return _VERB.sub(verb, fmt)
+
+
+def _parse_rfc3339_ns(value: str) -> int:
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return int(parsed.timestamp()) * 1_000_000_000 + parsed.microsecond * 1000
+
+
+def _numbers(coll: Any) -> list:
+    values = list(coll.values()) if isinstance(coll, dict) else list(coll)
+    if not all(_is_number(v) for v in values):
+        raise TypeError("non-numeric collection")
+    return values
+
+
+BUILTINS: Dict[str, Callable[..., Any]] = {
+    "count": lambda coll: len(coll) if isinstance(coll, (list, dict, frozenset, str)) else _UNDEFINED,
+    "sum": lambda coll: sum(_numbers(coll)),
+    "max": lambda coll: max(_numbers(coll)) if coll else _UNDEFINED,
+    "min": lambda coll: min(_numbers(coll)) if coll else _UNDEFINED,
+    "abs": abs,
+    "round": lambda x: int(math.floor(x + 0.5)),
+    "floor": math.floor,
+    "ceil": math.ceil,
+    "to_number": lambda x: float(x) if "." in str(x) else int(x),
+    "sprintf": _sprintf,
+    "concat": lambda sep, coll: sep.join(sorted(coll) if isinstance(coll, frozenset) else coll),
+    "lower": str.lower,
+    "upper": str.upper,
+    "contains": lambda s, sub: sub in s,
+    "startswith": lambda s, prefix: s.startswith(prefix),
+    "endswith": lambda s, suffix: s.endswith(suffix),
+    "split": lambda s, sep: s.split(sep),
+    "trim_space": str.strip,
+    "array.concat": lambda a, b: a + b,
+    "object.get": lambda obj, key, default: obj.get(key, default) if isinstance(obj, dict) else default,
+    "is_number": _is_number,
+    "is_string": lambda x: isinstance(x, str),
+    "time.now_ns": lambda: time.time_ns(),
+    "time.parse_rfc3339_ns": _parse_rfc3339_ns,
+}
+
+
+# --- Compiler: AST -> closures ---
+# Expressions compile to f(ctx, env) -> Iterator[(value, env)]; statements to f(ctx, env) -> Iterator[env].
+# Each yielded env is a solution; an expression that yields nothing is undefined.
+
+Env = Dict[str, Any]
+ExprFn = Callable[["_Context", Env], Iterator[Tuple[Any, Env]]]
+StmtFn = Callable[["_Context", Env], Iterator[Env]]
+
+
+class _Context:
+    __slots__ = ("input", "rules", "memo")
+
+    def __init__(self, input_doc: Any, rules: Dict[str, "_Rule"]):
+        self.input = input_doc
+        self.rules = rules
+        self.memo: Dict[str, Any] = {}
+
+    def value(self, name: str) -> Any:
+        if name not in self.memo:
+            self.memo[name] = _UNDEFINED  # Guards against recursive rules
+            self.memo[name] = self.rules[name].evaluate(self)
+        return self.memo[name]
+
+
+class _Compiler:
+    def __init__(self, rule_names: set):
+        self.rule_names = rule_names
+
+    def expr(self, node: tuple) -> ExprFn:
+        kind = node[0]
+        if kind == "const":
+            value = node[1]
+
+            def const(ctx, env):
+                yield value, env
+            return const
+        if kind == "var":
+            return self.var(node[1])
+        if kind == "ref":
+            return self.ref(node[1], node[2])
+        if kind == "call":
+            return self.call(node[1], node[2])
+        if kind in ("array", "set"):
+            return self.collection(kind, [self.expr(item) for item in node[1]])
+        if kind == "object":
+            return self.object([(self.expr(k), self.expr(v)) for k, v in node[1]])
+        if kind in ("arraycomp", "setcomp"):
+            return self.comprehension(kind, self.expr(node[1]), self.body(node[2]))
+        if kind == "binop":
+            return self.binop(node[1], self.expr(node[2]), self.expr(node[3]))
+        if kind == "neg":
+            inner = self.expr(node[1])
+
+            def neg(ctx, env):
+                for value, env1 in inner(ctx, env):
+                    if _is_number(value):
+                        yield -value, env1
+            return neg
+        raise RegoError(f"Unsupported expression {kind}")
+
+    def var(self, name: str) -> ExprFn:
+        if name == "input":
+            def input_(ctx, env):
+                yield ctx.input, env
+            return input_
+        if name == "data":
+            raise RegoError("'data' references are not supported")
+        if name in self.rule_names:
+            def rule(ctx, env):
+                value = ctx.value(name)
+                if value is not _UNDEFINED:
+                    yield value, env
+            return rule
+
+        def var(ctx, env):
+            value = env.get(name, _UNDEFINED)
+            if value is not _UNDEFINED:
+                yield value, env
+        return var
+
+    def ref(self, base: tuple, segments: List[tuple]) -> ExprFn:
+        base_fn = self.expr(base)
+        steps = []
+        for segment in segments:
+            if segment[0] == "const":
+                steps.append(("key", segment[1]))
+            elif segment[0] == "var" and segment[1] not in self.rule_names and segment[1] != "input":
+                steps.append(("var", segment[1]))  # Iterates when unbound
+            else:
+                steps.append(("expr", self.expr(segment)))
+        n = len(steps)
+
+        def walk(ctx, value, env, i):
+            if i == n:
+                yield value, env
+                return
+            kind, arg = steps[i]
+            if kind == "key":
+                child = _lookup(value, arg)
+                if child is not _UNDEFINED:
+                    yield from walk(ctx, child, env, i + 1)
+            elif kind == "var":
+                bound = env.get(arg, _UNDEFINED) if arg != "_" else _UNDEFINED
+                if bound is not _UNDEFINED:
+                    child = _lookup(value, bound)
+                    if child is not _UNDEFINED:
+                        yield from walk(ctx, child, env, i + 1)
+                else:
+                    for key, child in _children(value):
+                        yield from walk(ctx, child, env if arg == "_" else {**env, arg: key}, i + 1)
+            else:
+                for key, env1 in arg(ctx, env):
+                    child = _lookup(value, key)
+                    if child is not _UNDEFINED:
+                        yield from walk(ctx, child, env1, i + 1)
+
+        def ref(ctx, env):
+            for value, env1 in base_fn(ctx, env):
+                yield from walk(ctx, value, env1, 0)
+        return ref
+
+    def _product(self, fns: List[ExprFn]) -> Callable[["_Context", Env], Iterator[Tuple[list, Env]]]:
+        def product(ctx, env, i=0, acc=()):
+            if i == len(fns):
+                yield list(acc), env
+                return
+            for value, env1 in fns[i](ctx, env):
+                yield from product(ctx, env1, i + 1, acc + (value,))
+        return product
+
+    def call(self, name: str, args: List[tuple]) -> ExprFn:
+        if name not in BUILTINS:
+            raise RegoError(f"Unsupported builtin {name}()")
+        fn = BUILTINS[name]
+        product = self._product([self.expr(arg) for arg in args])
+
+        def call(ctx, env):
+            for values, env1 in product(ctx, env):
+                try:
+                    result = fn(*values)
+                except (TypeError, ValueError, AttributeError, StopIteration):
+                    continue
+                if result is not _UNDEFINED:
+                    yield result, env1
+        return call
+
+    def collection(self, kind: str, fns: List[ExprFn]) -> ExprFn:
+        product = self._product(fns)
+
+        def collection(ctx, env):
+            for values, env1 in product(ctx, env):
+                yield (values if kind == "array" else _make_set(values)), env1
+        return collection
+
+    def object(self, pairs: List[Tuple[ExprFn, ExprFn]]) -> ExprFn:
+        product = self._product([fn for pair in pairs for fn in pair])
+
+        def object_(ctx, env):
+            for values, env1 in product(ctx, env):
+                yield dict(zip(values[::2], values[1::2])), env1
+        return object_
+
+    def comprehension(self, kind: str, head: ExprFn, body: StmtFn) -> ExprFn:
+        def comprehension(ctx, env):
+            values = [value for env1 in body(ctx, env) for value, _ in head(ctx, env1)]
+            yield (values if kind == "arraycomp" else _make_set(values)), env
+        return comprehension
+
+    def binop(self, op: str, left: ExprFn, right: ExprFn) -> ExprFn:
+        fn = _BINOPS.get(op)
+
+        def binop(ctx, env):
+            for a, env1 in left(ctx, env):
+                for b, env2 in right(ctx, env1):
+                    try:
+                        result = fn(a, b) if fn else _arith(op, a, b)
+                    except TypeError:
+                        continue  # Rego compares mismatched types as undefined here
+                    if result is not _UNDEFINED:
+                        yield result, env2
+        return binop
+
+    def statement(self, node: tuple) -> StmtFn:
+        kind = node[0]
+        if kind == "expr":
+            fn = self.expr(node[1])
+
+            def expr(ctx, env):
+                for value, env1 in fn(ctx, env):
+                    if value is not False:
+                        yield env1
+            return expr
+        if kind == "assign":
+            return self.bind(node[1], self.expr(node[2]))
+        if kind == "unify":
+            left, right = node[1], node[2]
+            if left[0] == "var" and left[1] not in self.rule_names:
+                return self.bind(left[1], self.expr(right))
+            if right[0] == "var" and right[1] not in self.rule_names:
+                return self.bind(right[1], self.expr(left))
+            return self.statement(("expr", ("binop", "==", left, right)))
+        if kind == "some":
+            names = node[1]
+
+            def some(ctx, env):
+                yield {k: v for k, v in env.items() if k not in names}
+            return some
+        if kind == "some_in":
+            return self.some_in(node[1], node[2], self.expr(node[3]))
+        if kind == "not":
+            inner = self.statement(node[1])
+
+            def not_(ctx, env):
+                for _ in inner(ctx, env):
+                    return
+                yield env
+            return not_
+        raise RegoError(f"Unsupported statement {kind}")
+
+    def bind(self, name: str, fn: ExprFn) -> StmtFn:
+        def bind(ctx, env):
+            bound = env.get(name, _UNDEFINED)
+            for value, env1 in fn(ctx, env):
+                if bound is _UNDEFINED:
+                    yield env1 if name == "_" else {**env1, name: value}
+                elif _eq(bound, value):
+                    yield env1
+        return bind
+
+    def some_in(self, key: Optional[str], value: str, coll: ExprFn) -> StmtFn:
+        def some_in(ctx, env):
+            for collection, env1 in coll(ctx, env):
+                for k, v in _children(collection):
+                    env2 = env1
+                    if key is not None and key != "_":
+                        env2 = {**env2, key: k}
+                    if value != "_":
+                        env2 = {**env2, value: v}
+                    yield env2
+        return some_in
+
+    def body(self, statements: List[tuple]) -> StmtFn:
+        fns = [self.statement(s) for s in statements]
+        n = len(fns)
+
+        def run(ctx, env, i=0):
+            if i == n:
+                yield env
+                return
+            for env1 in fns[i](ctx, env):
+                yield from run(ctx, env1, i + 1)
+        return run
+
+
+class _Rule:
+    """All definitions of one rule name, merged (sets union, complete rules take the first value)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.is_set = False
+        self.definitions: List[Tuple[Optional[ExprFn], Optional[ExprFn], StmtFn]] = []
+        self.default: Any = _UNDEFINED
+
+    def evaluate(self, ctx: _Context) -> Any:
+        if self.is_set:
+            values = []
+            for key, _, body in self.definitions:
+                for env in body(ctx, {}):
+                    values.extend(value for value, _ in key(ctx, env))
+            return _make_set(values)
+        for _, value, body in self.definitions:
+            for env in body(ctx, {}):
+                if value is None:
+                    return True
+                for result, _ in value(ctx, env):
+                    return result
+        return self.default
+
+
+class CompiledPolicy:
+    """
+    A Rego module compiled once for repeated evaluation.
+
+    `deny(user)` evaluates one user object; `deny_mask(frames)` scores a batch of flattened users.
+    """
+
+    def __init__(self, source: str):
+        self.source = strip_fence(source)
+        self.package, definitions = _Parser(self.source).module()
+        names = {d["name"] for d in definitions}
+        compiler = _Compiler(names)
+        self.rules: Dict[str, _Rule] = {}
+        self._deny_bodies: List[Tuple[Optional[tuple], List[tuple]]] = []
+        for definition in definitions:
+            rule = self.rules.setdefault(definition["name"], _Rule(definition["name"]))
+            if "default" in definition:
+                for value, _ in compiler.expr(definition["default"])(None, {}):
+                    rule.default = value
+                continue
+            if definition["key"] is not None:
+                rule.is_set = True
+            key = compiler.expr(definition["key"]) if definition["key"] is not None else None
+            value = compiler.expr(definition["value"]) if definition["value"] is not None else None
+            rule.definitions.append((key, value, compiler.body(definition["body"])))
+            if definition["name"] == "deny":
+                self._deny_bodies.append((definition["key"], definition["body"]))
+        if "deny" not in self.rules:
+            raise RegoError("Policy does not define a 'deny' rule")
+        self._helpers = _helpers(definitions)
+        self._vector_plans = None
+        self.uses_links = bool(_LINK_REF.search(self.source))
+
+    def evaluate(self, input_doc: Dict[str, Any], rule: str = "deny") -> Any:
+        """Returns the value of `rule` for `input_doc` (a frozenset for partial set rules), or None if undefined."""
+        value = _Context(input_doc, self.rules).value(rule)
+        return None if value is _UNDEFINED else value
+
+    def deny(self, user: Dict[str, Any]) -> List[str]:
+        """Returns the sorted `deny` messages for a single user object (empty if allowed)."""
+        value = _Context(user, self.rules).value("deny")
+        if isinstance(value, frozenset):
+            return sorted((_format_value(v) for v in value))
+        return [] if value in (_UNDEFINED, False, None) else [_format_value(value)]
+
+    def deny_mask(self, frames: LogFrames, users: Optional[List[Dict[str, Any]]] = None) -> np.ndarray:
+        """
+        Returns a boolean array with one entry per user in `frames`, True where `deny` is non-empty.
+
+        Vectorizable `deny` bodies are evaluated as column operations; the rest fall back to `deny`
+        per user, using `users` when given or objects rebuilt from `frames` otherwise.
+        """
+        if self.uses_links:
+            frames, users = with_links(frames, users)
+        plans = self._plans()
+        mask = np.zeros(len(frames.users), dtype=bool)
+        needs_fallback = any(plan is None for plan in plans)
+        for plan in plans:
+            if plan is None:
+                continue
+            try:
+                mask |= plan.evaluate(frames)
+            except _NotVectorizable:
+                needs_fallback = True
+        if not needs_fallback:
+            return mask
+        # deny() covers every body, so only users not already denied need the interpreter.
+        pending = np.flatnonzero(~mask)
+        if users is None:
+            pending_users = unflatten_users(frames, pending)
+        else:
+            pending_users = [users[i] for i in pending]
+        for idx, user in zip(pending, pending_users):
+            mask[idx] = bool(self.deny(user))
+        return mask
+
+    def _plans(self) -> List[Optional["_Plan"]]:
+        if self._vector_plans is None:
+            self._vector_plans = [_plan(key, body, self._helpers) for key, body in self._deny_bodies]
+        return self._vector_plans
+
+    def sweep_targets(self) -> List["SweepTarget"]:
+        """
+        The numeric `<`, `<=`, `>`, `>=` comparisons (including `count(...)` ones) whose threshold
+        can be swept; empty unless every `deny` body is vectorizable.
+        """
+        plans = self._plans()
+        if any(plan is None for plan in plans):
+            return []
+        return [SweepTarget(i, path, name, op, constant)
+                for i, plan in enumerate(plans) for path, name, op, constant in _targets(plan)]
+
+    def sweep_inputs(self, frames: LogFrames, target: "SweepTarget") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns per-user arrays (base, rest, statistic) such that, with the threshold of `target`
+        set to `t`, `deny` holds exactly where `base | (rest & (statistic <op> t))`.
+        """
+        if self.uses_links:
+            frames, _ = with_links(frames)
+        plans = self._plans()
+        base = np.zeros(len(frames.users), dtype=bool)
+        for i, plan in enumerate(plans):
+            if i != target.body:
+                base |= plan.evaluate(frames)
+        try:
+            rest, statistic = _statistic(plans[target.body], list(target.path), frames)
+        except _NotVectorizable as e:
+            raise RegoError(f"Cannot sweep {target.name}: {e}")
+        return base, rest, statistic
+
+
+def with_links(frames: LogFrames, users: Optional[List[Dict[str, Any]]] = None
+               ) -> Tuple[LogFrames, Optional[List[Dict[str, Any]]]]:
+    """
+    Returns `frames` with the `link.*` user columns (components within `frames`, unless already
+    present) and `users` with the matching `link` object, so batch and per-user evaluation agree.
+    """
+    if "link.component_size" not in frames.users.columns:
+        frames = link_frames(frames)
+    if users is not None:
+        ids = frames.users["link.component_id"].tolist()
+        sizes = frames.users["link.component_size"].tolist()
+        users = [user if "link" in user else {**user, "link": {"component_id": cid, "component_size": int(size)}}
+                 for user, cid, size in zip(users, ids, sizes)]
+    return frames, users
+
+
+@functools.lru_cache(maxsize=256)
+def compile_policy(rego_policy: str) -> CompiledPolicy:
+    """Compiles (and caches) a Rego policy, accepting either bare Rego or a ```rego fenced block."""
+    return CompiledPolicy(rego_policy)
+
+
+# --- Vectorized planner ---
+# A deny body is vectorizable when every statement is a comparison of one column with a constant,
+# scoped to the user (input.*), one session variable or one event variable of that session,
+# a count() of a comprehension over such rows, or the assignment of the rule's message.
+
+class _NotVectorizable(Exception):
+    pass
+
+
+_FLIP = {"==": "==", "!=": "!=", "<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+
+def _path(node: tuple) -> Optional[Tuple[str, List[str]]]:
+    """Splits a ref like `session.network_info.ip_address` into ("session", ["network_info", "ip_address"])."""
+    if node[0] == "var":
+        return node[1], []
+    if node[0] != "ref" or node[1][0] != "var":
+        return None
+    keys = []
+    for segment in node[2]:
+        if segment[0] != "const" or not isinstance(segment[1], str):
+            return None
+        keys.append(segment[1])
+    return node[1][1], keys
+
+
+def _compare(series: pd.Series, op: str, constant: Any) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        raise _NotVectorizable("timestamp column")
+    if op == "in":
+        return series.isin(list(constant)).to_numpy()
+    if op in ("==", "!="):
+        if isinstance(constant, bool) or constant is None:
+            raise _NotVectorizable("bool/null comparison")
+        equal = (series == constant).to_numpy(dtype=bool)
+        return equal if op == "==" else ~equal & series.notna().to_numpy()
+    if _is_number(constant) and pd.api.types.is_numeric_dtype(series):
+        values = series.to_numpy(dtype=float)
+    elif isinstance(constant, str) and series.dropna().map(type).eq(str).all():
+        values = series.to_numpy(dtype=object)
+        present = series.notna().to_numpy()
+        result = np.zeros(len(series), dtype=bool)
+        result[present] = _BINOPS[op](values[present].astype(str), constant)
+        return result
+    else:
+        raise _NotVectorizable("mixed-type ordering")
+    with np.errstate(invalid="ignore"):
+        return _BINOPS[op](values, constant)
+
+
+class _Scopes:
+    """Tracks which body variables are bound to sessions and events."""
+
+    def __init__(self):
+        self.session: Optional[str] = None
+        self.event: Optional[str] = None
+
+    def bind(self, var: str, coll: tuple) -> None:
+        path = _path(coll)
+        if path == ("input", ["sessions"]) and self.session is None:
+            self.session = var
+        elif path is not None and path[0] == self.session and path[1] == ["events"] and self.event is None:
+            self.event = var
+        else:
+            raise _NotVectorizable(f"unsupported iteration for {var}")
+
+    def column(self, node: tuple) -> Tuple[str, str]:
+        path = _path(node)
+        if path is None:
+            raise _NotVectorizable("not a column reference")
+        root, keys = path
+        if root == "input" and keys and keys[0] not in ("sessions",):
+            return "users", ".".join(keys)
+        if root == self.session and keys and keys[0] != "events":
+            return "sessions", ".".join(keys)
+        if root == self.event and keys:
+            return "events", ".".join(keys)
+        raise _NotVectorizable(f"unsupported reference {root}.{'.'.join(keys)}")
+
+
+def _iter_source(node: tuple) -> Optional[Tuple[str, tuple]]:
+    """Recognizes `v := input.sessions[_]` style bindings, returning (var, collection ref)."""
+    if node[0] in ("assign", "unify") and node[2][0] == "ref":
+        name = node[1] if node[0] == "assign" else (node[1][1] if node[1][0] == "var" else None)
+        ref = node[2]
+        # Any index variable is accepted: other uses of it are not column references and fail to plan.
+        if name and ref[2] and ref[2][-1][0] == "var":
+            return name, ("ref", ref[1], ref[2][:-1]) if len(ref[2]) > 1 else ref[1]
+    return None
+
+
+class _Condition:
+    def __init__(self, scope: str, column: str, op: str, constant: Any, negate: bool = False):
+        self.scope, self.column, self.op, self.constant, self.negate = scope, column, op, constant, negate
+
+    def mask(self, frames: LogFrames) -> np.ndarray:
+        frame = getattr(frames, self.scope)
+        if self.column in frame.columns:
+            result = _compare(frame[self.column], self.op, self.constant)
+        else:
+            result = np.zeros(len(frame), dtype=bool)  # Undefined path: comparison fails
+        return ~result if self.negate else result
+
+
+class _Count:
+    """
+    `count(<comprehension or collection>) <op> <constant>` aggregated per user. `head` is the
+    (scope, column) of a comprehension head that is a field rather than the row itself: rows where
+    it is undefined add nothing, and with `distinct` (set comprehensions) equal values count once.
+    """
+
+    def __init__(self, plan: "_Plan", head: Optional[Tuple[str, str]], distinct: bool, op: str, constant: Any):
+        self.plan, self.head, self.distinct, self.op, self.constant = plan, head, distinct, op, constant
+
+    def head_values(self, frames: LogFrames, frame: pd.DataFrame, scope: str) -> Optional[pd.Series]:
+        """The head column aligned to the rows of `frame` (a `scope` frame), or None if it never occurs."""
+        head_scope, column = self.head
+        owner = getattr(frames, head_scope)
+        if column not in owner.columns:
+            return None
+        if head_scope == scope:
+            return owner[column]
+        # A session or user field repeated on each of its event/session rows
+        return pd.Series(owner[column].to_numpy()[frame[f"{head_scope[:-1]}_idx"].to_numpy()], index=frame.index)
+
+    def counts(self, frames: LogFrames) -> np.ndarray:
+        rows = self.plan.row_mask(frames)
+        scope = self.plan.row_scope()
+        frame = getattr(frames, scope)
+        n_users = len(frames.users)
+        if scope == "users" and self.head is None:
+            return rows.astype(int)
+        user_idx = frame["user_idx"].to_numpy() if scope != "users" else np.arange(n_users)
+        if self.head is not None:
+            values = self.head_values(frames, frame, scope)
+            if values is None:
+                return np.zeros(n_users, dtype=int)
+            rows = rows & values.notna().to_numpy()
+            if self.distinct:
+                selected = pd.DataFrame({"user_idx": user_idx[rows], "value": values.to_numpy()[rows]})
+                return selected.groupby("user_idx")["value"].nunique().reindex(range(n_users), fill_value=0).to_numpy()
+        return np.bincount(user_idx[rows], minlength=n_users)
+
+    def mask(self, frames: LogFrames) -> np.ndarray:
+        with np.errstate(invalid="ignore"):
+            return _BINOPS[self.op](self.counts(frames), self.constant)
+
+
+class _Plan:
+    def __init__(self):
+        self.scopes = _Scopes()
+        self.conditions: List[_Condition] = []
+        self.user_masks: List[Any] = []  # _Count / nested existential plans, evaluated per user
+        self.aliases: Dict[str, tuple] = {}  # `ip := s.network_info.ip_address`: var -> ref, for comprehension heads
+
+    def row_scope(self) -> str:
+        if self.scopes.event:
+            return "events"
+        return "sessions" if self.scopes.session else "users"
+
+    def row_mask(self, frames: LogFrames) -> np.ndarray:
+        scope = self.row_scope()
+        frame = getattr(frames, scope)
+        mask = np.ones(len(frame), dtype=bool)
+        for condition in self.conditions:
+            cond = condition.mask(frames)
+            if condition.scope == scope:
+                mask &= cond
+            elif condition.scope == "sessions":
+                mask &= cond[frame["session_idx"].to_numpy()]
+            elif condition.scope == "users" and scope != "users":
+                mask &= cond[frame["user_idx"].to_numpy()]
+            else:
+                mask &= cond
+        if scope == "users":
+            for user_mask in self.user_masks:
+                mask &= user_mask.mask(frames)
+        return mask
+
+    def evaluate(self, frames: LogFrames) -> np.ndarray:
+        rows = self.row_mask(frames)
+        scope = self.row_scope()
+        if scope == "users":
+            return rows
+        n_users = len(frames.users)
+        users = np.bincount(getattr(frames, scope)["user_idx"].to_numpy()[rows], minlength=n_users) > 0
+        for user_mask in self.user_masks:
+            users &= user_mask.mask(frames)
+        return users
+
+    mask = evaluate
+
+
+def _wildcard_ref(node: tuple) -> Optional[Tuple[List[str], List[str], List[str]]]:
+    """Splits `input.sessions[_].events[_].x` into its session/event hops and the trailing field path."""
+    if node[0] != "ref" or node[1] != ("var", "input"):
+        return None
+    segments = node[2]
+    if len(segments) >= 3 and segments[0] == ("const", "sessions") and segments[1] == ("var", "_"):
+        rest = segments[2:]
+        if len(rest) >= 3 and rest[0] == ("const", "events") and rest[1] == ("var", "_"):
+            fields = rest[2:]
+            scope = "events"
+        else:
+            fields = rest
+            scope = "sessions"
+        if fields and all(s[0] == "const" and isinstance(s[1], str) for s in fields):
+            return scope, [s[1] for s in fields]
+    return None
+
+
+def _const(node: tuple) -> Any:
+    if node[0] == "const":
+        return node[1]
+    if node[0] == "neg" and node[1][0] == "const" and _is_number(node[1][1]):
+        return -node[1][1]
+    if node[0] in ("array", "set") and all(item[0] == "const" for item in node[1]):
+        return [item[1] for item in node[1]]
+    return _UNDEFINED
+
+
+def _helpers(definitions: List[dict]) -> Dict[str, tuple]:
+    """
+    Helper rules the planner can inline: single-definition complete rules with a value and no body
+    (`n_orders := count([...])`) map to ("value", expr); boolean rules with a body and no value
+    (`is_new { ... }`) map to ("body", statements).
+    """
+    counts: Dict[str, int] = {}
+    for definition in definitions:
+        counts[definition["name"]] = counts.get(definition["name"], 0) + 1
+    helpers = {}
+    for definition in definitions:
+        name = definition["name"]
+        if name == "deny" or counts[name] > 1 or "default" in definition or definition["key"] is not None:
+            continue
+        if definition["value"] is not None and not definition["body"]:
+            helpers[name] = ("value", definition["value"])
+        elif definition["value"] is None and definition["body"]:
+            helpers[name] = ("body", definition["body"])
+    return helpers
+
+
+def _inline(node: tuple, helpers: Dict[str, tuple]) -> tuple:
+    """Replaces a reference to a value helper rule with the helper's expression."""
+    for _ in range(len(helpers)):
+        if node[0] != "var" or helpers.get(node[1], ("",))[0] != "value":
+            break
+        node = helpers[node[1]][1]
+    return node
+
+
+def _plan_comparison(plan: _Plan, op: str, left: tuple, right: tuple, negate: bool,
+                     helpers: Optional[Dict[str, tuple]] = None) -> None:
+    helpers = helpers or {}
+    left, right = _inline(left, helpers), _inline(right, helpers)
+    if op == "in":
+        constant = _const(right)
+        if not isinstance(constant, list):
+            raise _NotVectorizable("membership in a non-literal collection")
+        column_node = left
+    else:
+        constant = _const(right)
+        column_node = left
+        if constant is _UNDEFINED:
+            constant = _const(left)
+            column_node = right
+            op = _FLIP.get(op, op)
+        if constant is _UNDEFINED or op not in _FLIP:
+            raise _NotVectorizable("comparison without a constant side")
+
+    if column_node[0] == "call" and column_node[1] == "count" and len(column_node[2]) == 1:
+        if negate:
+            raise _NotVectorizable("negated count")
+        plan.user_masks.append(_plan_count(column_node[2][0], op, constant, helpers))
+        return
+
+    wildcard = _wildcard_ref(column_node)
+    if wildcard is not None:
+        # Each `input.sessions[_]...` reference is its own existential over the user's rows.
+        if negate:
+            raise _NotVectorizable("negated wildcard reference")
+        scope, fields = wildcard
+        sub = _Plan()
+        sub.scopes.session = "\0s"
+        if scope == "events":
+            sub.scopes.event = "\0e"
+        sub.conditions.append(_Condition(scope, ".".join(fields), op, constant))
+        plan.user_masks.append(sub)
+        return
+
+    scope, column = plan.scopes.column(column_node)
+    if negate and scope != "users":
+        raise _NotVectorizable("negation inside an iteration")
+    plan.conditions.append(_Condition(scope, column, op, constant, negate))
+
+
+def _plan_count(arg: tuple, op: str, constant: Any, helpers: Optional[Dict[str, tuple]] = None) -> _Count:
+    if not _is_number(constant):
+        raise _NotVectorizable("count compared with a non-number")
+    path = _path(arg)
+    if path == ("input", ["sessions"]):
+        sub = _Plan()
+        sub.scopes.session = "\0s"
+        return _Count(sub, None, False, op, constant)
+    if arg[0] not in ("arraycomp", "setcomp"):
+        raise _NotVectorizable("count of an unsupported collection")
+    sub = _plan_statements(arg[2], message=None, helpers=helpers)
+    if sub.user_masks and sub.row_scope() != "users":
+        raise _NotVectorizable("nested existential inside a comprehension")
+    head = arg[1]
+    head_column = None
+    head_path = _path(head)
+    if head_path is None:
+        raise _NotVectorizable("comprehension head")
+    root, keys = head_path
+    bound = {v for v in (sub.scopes.session, sub.scopes.event) if v}
+    if root not in bound:
+        if root in sub.aliases and not keys:
+            head = sub.aliases[root]
+            root, keys = _path(head)
+        else:
+            raise _NotVectorizable("comprehension head is not an iterated row")
+    if keys:
+        head_column = sub.scopes.column(head)
+    elif root != (sub.scopes.event or sub.scopes.session):
+        raise _NotVectorizable("comprehension head is not the innermost row")
+    return _Count(sub, head_column, arg[0] == "setcomp" and head_column is not None, op, constant)
+
+
+def _plan_statements(statements: List[tuple], message: Optional[str],
+                     helpers: Optional[Dict[str, tuple]] = None) -> _Plan:
+    helpers = helpers or {}
+    plan = _Plan()
+    for statement in statements:
+        kind = statement[0]
+        if kind == "some":
+            continue
+        if kind == "some_in":
+            plan.scopes.bind(statement[2], statement[3])
+            continue
+        source = _iter_source(statement)
+        if source is not None:
+            plan.scopes.bind(*source)
+            continue
+        if kind == "assign" and statement[1] == message:
+            continue
+        if kind == "assign" and _path(statement[2]) is not None:
+            # `ip := s.network_info.ip_address`: only usable as a comprehension head
+            plan.aliases[statement[1]] = statement[2]
+            plan.scopes.column(statement[2])
+            continue
+        negate = kind == "not"
+        if negate:
+            statement = statement[1]
+            kind = statement[0]
+        if kind == "expr" and statement[1][0] == "var" and statement[1][1] in helpers:
+            helper_kind, helper = helpers[statement[1][1]]
+            if helper_kind == "value":
+                statement = ("expr", _inline(statement[1], helpers))
+            elif negate:
+                raise _NotVectorizable("negated helper rule")
+            else:
+                # A boolean helper holds when its body has any binding: an existential of its own.
+                sub = _plan_statements(helper, message=None, helpers=helpers)
+                if sub.aliases:
+                    raise _NotVectorizable("aliases in a helper rule")
+                plan.user_masks.append(sub)
+                continue
+        if kind == "expr" and statement[1][0] == "binop" and statement[1][1] in _BINOPS:
+            _plan_comparison(plan, statement[1][1], statement[1][2], statement[1][3], negate, helpers)
+            continue
+        raise _NotVectorizable(f"unsupported statement {kind}")
+    return plan
+
+
+def _plan(key: Optional[tuple], body: List[tuple], helpers: Optional[Dict[str, tuple]] = None) -> Optional[_Plan]:
+    # Assignments to the rule's message variable (`deny[msg]`) only shape the message, not the decision.
+    message = key[1] if key is not None and key[0] == "var" else None
+    try:
+        plan = _plan_statements(body, message, helpers)
+    except _NotVectorizable:
+        return None
+    if plan.aliases:
+        return None  # Aliases only make sense inside comprehensions
+    return plan
+
+
+# --- Threshold sweeps ---
+# With every other condition of a body fixed, "some row r with value_r > t" holds iff the largest
+# value among the rows passing the other conditions is > t (smallest for < and <=), and a count
+# comparison only moves with its per-user count. Either way one per-user statistic decides the
+# body for every threshold t.
+
+class SweepTarget(NamedTuple):
+    body: int  # Index of the `deny` body
+    path: tuple  # Plan nodes from the body down to the comparison
+    name: str  # e.g. "input.user_profile.account_age_days" or "count(input.sessions[_].events[_])"
+    op: str
+    constant: Any
+
+
+_SWEEP_OPS = ("<", "<=", ">", ">=")
+_SCOPE_PREFIX = {"users": "input.", "sessions": "input.sessions[_].", "events": "input.sessions[_].events[_]."}
+
+
+def _targets(plan: _Plan) -> Iterator[Tuple[tuple, str, str, Any]]:
+    for condition in plan.conditions:
+        if condition.op in _SWEEP_OPS and _is_number(condition.constant) and not condition.negate:
+            yield (condition,), _SCOPE_PREFIX[condition.scope] + condition.column, condition.op, condition.constant
+    for user_mask in plan.user_masks:
+        if isinstance(user_mask, _Count):
+            if user_mask.op in _SWEEP_OPS:
+                scope = user_mask.plan.row_scope()
+                rows = _SCOPE_PREFIX[scope].rstrip(".")
+                if user_mask.head is not None:
+                    head = _SCOPE_PREFIX[user_mask.head[0]] + user_mask.head[1]
+                    name = f"count(distinct {head})" if user_mask.distinct else f"count({head})"
+                else:
+                    name = f"count({rows})"
+                yield (user_mask,), name, user_mask.op, user_mask.constant
+        else:
+            for path, name, op, constant in _targets(user_mask):
+                yield (user_mask,) + path, name, op, constant
+
+
+def _without(plan: _Plan, node: Any) -> _Plan:
+    other = copy.copy(plan)
+    other.conditions = [c for c in plan.conditions if c is not node]
+    other.user_masks = [m for m in plan.user_masks if m is not node]
+    return other
+
+
+def _to_rows(frames: LogFrames, scope: str, rows_scope: str, values: np.ndarray) -> np.ndarray:
+    if scope == rows_scope:
+        return values
+    key = "session_idx" if scope == "sessions" else "user_idx"
+    return values[getattr(frames, rows_scope)[key].to_numpy()]
+
+
+def _statistic(plan: _Plan, path: List[Any], frames: LogFrames) -> Tuple[np.ndarray, np.ndarray]:
+    node = path[0]
+    if len(path) > 1:  # A nested existential (wildcard reference or boolean helper)
+        rest, statistic = _statistic(node, path[1:], frames)
+        return rest & _without(plan, node).evaluate(frames), statistic
+    if isinstance(node, _Count):
+        return _without(plan, node).evaluate(frames), node.counts(frames).astype(float)
+
+    n_users = len(frames.users)
+    frame = getattr(frames, node.scope)
+    if node.column not in frame.columns:
+        values = np.full(len(frame), np.nan)
+    elif pd.api.types.is_numeric_dtype(frame[node.column]):
+        values = frame[node.column].to_numpy(dtype=float)
+    else:
+        raise _NotVectorizable(f"{node.column} is not numeric")
+    scope = plan.row_scope()
+    other = _without(plan, node)
+    rows = other.row_mask(frames)  # For user-scoped bodies this already includes the user masks
+    values = _to_rows(frames, node.scope, scope, values)
+    upper = node.op in (">", ">=")
+    eligible = rows & ~np.isnan(values)
+    if scope == "users":
+        statistic = np.where(eligible, values, -np.inf if upper else np.inf)
+        return np.ones(n_users, dtype=bool), statistic
+    statistic = np.full(n_users, -np.inf if upper else np.inf)
+    owners = getattr(frames, scope)["user_idx"].to_numpy()[eligible]
+    (np.maximum if upper else np.minimum).at(statistic, owners, values[eligible])
+    rest = np.ones(n_users, dtype=bool)
+    for user_mask in plan.user_masks:
+        rest &= user_mask.mask(frames)
+    return rest, statistic
+
+
+class PolicySet:
+    """
+    Compiles the agent's `{"scenario", "description", "rego_policy"}` objects and scores them together.
+    """
+
+    def __init__(self, policies: List[Dict[str, Any]]):
+        self.policies = policies
+        self.compiled: Dict[str, CompiledPolicy] = {}
+        self.errors: Dict[str, str] = {}
+        for policy in policies:
+            scenario = policy.get("scenario", f"policy_{len(self.compiled) + len(self.errors)}")
+            try:
+                self.compiled[scenario] = compile_policy(policy.get("rego_policy", ""))
+            except RegoError as e:
+                self.errors[scenario] = str(e)
+        self.uses_links = any(policy.uses_links for policy in self.compiled.values())  # Some policy reads input.link
+
+    def deny(self, user: Dict[str, Any]) -> Dict[str, List[str]]:
+        """Returns `{scenario: messages}` for every policy that denies this user."""
+        result = {}
+        for scenario, policy in self.compiled.items():
+            messages = policy.deny(user)
+            if messages:
+                result[scenario] = messages
+        return result
+
+    def deny_frame(self, frames: LogFrames, users: Optional[List[Dict[str, Any]]] = None) -> pd.DataFrame:
+        """Returns one boolean column per scenario (plus `any`), one row per user in `frames`."""
+        if self.uses_links:
+            frames, users = with_links(frames, users)  # Once for every policy
+        columns = {}
+        for scenario, policy in self.compiled.items():
+            columns[scenario] = policy.deny_mask(frames, users)
+        result = pd.DataFrame(columns, index=pd.RangeIndex(len(frames.users), name="user_idx"))
+        result["any"] = result.any(axis=1) if columns else False
+        return result
@@ -0,0 +1,509 @@
+# records.py
+"""
+Compact in-memory representation of users, sessions and events.
+
+Nested user dicts cost a heap object for every key and value of every record. `CompactLog` stores
+the same data as three struct-of-arrays tables (users, sessions, events) with one typed array per
+dotted column (`user_profile.account_age_days`, `network_info.location.city`, ...):
+
+  - strings are interned once in a shared `StringPool` and stored as int32 codes;
+  - ints, floats and bools are packed arrays, with a presence mask only when a column has gaps;
+  - the timestamp columns of `features.TIME_COLUMNS` are parsed once to int64 epoch nanoseconds;
+  - sessions and events are referenced by CSR offsets, so parents need no per-row lists.
+
+The agent path still sees dicts: `log[i]` is a read-only `Mapping` view of user i, nested like the
+original JSON (sessions and events are lists of views), and `to_dict()` / `users()` materialize
+plain dicts one user at a time. `to_frames()` gives the `LogFrames` that `features.flatten_users`
+would, with every string column pointing at the pooled objects.
+
+    log = CompactLog.from_file("sample_logs_v2.json")
+    log[0]["user_profile"]["email"], log.nbytes(), log.to_frames()
+"""
+import datetime
+from array import array
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from features import TIME_COLUMNS, LogFrames, _json_value
+from tools import iter_users
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MISSING = object()
+# String columns with more distinct values than half of the values in their first TEXT_SAMPLE_ROWS rows are
+# stored as plain UTF-8 instead of interned
+TEXT_SAMPLE_ROWS = 1024
+# Resolution `pd.to_datetime` gives parsed timestamps (ns before pandas 3, us since), matched by `to_frames`
+_TIME_UNIT = pd.to_datetime(["1970-01-01T00:00:00Z"], utc=True).unit
+
+
+def parse_time_ns(value: Any) -> Optional[int]:
+    """ISO-8601 timestamp to epoch nanoseconds (naive times are UTC), or None if it does not parse."""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    delta = parsed - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 10 ** 9 + delta.microseconds * 1000
+
+
+class StringPool:
+    """Interns strings to dense int codes; every distinct string is stored once."""
+
+    def __init__(self):
+        self.codes: Optional[Dict[str, int]] = {}
+        self.strings: List[str] = []
+
+    def code(self, value: str) -> int:
+        if self.codes is None:
+            self.codes = {string: code for code, string in enumerate(self.strings)}
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+    def freeze(self) -> None:
+        """Drops the lookup table once loading is done; the next `code` call rebuilds it."""
+        self.codes = None
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+
+class _Column:
+    """
+    One typed column. `kind` is int, float, bool, time, str (interned codes), text (high-cardinality
+    strings such as ids, UTF-8 in `blob` with per-row end offsets in `values`) or object (mixed types).
+    """
+
+    __slots__ = ("kind", "values", "blob", "present", "size")
+
+    _TYPECODES = {"int": "q", "float": "d", "bool": "b", "str": "i", "text": "q", "time": "q"}
+
+    def __init__(self, kind: str, size: int):
+        self.kind = kind
+        self.values: Any = [] if kind == "object" else array(self._TYPECODES[kind])
+        self.blob: Optional[bytearray] = bytearray() if kind == "text" else None
+        self.present: Optional[bytearray] = None  # None while no row is missing
+        self.size = 0
+        self.pad(size)
+
+    def pad(self, size: int) -> None:
+        """Marks rows up to `size` that never set this column as missing."""
+        if size <= self.size:
+            return
+        if self.present is None:
+            self.present = bytearray(b"\x01") * self.size
+        self.present.extend(bytes(size - self.size))
+        filler = None if self.kind == "object" else len(self.blob) if self.kind == "text" else 0
+        self.values.extend([filler] * (size - self.size))
+        self.size = size
+
+    def append(self, stored: Any) -> None:
+        if self.kind == "text":
+            self.blob.extend(stored.encode())
+            stored = len(self.blob)
+        self.values.append(stored)
+        if self.present is not None:
+            self.present.append(1)
+        self.size += 1
+
+    def convert(self, kind: str, decode) -> None:
+        """Re-types the stored values (int to float, str to text, anything to object)."""
+        old = [decode(self, i) if self.is_present(i) else None for i in range(self.size)]
+        present = self.present
+        self.kind = kind
+        self.values = [] if kind == "object" else array(self._TYPECODES[kind])
+        self.blob = bytearray() if kind == "text" else None
+        for value in old:
+            if value is None:
+                self.values.append(None if kind == "object" else len(self.blob) if kind == "text" else 0)
+            elif kind == "text":
+                self.blob.extend(value.encode())
+                self.values.append(len(self.blob))
+            else:
+                self.values.append(float(value) if kind == "float" else value)
+
+    def is_present(self, row: int) -> bool:
+        return self.present is None or bool(self.present[row])
+
+    def nbytes(self) -> int:
+        values = self.values.buffer_info()[1] * self.values.itemsize if isinstance(self.values, array) \
+            else len(self.values) * 8
+        return values + (len(self.present) if self.present is not None else 0) + len(self.blob or b"")
+
+
+_KINDS = {bool: "bool", int: "int", float: "float", str: "str"}
+
+
+def _kind(value: Any) -> str:
+    return _KINDS.get(type(value), "object")
+
+
+def _mostly_unique(column: _Column) -> bool:
+    codes = column.values if column.present is None else [c for c, p in zip(column.values, column.present) if p]
+    return len(set(codes)) > len(codes) // 2
+
+
+class _Table:
+    """Rows of one level (users, sessions or events) as dotted-path columns."""
+
+    def __init__(self, pool: StringPool, time_columns: Iterable[str]):
+        self.pool = pool
+        self.time_columns = frozenset(time_columns)
+        self.columns: Dict[str, _Column] = {}
+        self.nulls: Dict[str, None] = {}  # Columns seen only with null values, kept for `frame()`
+        self.size = 0
+        self._tree: Optional[Dict[str, Any]] = None
+
+    def _decode(self, column: _Column, row: int) -> Any:
+        value = column.values[row]
+        if column.kind == "str":
+            return self.pool.strings[value]
+        if column.kind == "text":
+            return column.blob[column.values[row - 1] if row else 0:value].decode()
+        if column.kind == "bool":
+            return bool(value)
+        if column.kind == "time":
+            return _EPOCH + datetime.timedelta(microseconds=value // 1000)
+        return value
+
+    def _store(self, name: str, value: Any) -> None:
+        column = self.columns.get(name)
+        if name in self.time_columns:
+            ns = parse_time_ns(value)
+            if column is None:
+                column = self.columns[name] = _Column("time", self.size)
+            if ns is not None:
+                column.pad(self.size)
+                column.append(ns)
+            return  # Unparseable times are missing, as with pd.to_datetime(errors="coerce")
+        kind = _kind(value)
+        if column is None:
+            column = self.columns[name] = _Column(kind, self.size)
+        elif column.kind != kind and column.kind != "object" and (column.kind, kind) != ("text", "str"):
+            if {column.kind, kind} == {"int", "float"}:
+                if column.kind == "int":
+                    column.convert("float", self._decode)
+                value = float(value)
+            else:
+                column.convert("object", self._decode)
+        sampling = column.size < TEXT_SAMPLE_ROWS
+        column.pad(self.size)  # Rows since this column was last set are missing
+        if column.kind == "str":
+            column.append(self.pool.code(value))
+            if sampling and column.size >= TEXT_SAMPLE_ROWS and _mostly_unique(column):
+                column.convert("text", self._decode)  # Ids, emails, ...: interning them saves nothing
+        elif column.kind == "object" and isinstance(value, str):
+            column.append(self.pool.strings[self.pool.code(value)])
+        else:
+            column.append(value)
+
+    def append(self, flat: Dict[str, Any]) -> int:
+        """Adds one row of {dotted column: value}; returns its index."""
+        self._tree = None
+        for name, value in flat.items():
+            if value is not None:
+                self._store(name, value)
+            elif name not in self.columns:
+                self.nulls[name] = None
+        self.size += 1
+        return self.size - 1
+
+    def get(self, name: str, row: int, default: Any = None) -> Any:
+        column = self.columns.get(name)
+        if column is None or row >= column.size or not column.is_present(row):
+            return default
+        return self._decode(column, row)
+
+    def tree(self) -> Dict[str, Any]:
+        """Column names as a nested {key: subtree or dotted name} tree, in column order."""
+        if self._tree is None:
+            tree: Dict[str, Any] = {}
+            for name in self.columns:
+                node = tree
+                *parents, leaf = name.split(".")
+                for parent in parents:
+                    node = node.setdefault(parent, {})
+                node[leaf] = name
+            self._tree = tree
+        return self._tree
+
+    def series(self, name: str) -> pd.Series:
+        """One column as the pandas series `pd.DataFrame(list_of_dicts)` would infer."""
+        column = self.columns[name]
+        column.pad(self.size)
+        present = None if column.present is None else np.frombuffer(column.present, dtype=np.uint8).astype(bool)
+        if column.kind == "time":
+            values = np.frombuffer(column.values, dtype=np.int64).astype("datetime64[ns]")
+            if present is not None:
+                values = np.where(present, values, np.datetime64("NaT"))
+            return pd.Series(pd.DatetimeIndex(values).tz_localize("UTC").as_unit(_TIME_UNIT), name=name)
+        if column.kind == "str":
+            strings = np.empty(len(self.pool) + 1, dtype=object)
+            strings[:-1] = self.pool.strings
+            strings[-1] = np.nan
+            codes = np.frombuffer(column.values, dtype=np.int32)
+            if present is not None:
+                codes = np.where(present, codes, -1)
+            return pd.Series(strings[codes], name=name)  # Pointers to the pooled strings, no copies
+        if column.kind == "text":
+            blob, start = bytes(column.blob), 0
+            values = np.empty(column.size, dtype=object)
+            for row, end in enumerate(column.values):
+                values[row], start = blob[start:end].decode(), end
+            if present is not None:
+                values[~present] = np.nan
+            return pd.Series(values, name=name)
+        if column.kind == "object":
+            values = np.empty(column.size, dtype=object)
+            values[:] = column.values
+            if present is not None:
+                values[~present] = np.nan
+            return pd.Series(values, name=name)
+        dtype = {"int": np.int64, "float": np.float64, "bool": np.bool_}[column.kind]
+        values = np.frombuffer(column.values, dtype=np.int8 if column.kind == "bool" else dtype).astype(dtype)
+        if present is not None:
+            if column.kind == "bool":
+                values = values.astype(object)
+                values[~present] = np.nan
+            else:
+                values = np.where(present, values.astype(np.float64), np.nan)
+        return pd.Series(values, name=name)
+
+    def frame(self, extra: Optional[Dict[str, np.ndarray]] = None) -> pd.DataFrame:
+        data = {name: self.series(name) for name in self.columns}
+        data.update({name: pd.Series([None] * self.size, dtype=object) for name in self.nulls if name not in data})
+        data.update(extra or {})
+        return pd.DataFrame(data, index=pd.RangeIndex(self.size))
+
+    def nbytes(self) -> int:
+        return sum(column.nbytes() for column in self.columns.values())
+
+    def load_series(self, name: str, series: pd.Series) -> None:
+        """Sets a whole column from a pandas series of `size` rows (see `CompactLog.from_frames`)."""
+        self._tree = None
+        missing = series.isna().to_numpy()
+        if missing.all():
+            self.nulls[name] = None
+            return
+        values = series.to_numpy()
+        if isinstance(series.dtype, pd.DatetimeTZDtype) or pd.api.types.is_datetime64_dtype(series.dtype):
+            kind = "time"
+            values = series.dt.tz_localize(None) if isinstance(series.dtype, pd.DatetimeTZDtype) else series
+            values = values.to_numpy().astype("datetime64[ns]").view(np.int64)
+        elif pd.api.types.is_bool_dtype(series.dtype):
+            kind = "bool"
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            kind = "int"
+        elif pd.api.types.is_float_dtype(series.dtype):
+            kind = "float"
+        else:
+            types = {type(value) for value in values[~missing]}
+            kind = "str" if types == {str} else "object"
+        if kind == "str":
+            codes, uniques = pd.factorize(series)  # -1 for missing
+            present = int((~missing).sum())
+            if present >= TEXT_SAMPLE_ROWS and len(uniques) > present // 2:
+                column = _Column("text", 0)
+                encoded = [b"" if miss else value.encode() for value, miss in zip(values, missing)]
+                column.blob.extend(b"".join(encoded))
+                column.values.frombytes(np.cumsum([len(value) for value in encoded], dtype=np.int64).tobytes())
+                column.size = self.size
+                column.present = bytearray((~missing).astype(np.uint8).tobytes()) if missing.any() else None
+                self.columns[name] = column
+                return
+            pooled = np.array([self.pool.code(value) for value in uniques], dtype=np.int32)
+            values = np.where(codes < 0, 0, pooled[np.maximum(codes, 0)] if len(pooled) else 0)
+        column = _Column(kind, 0)
+        if kind == "object":
+            column.values = [None if miss else value for value, miss in zip(values.tolist(), missing)]
+        elif kind in ("float", "int") and missing.any():
+            column.values.frombytes(np.where(missing, 0, values).astype(np.float64 if kind == "float" else np.int64).tobytes())
+        else:
+            dtype = {"int": np.int64, "float": np.float64, "bool": np.int8, "str": np.int32, "time": np.int64}[kind]
+            column.values.frombytes(np.asarray(values).astype(dtype).tobytes())
+        column.size = self.size
+        if missing.any():
+            column.present = bytearray((~missing).astype(np.uint8).tobytes())
+        self.columns[name] = column
+
+
+class RecordView(Mapping):
+    """Read-only dict view of one row (or one nested object within it); children are built on access."""
+
+    __slots__ = ("_log", "_level", "_row", "_node")
+
+    def __init__(self, log: "CompactLog", level: int, row: int, node: Optional[Dict[str, Any]] = None):
+        self._log = log
+        self._level = level
+        self._row = row
+        self._node = log._tables[level].tree() if node is None else node
+
+    def _value(self, entry: Any) -> Any:
+        if isinstance(entry, dict):
+            view = RecordView(self._log, self._level, self._row, entry)
+            return view if len(view) else _MISSING  # Objects with no present field are omitted
+        value = self._log._tables[self._level].get(entry, self._row, _MISSING)
+        return value if value is _MISSING else _json_value(value)
+
+    def _children(self) -> Optional[str]:
+        return "sessions" if self._level == 0 else "events" if self._level == 1 else None
+
+    def __getitem__(self, key: str) -> Any:
+        if self._node is self._log._tables[self._level].tree() and key == self._children():
+            start, end = self._log._offsets[self._level][self._row:self._row + 2]
+            return [RecordView(self._log, self._level + 1, row) for row in range(start, end)]
+        entry = self._node.get(key, _MISSING)
+        value = _MISSING if entry is _MISSING else self._value(entry)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self) -> Iterator[str]:
+        for key, entry in self._node.items():
+            if self._value(entry) is not _MISSING:
+                yield key
+        if self._node is self._log._tables[self._level].tree() and self._children():
+            yield self._children()
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """A plain nested dict (and lists) copy of this view."""
+        return self._build(self._node)
+
+    def _build(self, node: Dict[str, Any]) -> Dict[str, Any]:
+        # One pass over the column tree; the same result as copying through the Mapping methods.
+        table = self._log._tables[self._level]
+        out = {}
+        for key, entry in node.items():
+            if isinstance(entry, dict):
+                value = self._build(entry)
+                if value:
+                    out[key] = value
+            else:
+                value = table.get(entry, self._row, _MISSING)
+                if value is not _MISSING:
+                    out[key] = _json_value(value)
+        children = self._children()
+        if children and node is table.tree():
+            start, end = self._log._offsets[self._level][self._row:self._row + 2]
+            out[children] = [RecordView(self._log, self._level + 1, row).to_dict() for row in range(start, end)]
+        return out
+
+    def __repr__(self) -> str:
+        return f"RecordView({self.to_dict()!r})"
+
+
+def _flat(obj: Dict[str, Any], skip: str, prefix: str = "", out: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    # Like features._flatten: nested dicts become dotted keys and lists are left out.
+    if out is None:
+        out = {}
+    for key, value in obj.items():
+        if isinstance(value, dict):
+            _flat(value, skip, f"{prefix}{key}.", out)
+        elif not isinstance(value, list) and not (not prefix and key == skip):
+            out[prefix + key] = value
+    return out
+
+
+class CompactLog(Sequence):
+    """Users, sessions and events as interned struct-of-arrays tables; see the module docstring."""
+
+    def __init__(self):
+        self.pool = StringPool()
+        self._tables = [_Table(self.pool, TIME_COLUMNS[name]) for name in ("users", "sessions", "events")]
+        self._offsets = [array("q", [0]), array("q", [0])]  # Session range per user, event range per session
+
+    @classmethod
+    def from_users(cls, users: Iterable[Dict[str, Any]]) -> "CompactLog":
+        log = cls()
+        for user in users:
+            log.append(user)
+        log.pool.freeze()
+        return log
+
+    @classmethod
+    def from_frames(cls, frames: LogFrames) -> "CompactLog":
+        """
+        Packs already-flattened frames (e.g. `log_cache.load_frames`) column by column, without
+        building a dict per row.
+        """
+        log = cls()
+        for table, frame, links in zip(log._tables, frames, ((), ("user_idx",), ("user_idx", "session_idx"))):
+            table.size = len(frame)
+            for name in frame.columns:
+                if name not in links:
+                    table.load_series(name, frame[name])
+        for offsets, parent, child, link in ((log._offsets[0], frames.users, frames.sessions, "user_idx"),
+                                             (log._offsets[1], frames.sessions, frames.events, "session_idx")):
+            counts = np.bincount(child[link].to_numpy(dtype=np.int64), minlength=len(parent)) if len(child) \
+                else np.zeros(len(parent), dtype=np.int64)
+            offsets.extend(np.cumsum(counts).tolist())
+        log.pool.freeze()
+        return log
+
+    @classmethod
+    def from_file(cls, file_path: str) -> "CompactLog":
+        """Streams a JSON, JSONL, .gz or .zst log (see `tools.iter_users`) into a compact log."""
+        return cls.from_users(iter_users(file_path))
+
+    def append(self, user: Dict[str, Any]) -> None:
+        users, sessions, events = self._tables
+        users.append(_flat(user, "sessions"))
+        for session in user.get("sessions") or []:
+            sessions.append(_flat(session, "events"))
+            for event in session.get("events") or []:
+                events.append(_flat(event, ""))
+            self._offsets[1].append(events.size)
+        self._offsets[0].append(sessions.size)
+
+    def __len__(self) -> int:
+        return self._tables[0].size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return RecordView(self, 0, index)
+
+    def users(self) -> Iterator[Dict[str, Any]]:
+        """Plain nested dicts, one user at a time."""
+        for view in self:
+            yield view.to_dict()
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return {name: table.size for name, table in zip(("users", "sessions", "events"), self._tables)}
+
+    def to_frames(self) -> LogFrames:
+        """The `LogFrames` of `features.flatten_users`, built from the packed columns."""
+        users, sessions, events = self._tables
+        session_counts = np.diff(np.frombuffer(self._offsets[0], dtype=np.int64))
+        event_counts = np.diff(np.frombuffer(self._offsets[1], dtype=np.int64))
+        session_user = np.repeat(np.arange(users.size, dtype=np.int64), session_counts)
+        return LogFrames(
+            users=users.frame(),
+            sessions=sessions.frame({"user_idx": session_user}) if sessions.size else pd.DataFrame(columns=["user_idx"]),
+            events=events.frame({"user_idx": np.repeat(session_user, event_counts),
+                                 "session_idx": np.repeat(np.arange(sessions.size, dtype=np.int64), event_counts)})
+            if events.size else pd.DataFrame(columns=["user_idx", "session_idx", "event_type"]),
+        )
+
+    def nbytes(self) -> int:
+        """Approximate bytes held: packed columns, offsets and the interned strings."""
+        strings = sum(len(s) + 49 for s in self.pool.strings) + len(self.pool) * 8  # str objects + list slots
+        offsets = sum(len(o) * o.itemsize for o in self._offsets)
+        return sum(table.nbytes() for table in self._tables) + offsets + strings
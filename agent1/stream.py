@@ -0,0 +1,401 @@
+# stream.py
+"""
+Real-time scoring of a live event feed against the generated Rego policies.
+
+The feed is JSONL with one event per line:
+
+    {"uid": "USER_001", "session_id": "SESS_001_001", "event_type": "order_create",
+     "timestamp": "2025-07-11T09:05:00Z", "details": {"declared_value": 2500, ...},
+     "session": {"start_time": ..., "device_info": {...}, "network_info": {...}},
+     "user_profile": {...}, "fraud_scenario": ..., "risk_score": ...}
+
+`session` is only needed on the first event of a session and the user-level keys only when they
+change; `events_from_users` turns a batch `fraud_detection_logs` export into such a feed.
+
+Each user keeps a sliding window (`window_seconds` of event time) of their recent sessions and
+events, in the same nested layout as a user object in the logs, so every event is scored by
+calling `PolicySet.deny` on that window without rebuilding anything. Order count, declared-value
+sum and IP changes in the window, plus the last IP and location, are kept incrementally and
+reported with each decision. Users idle for `idle_seconds` (or beyond `max_users`, least recently
+active first) are evicted, so memory stays bounded by the active population.
+
+Because the feed sends `user_profile` and `session` only once or on change, each user's profile,
+recent session metadata and last IP/location are kept in a `UserMemory` that outlives both the
+window's events and the window itself (up to `max_profiles` evicted users, least recently active
+dropped first). An event for a user with no known profile is decided as "skipped" rather than
+"allow", since the profile-based rules could not see it.
+
+With `--links` (implied when a policy reads `input.link`), every event's device, payment, phone and
+delivery address also go into a `links.LinkIndex`, and the policy input carries
+`link.component_size` / `link.component_id`: the ring of accounts sharing identifiers with this one
+so far. The link index is not evicted; it grows
+with the distinct identifiers seen.
+
+    python stream.py events.jsonl --policies policies.json --follow
+    python stream.py --replay sample_logs_v2.json --policies policies.json --all
+    python stream.py --socket /tmp/fraud.sock --policies policies.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for the shared `common` package
+from common.unix_socket import claim_socket_path
+from links import LinkIndex
+from policies import extract_policies
+from policy_engine import PolicySet
+from tools import iter_users, open_log
+
+DEFAULT_WINDOW_SECONDS = 3600
+DEFAULT_IDLE_SECONDS = 2 * 3600
+DEFAULT_MAX_USERS = 100_000
+DEFAULT_MAX_PROFILES = 1_000_000
+MAX_WINDOW_EVENTS = 1000  # Per user; older events leave the window early past this
+MAX_KNOWN_SESSIONS = 16  # Per user; metadata of the most recent sessions, kept after their events expire
+MAX_SAMPLES = 100_000
+USER_KEYS = ("user_profile", "fraud_scenario", "risk_score")
+_NS = 1_000_000_000
+
+
+def _epoch_ns(timestamp: Any) -> Optional[int]:
+    if not isinstance(timestamp, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return int(parsed.timestamp() * _NS)
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class UserMemory:
+    """The part of a user's state that outlives their window: user-level keys, session metadata, last IP."""
+
+    __slots__ = ("user", "sessions", "last_ip", "last_location")
+
+    def __init__(self):
+        self.user: Dict[str, Any] = {}  # USER_KEYS values as last sent
+        self.sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()  # session_id -> metadata, oldest first
+        self.last_ip: Optional[str] = None
+        self.last_location: Optional[Dict[str, Any]] = None
+
+    def session(self, session_id: Any, record: Dict[str, Any]) -> Dict[str, Any]:
+        """The metadata of `session_id`: from `record` if it carries any, else as last remembered."""
+        sessions = self.sessions
+        if "session" in record:
+            sessions[session_id] = record["session"]
+        elif session_id not in sessions:
+            return {}
+        sessions.move_to_end(session_id)
+        if len(sessions) > MAX_KNOWN_SESSIONS:
+            sessions.popitem(last=False)
+        return sessions[session_id]
+
+
+class UserWindow:
+    """One user's sliding window: `user` is the policy input, `entries` the events in arrival order."""
+
+    __slots__ = ("user", "memory", "sessions", "entries", "orders", "declared_value", "ip_changes", "last_seen")
+
+    def __init__(self, uid: str, memory: Optional[UserMemory] = None):
+        self.memory = memory or UserMemory()
+        self.user: Dict[str, Any] = {"uid": uid, "user_profile": {}, **self.memory.user, "sessions": []}
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        # (timestamp_ns, session, event, is_order, declared_value, ip_changed)
+        self.entries: Deque[Tuple[int, Dict[str, Any], Dict[str, Any], int, float, int]] = deque()
+        self.orders = 0
+        self.declared_value = 0.0
+        self.ip_changes = 0
+        self.last_seen = 0
+
+    def add(self, record: Dict[str, Any], ts: int) -> Dict[str, Any]:
+        memory = self.memory
+        for key in USER_KEYS:
+            if key in record:
+                self.user[key] = memory.user[key] = record[key]
+        session_id = record.get("session_id")
+        session = self.sessions.get(session_id)
+        ip_changed = 0
+        if session is None:
+            session = {"session_id": session_id, **memory.session(session_id, record), "events": []}
+            self.sessions[session_id] = session
+            self.user["sessions"].append(session)
+            network = session.get("network_info") or {}
+            ip = network.get("ip_address")
+            if ip is not None:
+                ip_changed = int(memory.last_ip is not None and ip != memory.last_ip)
+                memory.last_ip = ip
+            if network.get("location"):
+                memory.last_location = network["location"]
+        elif "session" in record:
+            memory.session(session_id, record)
+        event = {key: value for key, value in record.items()
+                 if key not in USER_KEYS and key not in ("uid", "session_id", "session")}
+        session["events"].append(event)
+        is_order = int(event.get("event_type") == "order_create")
+        declared = _number((event.get("details") or {}).get("declared_value")) if is_order else 0.0
+        self.entries.append((ts, session, event, is_order, declared, ip_changed))
+        self.orders += is_order
+        self.declared_value += declared
+        self.ip_changes += ip_changed
+        self.last_seen = max(self.last_seen, ts)
+        return session
+
+    def expire(self, cutoff: int, current: Dict[str, Any]) -> None:
+        """Drops events older than `cutoff`, and sessions left empty (except `current`)."""
+        entries = self.entries
+        while entries and (entries[0][0] < cutoff or len(entries) > MAX_WINDOW_EVENTS):
+            _, session, event, is_order, declared, ip_changed = entries.popleft()
+            self.orders -= is_order
+            self.declared_value -= declared
+            self.ip_changes -= ip_changed
+            events = session["events"]
+            if events and events[0] is event:
+                events.pop(0)
+            else:
+                events.remove(event)
+            if not events and session is not current:
+                self.user["sessions"].remove(session)
+                self.sessions.pop(session["session_id"], None)
+
+    def summary(self) -> Dict[str, Any]:
+        summary = {"orders": self.orders, "declared_value": round(self.declared_value, 2),
+                   "ip_changes": self.ip_changes, "sessions": len(self.user["sessions"]),
+                   "last_ip": self.memory.last_ip, "last_location": self.memory.last_location}
+        if "link" in self.user:
+            summary["link"] = self.user["link"]
+        return summary
+
+
+class StreamScorer:
+    """
+    Scores feed events one at a time against `policies` (`{"scenario", "rego_policy"}` objects).
+
+    Time is event time: the window and idle eviction follow the largest `timestamp` seen, so a
+    replayed log behaves like the live feed it was recorded from.
+    """
+
+    def __init__(self, policies: List[Dict[str, Any]], window_seconds: float = DEFAULT_WINDOW_SECONDS,
+                 idle_seconds: float = DEFAULT_IDLE_SECONDS, max_users: int = DEFAULT_MAX_USERS,
+                 links: Optional[LinkIndex] = None, max_profiles: int = DEFAULT_MAX_PROFILES):
+        self.policy_set = PolicySet(policies)
+        if links is None and self.policy_set.uses_links:
+            links = LinkIndex()  # Without it those rules could never fire
+        self.links = links
+        self.window_ns = int(window_seconds * _NS)
+        self.idle_ns = int(idle_seconds * _NS)
+        self.max_users = max_users
+        self.max_profiles = max_profiles
+        self.users: "OrderedDict[str, UserWindow]" = OrderedDict()  # Least recently active first
+        self.memories: "OrderedDict[str, UserMemory]" = OrderedDict()  # Of evicted users, least recently active first
+        self.clock = 0
+        self.events = self.denied = self.evicted = self.skipped = self.no_profile = 0
+        self.latencies_us: List[float] = []
+
+    def score(self, record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Adds one event to its user's window and returns the decision, or None for a malformed event."""
+        started = time.perf_counter()
+        uid = record.get("uid")
+        ts = _epoch_ns(record.get("timestamp"))
+        if uid is None or ts is None:
+            self.skipped += 1
+            return None
+        self.clock = max(self.clock, ts)
+        window = self.users.get(uid)
+        if window is None:
+            window = self.users[uid] = UserWindow(uid, self.memories.pop(uid, None))
+        else:
+            self.users.move_to_end(uid)
+        session = window.add(record, ts)
+        window.expire(ts - self.window_ns, session)
+        if self.links is not None:
+            self.links.add_user(record)
+            window.user["link"] = {"component_id": self.links.component(uid), "component_size": self.links.size(uid)}
+        denied = self.policy_set.deny(window.user)
+        self._evict()
+
+        self.events += 1
+        self.denied += bool(denied)
+        if denied:
+            decision = "deny"
+        elif window.user.get("user_profile"):
+            decision = "allow"
+        else:
+            decision = "skipped"  # Profile never sent, or forgotten past `max_profiles`
+            self.no_profile += 1
+        latency = (time.perf_counter() - started) * 1e6
+        if len(self.latencies_us) < MAX_SAMPLES:
+            self.latencies_us.append(latency)
+        return {
+            "uid": uid, "session_id": record.get("session_id"), "event_type": record.get("event_type"),
+            "timestamp": record.get("timestamp"), "decision": decision, "deny": denied,
+            "window": window.summary(), "latency_us": round(latency, 1),
+        }
+
+    def _evict(self) -> None:
+        users, memories, cutoff = self.users, self.memories, self.clock - self.idle_ns
+        while users:
+            uid, window = next(iter(users.items()))
+            if window.last_seen >= cutoff and len(users) <= self.max_users:
+                break
+            del users[uid]
+            memories[uid] = window.memory
+            self.evicted += 1
+        while len(memories) > self.max_profiles:
+            memories.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {"events": self.events, "denied": self.denied, "skipped": self.skipped,
+                 "no_profile": self.no_profile, "active_users": len(self.users), "evicted_users": self.evicted,
+                 "remembered_users": len(self.memories),
+                 "policy_errors": self.policy_set.errors}
+        if self.links is not None:
+            stats["links"] = self.links.stats()
+        if self.latencies_us:
+            p50, p99, p999 = np.percentile(self.latencies_us, [50, 99, 99.9])
+            stats.update(p50_us=round(float(p50), 1), p99_us=round(float(p99), 1), p999_us=round(float(p999), 1),
+                         max_us=round(max(self.latencies_us), 1))
+        return stats
+
+
+def events_from_users(users: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turns batch user objects into a feed of events in timestamp order (all held in memory)."""
+    feed = []
+    for user in users:
+        user_keys = {key: user[key] for key in USER_KEYS if key in user}
+        for session in user.get("sessions", []):
+            session_keys = {k: v for k, v in session.items() if k not in ("session_id", "events")}
+            for event in session.get("events", []):
+                record = {"uid": user.get("uid"), "session_id": session.get("session_id"), **event}
+                if session_keys:
+                    record["session"], session_keys = session_keys, None
+                if user_keys:
+                    record.update(user_keys)
+                    user_keys = None
+                feed.append(record)
+    feed.sort(key=lambda record: _epoch_ns(record.get("timestamp")) or 0)
+    return feed
+
+
+def tail_jsonl(f: TextIO, follow: bool = False, poll: float = 0.2) -> Iterator[Dict[str, Any]]:
+    """Yields one parsed object per line; with `follow`, waits for lines appended to the file (`tail -f`)."""
+    pending = ""
+    while True:
+        line = f.readline()
+        if not line:
+            if not follow:
+                break
+            time.sleep(poll)
+            continue
+        pending += line
+        if not pending.endswith("\n") and follow:
+            continue  # Partial line from a writer mid-append
+        text, pending = pending.strip(), ""
+        if text:
+            try:
+                yield json.loads(text)
+            except json.JSONDecodeError:
+                continue
+    if pending.strip():
+        yield json.loads(pending)
+
+
+async def serve(scorer: StreamScorer, path: str, decisions: str = "deny") -> None:
+    """
+    Local socket stand-in for a live feed: clients write JSONL events to the Unix socket at `path`
+    and read one JSONL decision back per event (only denials unless `decisions` is "all").
+    """
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                decision = scorer.score(record)
+                if decision and (decisions == "all" or decision["deny"]):
+                    writer.write((json.dumps(decision) + "\n").encode())
+                    await writer.drain()
+        finally:
+            writer.close()
+
+    claim_socket_path(path)
+    server = await asyncio.start_unix_server(handle, path=path)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_policies(path: str) -> List[Dict[str, Any]]:
+    """Policy objects from a JSON file, saved agent output, or a `.rego` bundle (one policy)."""
+    with open(path, "r") as f:
+        text = f.read()
+    if path.endswith(".rego"):
+        return [{"scenario": os.path.splitext(os.path.basename(path))[0], "rego_policy": text}]
+    return extract_policies(text)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Score a live JSONL event feed against generated policies.")
+    parser.add_argument("feed", nargs="?", default="-", help="JSONL event feed (default: stdin)")
+    parser.add_argument("--policies", required=True, help="Policy JSON, saved agent output or .rego bundle")
+    parser.add_argument("--follow", action="store_true", help="Keep reading lines appended to the feed file")
+    parser.add_argument("--replay", help="Score a batch log (JSON, JSONL, .gz, .zst) as a time-ordered feed")
+    parser.add_argument("--socket", help="Serve the Unix socket at this path instead of reading a feed")
+    parser.add_argument("--window", type=float, default=DEFAULT_WINDOW_SECONDS, help="Sliding window in seconds")
+    parser.add_argument("--idle", type=float, default=DEFAULT_IDLE_SECONDS, help="Evict users idle this many seconds")
+    parser.add_argument("--max-users", type=int, default=DEFAULT_MAX_USERS, help="Users kept in memory at most")
+    parser.add_argument("--max-profiles", type=int, default=DEFAULT_MAX_PROFILES,
+                        help="Evicted users whose profile and session metadata are remembered")
+    parser.add_argument("--all", action="store_true", help="Print every decision, not only denials")
+    parser.add_argument("--links", action="store_true",
+                        help="Link accounts sharing devices, payments, phones or addresses (input.link.*); "
+                             "on by default when a policy reads input.link")
+    args = parser.parse_args(argv)
+
+    scorer = StreamScorer(load_policies(args.policies), args.window, args.idle, args.max_users,
+                          LinkIndex() if args.links else None, args.max_profiles)
+    for scenario, error in scorer.policy_set.errors.items():
+        print(f"  {scenario}: {error}", file=sys.stderr)
+    try:
+        if args.socket:
+            try:
+                asyncio.run(serve(scorer, args.socket, "all" if args.all else "deny"))
+            except FileExistsError as e:
+                parser.error(str(e))
+            return
+        if args.replay:
+            records: Iterable[Dict[str, Any]] = events_from_users(iter_users(args.replay))
+            for decision in map(scorer.score, records):
+                if decision and (args.all or decision["deny"]):
+                    print(json.dumps(decision))
+        else:
+            with (sys.stdin if args.feed == "-" else open_log(args.feed)) as f:
+                for decision in map(scorer.score, tail_jsonl(f, args.follow)):
+                    if decision and (args.all or decision["deny"]):
+                        print(json.dumps(decision), flush=args.follow)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(scorer.stats()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
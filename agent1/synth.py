@@ -0,0 +1,342 @@
+# synth.py
+"""
+Seeded generator of synthetic logs in the `fraud_detection_logs` schema of `sample_logs_v2.json`.
+
+Each user is built from its own `random.Random` seeded by (seed, index), so user N is the same
+whatever the total size, and slices of a large log are generated in parallel worker processes.
+Users are streamed to disk, so 10M-user files need no more memory than 1k-user ones.
+
+    python synth.py logs_1m.jsonl.gz --users 1000000 --workers 8 --mix velocity_fraud=0.1 --sessions 3
+"""
+import argparse
+import gzip
+import io
+import json
+import math
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from tools import _is_jsonl
+
+DEFAULT_MIX = {
+    "normal_behavior": 0.85,
+    "velocity_fraud": 0.05,
+    "new_user_high_value_order": 0.05,
+    "ip_change_suspicious": 0.05,
+}
+
+# (city, country, latitude, longitude)
+CITIES = [
+    ("New Delhi", "IN", 28.7041, 77.1025),
+    ("Mumbai", "IN", 19.0760, 72.8777),
+    ("Bengaluru", "IN", 12.9716, 77.5946),
+    ("Chennai", "IN", 13.0827, 80.2707),
+    ("Kolkata", "IN", 22.5726, 88.3639),
+    ("Hyderabad", "IN", 17.3850, 78.4867),
+    ("Singapore", "SG", 1.3521, 103.8198),
+    ("Dubai", "AE", 25.2048, 55.2708),
+    ("London", "GB", 51.5072, -0.1276),
+    ("New York", "US", 40.7128, -74.0060),
+]
+# (device_type, os, os_version, device_model)
+DEVICES = [
+    ("mobile", "Android", "14.0", "Samsung Galaxy S24"),
+    ("mobile", "iOS", "17.5", "iPhone 15 Pro"),
+    ("mobile", "Android", "13.0", "Google Pixel 7"),
+    ("tablet", "Android", "13.0", "Samsung Galaxy Tab S8"),
+    ("tablet", "iOS", "17.5", "iPad Air"),
+]
+PACKAGE_TYPES = ["document", "clothing", "electronics", "food", "jewelry"]
+PAYMENT_METHODS = ["credit_card", "debit_card", "upi", "wallet", "cash_on_delivery"]
+APP_VERSIONS = ["2.0.9", "2.1.0", "2.1.3"]
+
+
+@dataclass
+class SynthConfig:
+    """Shape of the generated log. Means are per user (sessions) and per session (orders)."""
+    scenario_mix: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_MIX))
+    sessions_per_user: float = 2.0
+    orders_per_session: float = 1.0
+    analysis_date: str = "2025-07-11"
+    platform: str = "mobile_delivery_app"
+
+    def __post_init__(self):
+        unknown = set(self.scenario_mix) - set(SCENARIOS)
+        if unknown:
+            raise ValueError(f"Unknown fraud scenarios {sorted(unknown)}; expected some of {sorted(SCENARIOS)}")
+        if not any(w > 0 for w in self.scenario_mix.values()):
+            raise ValueError("scenario_mix needs at least one positive weight")
+
+
+def _ts(t: datetime) -> str:
+    return t.isoformat()[:19] + "Z"  # Several times faster than strftime
+
+
+def _poisson(rng: random.Random, mean: float) -> int:
+    # Knuth's method is fine for the small means used here
+    limit, k, p = math.exp(-mean), 0, 1.0
+    while True:
+        p *= rng.random()
+        if p <= limit:
+            return k
+        k += 1
+
+
+class _UserBuilder:
+    """Builds the sessions of one user; scenario functions only decide timing, places and amounts."""
+
+    def __init__(self, rng: random.Random, index: int, day_start: datetime):
+        self.rng = rng
+        self.index = index
+        self.day_start = day_start
+        self.sessions: List[Dict[str, Any]] = []
+        self.n_orders = 0
+
+    def ip(self) -> str:
+        r = self.rng
+        return f"{r.randint(11, 223)}.{r.randint(0, 255)}.{r.randint(0, 255)}.{r.randint(1, 254)}"
+
+    def device(self) -> Dict[str, Any]:
+        device_type, os_name, os_version, model = self.rng.choice(DEVICES)
+        return {
+            "device_id": f"DEV_{self.index:08d}_{self.rng.randint(0, 9)}",
+            "device_type": device_type,
+            "os": os_name,
+            "os_version": os_version,
+            "app_version": self.rng.choice(APP_VERSIONS),
+            "device_model": model,
+        }
+
+    def order(self, at: datetime, city: Tuple, value: float, package_type: Optional[str] = None) -> Dict[str, Any]:
+        self.n_orders += 1
+        n = f"{self.index:08d}_{self.n_orders:03d}"
+        r = self.rng
+        return {
+            "event_type": "order_create",
+            "timestamp": _ts(at),
+            "details": {
+                "order_id": f"ORD_{n}",
+                "package_type": package_type or r.choice(PACKAGE_TYPES),
+                "pickup_address": f"{r.randint(1, 999)} Main St, {city[0]}, {city[1]}",
+                "delivery_address": f"Flat {r.randint(1, 400)}, {r.randint(1, 9999)} Market Rd, {city[0]}, {city[1]}",
+                "declared_value": round(value),
+                "payment_method": r.choice(PAYMENT_METHODS),
+                "payment_id": f"PAY_{n}",
+            },
+        }
+
+    def session(self, start: datetime, device: Dict[str, Any], ip: str, city: Tuple,
+                order_times: List[float], values: List[float], package_type: Optional[str] = None,
+                logout: bool = True) -> datetime:
+        """Appends a session with orders at `order_times` (minutes after login); returns its end time."""
+        events = [{"event_type": "login", "timestamp": _ts(start),
+                   "details": {"login_method": self.rng.choice(["password", "otp"]), "success": "true"}}]
+        for minutes, value in zip(order_times, values):
+            events.append(self.order(start + timedelta(minutes=minutes), city, value, package_type))
+        end = start + timedelta(minutes=(order_times[-1] if order_times else 0) + self.rng.randint(1, 10))
+        if logout:
+            events.append({"event_type": "logout", "timestamp": _ts(end), "details": {"logout_type": "manual"}})
+        self.sessions.append({
+            "session_id": f"SESS_{self.index:08d}_{len(self.sessions) + 1:03d}",
+            "start_time": _ts(start),
+            "end_time": _ts(end),
+            "duration_minutes": int((end - start).total_seconds() // 60),
+            "device_info": device,
+            "network_info": {
+                "ip_address": ip,
+                "location": {
+                    "latitude": round(city[2] + self.rng.uniform(-0.05, 0.05), 4),
+                    "longitude": round(city[3] + self.rng.uniform(-0.05, 0.05), 4),
+                    "city": city[0],
+                    "country": city[1],
+                },
+            },
+            "events": events,
+        })
+        return end
+
+
+def _gaps(rng: random.Random, n: int, low: float, high: float) -> List[float]:
+    # Cumulative offsets of `n` events spaced uniformly between `low` and `high` minutes apart
+    t, out = 0.0, []
+    for _ in range(n):
+        t += rng.uniform(low, high)
+        out.append(round(t, 1))
+    return out
+
+
+def _normal(b: _UserBuilder, config: SynthConfig) -> Dict[str, Any]:
+    r = b.rng
+    age = r.randint(30, 1500)
+    home, device, ips = r.choice(CITIES), b.device(), [b.ip(), b.ip()]
+    start = b.day_start + timedelta(hours=r.uniform(6, 10))
+    for _ in range(max(1, _poisson(r, config.sessions_per_user))):
+        n = _poisson(r, config.orders_per_session)
+        end = b.session(start, device, r.choice(ips), home, _gaps(r, n, 5, 30),
+                        [r.uniform(100, 5000) for _ in range(n)])
+        start = end + timedelta(hours=r.uniform(1, 4))
+    return {"account_age_days": age, "verified": r.random() < 0.95, "total_orders": r.randint(age // 40 + 1, age // 10 + 2)}
+
+
+def _velocity(b: _UserBuilder, config: SynthConfig) -> Dict[str, Any]:
+    r = b.rng
+    n = 4 + _poisson(r, 4 * config.orders_per_session)
+    b.session(b.day_start + timedelta(hours=r.uniform(8, 20)), b.device(), b.ip(), r.choice(CITIES),
+              _gaps(r, n, 1, 4), [r.uniform(30000, 60000) for _ in range(n)], "electronics", logout=r.random() < 0.3)
+    return {"account_age_days": r.randint(0, 7), "verified": r.random() < 0.6, "total_orders": n + r.randint(0, 20)}
+
+
+def _new_user_high_value(b: _UserBuilder, config: SynthConfig) -> Dict[str, Any]:
+    r = b.rng
+    b.session(b.day_start + timedelta(hours=r.uniform(8, 20)), b.device(), b.ip(), r.choice(CITIES),
+              [r.uniform(2, 8)], [r.uniform(50000, 150000)], r.choice(["electronics", "jewelry"]))
+    return {"account_age_days": r.randint(0, 1), "verified": r.random() < 0.1, "total_orders": 1}
+
+
+def _ip_change(b: _UserBuilder, config: SynthConfig) -> Dict[str, Any]:
+    r = b.rng
+    device = b.device()
+    start = b.day_start + timedelta(hours=r.uniform(8, 20))
+    for city in r.sample(CITIES, min(len(CITIES), max(3, _poisson(r, config.sessions_per_user + 1)))):
+        n = max(1, _poisson(r, config.orders_per_session))
+        end = b.session(start, device if r.random() < 0.7 else b.device(), b.ip(), city,
+                        _gaps(r, n, 1, 5), [r.uniform(2000, 20000) for _ in range(n)])
+        start = end + timedelta(minutes=r.uniform(2, 20))
+    return {"account_age_days": r.randint(1, 60), "verified": r.random() < 0.5, "total_orders": r.randint(2, 15)}
+
+
+SCENARIOS: Dict[str, Callable[[_UserBuilder, SynthConfig], Dict[str, Any]]] = {
+    "normal_behavior": _normal,
+    "velocity_fraud": _velocity,
+    "new_user_high_value_order": _new_user_high_value,
+    "ip_change_suspicious": _ip_change,
+}
+RISK_SCORES = {"normal_behavior": (0.0, 0.3), "velocity_fraud": (0.7, 1.0),
+               "new_user_high_value_order": (0.6, 0.9), "ip_change_suspicious": (0.6, 0.95)}
+
+
+def generate_user(index: int, config: SynthConfig, seed: int = 0) -> Dict[str, Any]:
+    """Returns user number `index` of the log defined by `config` and `seed`."""
+    rng = random.Random(seed * 1_000_003 + index)
+    names, weights = zip(*config.scenario_mix.items())
+    scenario = rng.choices(names, weights)[0]
+    day_start = datetime.fromisoformat(config.analysis_date).replace(tzinfo=timezone.utc)
+    builder = _UserBuilder(rng, index, day_start)
+    profile = SCENARIOS[scenario](builder, config)
+    created = day_start - timedelta(days=profile["account_age_days"], minutes=rng.randint(0, 600))
+    return {
+        "uid": f"USER_{index:08d}",
+        "user_profile": {
+            "account_created": _ts(created),
+            "email": f"user{index}@example.com",
+            "phone": f"+91-{rng.randint(6000000000, 9999999999)}",
+            "verification_status": "verified" if profile["verified"] else "unverified",
+            "total_orders": profile["total_orders"],
+            "account_age_days": profile["account_age_days"],
+        },
+        "fraud_scenario": scenario,
+        "risk_score": round(rng.uniform(*RISK_SCORES[scenario]), 2),
+        "sessions": builder.sessions,
+    }
+
+
+def generate_users(n_users: int, config: Optional[SynthConfig] = None, seed: int = 0, start: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yields users `start` .. `start + n_users - 1`."""
+    config = config or SynthConfig()
+    for index in range(start, start + n_users):
+        yield generate_user(index, config, seed)
+
+
+def generate_logs(n_users: int, config: Optional[SynthConfig] = None, seed: int = 0) -> Dict[str, Any]:
+    """Returns an in-memory `{"fraud_detection_logs": ...}` object; use `write_logs` for large sizes."""
+    config = config or SynthConfig()
+    return {"fraud_detection_logs": {"analysis_date": config.analysis_date, "platform": config.platform,
+                                     "users": list(generate_users(n_users, config, seed))}}
+
+
+def _open_for_write(path: str) -> TextIO:
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", encoding="utf-8", compresslevel=1)
+    if path.endswith(".zst"):
+        import zstandard  # Optional dependency, only needed for .zst output
+        return io.TextIOWrapper(zstandard.ZstdCompressor(level=3).stream_writer(open(path, "wb")), encoding="utf-8")
+    return open(path, "w", encoding="utf-8")
+
+
+CHUNK_USERS = 10_000
+_dumps = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def _encode_chunk(args: Tuple[int, int, SynthConfig, int, str]) -> str:
+    # Serialized users start .. start + n - 1, each followed by `separator`
+    start, n, config, seed, separator = args
+    return "".join(_dumps(user) + separator for user in generate_users(n, config, seed, start))
+
+
+def write_logs(path: str, n_users: int, config: Optional[SynthConfig] = None, seed: int = 0,
+               workers: int = 1) -> int:
+    """
+    Streams a generated log to `path`: one user per line for .jsonl/.ndjson, otherwise the nested
+    `sample_logs_v2.json` layout. A .gz or .zst suffix compresses the output. With `workers` > 1,
+    chunks of users are generated in separate processes; the file is identical either way.
+    Returns the user count.
+    """
+    config = config or SynthConfig()
+    jsonl = _is_jsonl(path)
+    separator = "\n" if jsonl else ",\n"
+    chunks = [(start, min(CHUNK_USERS, n_users - start), config, seed, separator)
+              for start in range(0, n_users, CHUNK_USERS)]
+    with _open_for_write(path) as f:
+        if not jsonl:
+            header = {"analysis_date": config.analysis_date, "platform": config.platform}
+            f.write('{"fraud_detection_logs":' + _dumps(header)[:-1] + ',"users":[\n')
+        if workers > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                encoded = pool.map(_encode_chunk, chunks)
+                pending = ""
+                for text in encoded:
+                    f.write(pending)
+                    pending = text
+        else:
+            pending = ""
+            for chunk in chunks:
+                f.write(pending)
+                pending = _encode_chunk(chunk)
+        # No separator after the last user of a JSON array
+        f.write(pending if jsonl else pending[: -len(separator)])
+        if not jsonl:
+            f.write("\n]}}\n")
+    return n_users
+
+
+def _mix(items: List[str]) -> Dict[str, float]:
+    mix = dict(DEFAULT_MIX)
+    for item in items:
+        name, _, weight = item.partition("=")
+        mix[name] = float(weight)
+    return mix
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Generate a synthetic fraud_detection_logs file.")
+    parser.add_argument("path", help="Output file (.json or .jsonl, optionally .gz/.zst)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mix", nargs="*", default=[], metavar="SCENARIO=WEIGHT",
+                        help="Override scenario weights, e.g. velocity_fraud=0.2 normal_behavior=0.7")
+    parser.add_argument("--sessions", type=float, default=2.0, help="Mean sessions per normal user")
+    parser.add_argument("--orders", type=float, default=1.0, help="Mean orders per session")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Generator processes")
+    args = parser.parse_args(argv)
+
+    config = SynthConfig(scenario_mix=_mix(args.mix), sessions_per_user=args.sessions, orders_per_session=args.orders)
+    write_logs(args.path, args.users, config, args.seed, args.workers)
+    print(f"Wrote {args.users} users to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
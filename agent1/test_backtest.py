@@ -0,0 +1,85 @@
+# test_backtest.py
+"""
+Every point of a `sweep` curve must equal the confusion matrix of the policy rewritten with that
+threshold and evaluated user by user with the interpreter (`deny`), not the vectorized mask.
+
+    python -m pytest agent1
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # Flat sibling imports, as in the apps
+
+import numpy as np
+import pytest
+
+from backtest import confusion, sweep
+from features import NORMAL_SCENARIO, flatten_users
+from policy_engine import compile_policy
+from synth import SynthConfig, generate_users
+
+# One sweepable threshold each; the second body of "with_base" is fixed and never swept.
+TEMPLATES = {
+    "user_field": """
+deny["young unverified"] {{
+    input.user_profile.account_age_days < {threshold}
+    input.user_profile.verification_status != "verified"
+}}""",
+    "event_field": """
+deny["high value"] {{
+    some s in input.sessions
+    some e in s.events
+    e.event_type == "order_create"
+    e.details.declared_value > {threshold}
+}}""",
+    "count": """
+deny["order burst"] {{
+    count([e | some s in input.sessions; some e in s.events; e.event_type == "order_create"]) >= {threshold}
+}}""",
+    "count_field": """
+deny["many declared values"] {{
+    count([e.details.declared_value | some s in input.sessions; some e in s.events]) >= {threshold}
+}}""",
+    "with_base": """
+deny["few orders"] {{
+    input.user_profile.total_orders <= {threshold}
+}}
+
+deny["unverified"] {{
+    input.user_profile.verification_status == "unverified"
+}}""",
+}
+START = {"user_field": 30, "event_field": 40000, "count": 3, "count_field": 3, "with_base": 2}
+
+
+@pytest.fixture(scope="module")
+def population():
+    users = list(generate_users(400, SynthConfig(), seed=5))
+    frames = flatten_users(users)
+    actual = frames.users["fraud_scenario"].to_numpy() != NORMAL_SCENARIO
+    return users, frames, actual
+
+
+def rego(name, threshold):
+    return "package fraud_detection\n" + TEMPLATES[name].format(threshold=threshold)
+
+
+@pytest.mark.parametrize("name", sorted(TEMPLATES))
+def test_sweep_matches_rescoring(name, population):
+    users, frames, actual = population
+    policy = compile_policy(rego(name, START[name]))
+    targets = policy.sweep_targets()
+    assert len(targets) == 1
+
+    result = sweep(policy, targets[0], frames, actual)
+    curve = result["curve"]
+    assert len(curve["thresholds"]) > 2
+    picks = np.unique(np.linspace(0, len(curve["thresholds"]) - 1, 25).astype(int))
+    for i in picks:
+        threshold = curve["thresholds"][i]
+        rescored = compile_policy(rego(name, threshold))
+        expected = confusion(np.array([bool(rescored.deny(user)) for user in users]), actual)
+        assert (curve["tp"][i], curve["fp"][i]) == (expected["tp"], expected["fp"]), threshold
+    current = confusion(np.array([bool(policy.deny(user)) for user in users]), actual)
+    assert {k: result["current"][k] for k in ("tp", "fp", "fn", "tn")} == \
+        {k: current[k] for k in ("tp", "fp", "fn", "tn")}
@@ -0,0 +1,35 @@
+# test_compaction.py
+"""
+Budgeted payloads sample the per-user rows only: `n_users` and the per-scenario counts must still
+describe the whole log.
+
+    python -m pytest agent1
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # Flat sibling imports, as in the apps
+
+from compaction import budgeted_feature_summary, compact_users
+from features import flatten_users, user_features
+from synth import SynthConfig, generate_users
+
+
+def test_summary_counts_cover_the_whole_log():
+    users = list(generate_users(1000, SynthConfig(), seed=1))
+    features = user_features(flatten_users(users))
+    log_data, report = budgeted_feature_summary(features, max_users=100)
+
+    assert log_data["n_users"] == len(users)
+    summary = log_data["scenario_summary"]
+    n_users = summary["columns"].index("n_users")
+    counts = {row[0]: row[n_users] for row in summary["rows"]}
+    assert counts == features["fraud_scenario"].value_counts().to_dict()
+    assert len(log_data["user_features"]["rows"]) == report["users_kept"] <= 100
+
+
+def test_compact_users_keeps_budget():
+    users = list(generate_users(300, SynthConfig(), seed=2))
+    compacted, report = compact_users(users, token_budget=4000)
+    assert report["users_in"] == 300 and len(compacted) == report["users_kept"] > 0
+    assert report["tokens_after"] <= 4000 < report["tokens_before"]
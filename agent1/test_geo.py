@@ -0,0 +1,75 @@
+# test_geo.py
+"""
+`GeoIndex` window statistics must match a brute-force scan of each session's window.
+
+    python -m pytest agent1
+"""
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # Flat sibling imports, as in the apps
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from features import flatten_users
+from geo import GeoIndex
+from synth import SynthConfig, generate_users
+
+
+def hopping_user():
+    """Returns to earlier IPs and cities inside one window: A, B, A, A, C."""
+    hops = [("10.0.0.1", "Pune"), ("10.0.0.2", "Delhi"), ("10.0.0.1", "Pune"), ("10.0.0.1", "Pune"),
+            ("10.0.0.3", "Goa")]
+    sessions = [{"session_id": f"HOP_{i}", "start_time": f"2025-07-11T10:{10 * i:02d}:00Z",
+                 "network_info": {"ip_address": ip, "location": {"city": city, "latitude": 18.5, "longitude": 73.8}},
+                 "events": []} for i, (ip, city) in enumerate(hops)]
+    return {"uid": "HOPPER", "user_profile": {}, "sessions": sessions}
+
+
+@pytest.fixture(scope="module")
+def index():
+    users = list(generate_users(800, SynthConfig(), seed=4)) + [hopping_user()]
+    frames = flatten_users(users)
+    return GeoIndex(frames), frames
+
+
+def brute_force(geo, frames, window):
+    """Per row of `geo`: (IP changes, distinct IPs, distinct cities) over its window, by direct scan."""
+    sessions = frames.sessions
+    ips = sessions["network_info.ip_address"].to_numpy(dtype=object)[geo.session_idx]
+    cities = sessions["network_info.location.city"].to_numpy(dtype=object)[geo.session_idx]
+    seconds = geo.start // 10 ** 9
+    changes, distinct_ips, distinct_cities = (np.zeros(len(geo), dtype=np.int64) for _ in range(3))
+    for u in range(geo.n_users):
+        a, b = geo.offsets[u], geo.offsets[u + 1]
+        for i in range(a, b):
+            lo = next(j for j in range(a, i + 1) if seconds[j] >= seconds[i] - math.ceil(window))
+            changes[i] = sum(1 for j in range(lo + 1, i + 1)
+                             if not pd.isna(ips[j]) and not pd.isna(ips[j - 1]) and ips[j] != ips[j - 1])
+            distinct_ips[i] = len({ip for ip in ips[lo:i + 1] if not pd.isna(ip)})
+            distinct_cities[i] = len({city for city in cities[lo:i + 1] if not pd.isna(city)})
+    return changes, distinct_ips, distinct_cities
+
+
+@pytest.mark.parametrize("window", [1800, 7200, 86400])
+def test_windows_match_brute_force(index, window):
+    geo, frames = index
+    changes, distinct_ips, distinct_cities = brute_force(geo, frames, window)
+    np.testing.assert_array_equal(geo.changes_in_window(window), changes)
+    np.testing.assert_array_equal(geo.distinct_in_window(window), distinct_ips)
+    np.testing.assert_array_equal(geo.distinct_in_window(window, "city"), distinct_cities)
+
+    for threshold in (1, 2):
+        expected = np.unique(geo.user[distinct_ips > threshold])
+        np.testing.assert_array_equal(geo.query(window, distinct_ips_over=threshold), expected)
+
+
+def test_returning_ip_counts_once(index):
+    geo, _ = index
+    hopper = int(np.flatnonzero(geo.uids == "HOPPER")[0])
+    rows = slice(geo.offsets[hopper], geo.offsets[hopper + 1])
+    assert geo.distinct_in_window("1h")[rows].tolist() == [1, 2, 2, 2, 3]
+    assert geo.changes_in_window("1h")[rows].tolist() == [0, 1, 2, 2, 3]
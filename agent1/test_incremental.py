@@ -0,0 +1,104 @@
+# test_incremental.py
+"""
+`refresh` over a sequence of exports must leave the same per-user features as a full rebuild from
+the latest export, regenerate only drifted or new scenarios, and skip sessions it has already seen.
+
+    python -m pytest agent1
+"""
+import asyncio
+import copy
+import functools
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # Flat sibling imports, as in the apps
+
+import numpy as np
+import pandas as pd
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+import agent
+import incremental
+import log_cache
+from common.llm_cache import LlmResponseCache
+from features import FEATURE_COLUMNS, flatten_users, user_features
+from synth import SynthConfig, generate_users
+
+
+class ScenarioModel(BaseLlm):
+    """Returns one trivial policy for whichever scenario the request names."""
+
+    calls: list = []
+
+    async def generate_content_async(self, llm_request, stream=False):
+        text = llm_request.contents[-1].parts[0].text
+        scenario = re.search(r"for the '(\w+)'", text).group(1)
+        self.calls.append(scenario)
+        rego = f'package fraud_detection\n\ndeny["{scenario}"] {{\n    input.fraud_scenario == "{scenario}"\n}}'
+        policy = {"scenario": scenario, "description": scenario, "rego_policy": rego}
+        yield LlmResponse(content=types.Content(role="model", parts=[
+            types.Part(text="```json\n" + json.dumps(policy) + "\n```")]))
+
+
+def exports():
+    """Day 1, then a full day-2 export: day 1 plus new sessions for half its users and 500 new users."""
+    day1 = list(generate_users(1000, SynthConfig(analysis_date="2025-07-11")))
+    later = list(generate_users(1000, SynthConfig(analysis_date="2025-07-12"), start=500, seed=1))
+    day2 = copy.deepcopy(day1)
+    by_uid = {user["uid"]: user for user in day2}
+    for user in later:
+        known = by_uid.get(user["uid"])
+        if known is None:
+            day2.append(user)
+            continue
+        known["sessions"] += user["sessions"]
+        for key in ("user_profile", "fraud_scenario", "risk_score"):
+            known[key] = user[key]
+    return day1, day2
+
+
+def test_refresh_matches_full_rebuild(tmp_path, monkeypatch):
+    model = ScenarioModel(model="stub", calls=[])
+    monkeypatch.setattr(agent, "llm_cache", LlmResponseCache(enabled=False))
+    monkeypatch.setattr(agent.telemetry, "enabled", False)
+    monkeypatch.setattr(incremental, "load_frames",
+                        functools.partial(log_cache.load_frames, cache_dir=str(tmp_path / "cache")))
+
+    def factory(**kwargs):
+        return agent.PolicyAnalystAgent(model=model, **kwargs)
+
+    def run(users, name, **kwargs):
+        path = tmp_path / name
+        path.write_text(json.dumps({"fraud_detection_logs": {"users": users}}))
+        model.calls.clear()
+        return asyncio.run(incremental.refresh(str(path), str(tmp_path / "state"), rate=100,
+                                               agent_factory=factory, **kwargs))
+
+    day1, day2 = exports()
+    first = run(day1, "day1.json")
+    assert first["new_users"] == 1000 and first["skipped_sessions"] == 0
+    assert sorted(model.calls) == sorted(first["regenerated"]) and not first["reused"]
+
+    again = run(day1, "day1.json")
+    assert again["new_sessions"] == 0 and again["skipped_sessions"] == first["new_sessions"]
+    assert model.calls == [] and not again["regenerated"]
+
+    second = run(day2, "day2.json", drift_threshold=0.3)
+    assert (second["new_users"], second["updated_users"]) == (500, 500)
+    assert second["skipped_sessions"] == first["new_sessions"]
+    assert "compile_error" not in second
+
+    merged = incremental.IncrementalState.load(str(tmp_path / "state")).features().set_index("uid").sort_index()
+    rebuilt = user_features(flatten_users(day2)).set_index("uid").sort_index()
+    pd.testing.assert_index_equal(merged.index, rebuilt.index)
+    for column in FEATURE_COLUMNS:
+        a, b = merged[column], rebuilt[column]
+        if pd.api.types.is_numeric_dtype(b):
+            same = np.isclose(a.astype(float), b.astype(float), equal_nan=True)
+        else:
+            same = (a.astype(str) == b.astype(str)).to_numpy()
+        assert same.all(), f"{column} differs for {list(merged.index[~same][:5])}"
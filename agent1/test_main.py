@@ -0,0 +1,54 @@
+# test_main.py
+"""
+End-to-end check of `main.main` against a stub model: a repeat run of the same analysis must be
+answered from the LLM response cache.
+
+    python -m pytest agent1
+"""
+import asyncio
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # Flat sibling imports, as in the apps
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+import agent
+import main
+from common.llm_cache import LlmResponseCache
+
+POLICY = {
+    "scenario": "velocity_fraud",
+    "description": "Many orders in a short window",
+    "rego_policy": "package fraud_detection\n\ndeny[msg] {\n    input.user_profile.total_orders > 100\n    msg := \"velocity\"\n}",
+}
+
+
+class StubModel(BaseLlm):
+    """Answers every request with one fixed policy and records the prompt it was sent."""
+
+    prompts: list = []
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.prompts.append(sum(len(part.text or "") for content in llm_request.contents for part in content.parts or []))
+        text = "```json\n" + json.dumps([POLICY]) + "\n```"
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+def test_repeat_run_is_served_from_cache(tmp_path, monkeypatch):
+    stub = StubModel(model="stub", prompts=[])
+    cache = LlmResponseCache(path=str(tmp_path / "llm_cache.sqlite3"))
+    monkeypatch.setenv("SESSION_STORE_PATH", str(tmp_path / "sessions.sqlite3"))
+    monkeypatch.setattr(agent, "model", stub)
+    monkeypatch.setattr(agent, "llm_cache", cache)
+    monkeypatch.setattr(agent.telemetry, "enabled", False)
+
+    asyncio.run(main.main())
+    asyncio.run(main.main())
+
+    # Each run starts its own session, so the second request matches the first and never reaches the model
+    assert len(stub.prompts) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
@@ -0,0 +1,140 @@
+# test_policies.py
+"""
+`merge_policies` must deny exactly what the separate policies deny, including when two policies
+define a helper rule whose name also appears as a field path or inside a string. `PolicyStream` must
+emit each policy of a streamed response once, in the chunk where its object closes.
+
+    python -m pytest agent1
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # Flat sibling imports, as in the apps
+
+import numpy as np
+import pytest
+
+from features import flatten_users
+from policies import PolicyStream, merge_policies
+from policy_engine import PolicySet, compile_policy
+from synth import SynthConfig, generate_users
+
+POLICIES = [
+    {
+        "scenario": "velocity_fraud",
+        "description": "Established accounts with a burst of orders",
+        "rego_policy": """```rego
+package fraud_detection
+
+total_orders := input.user_profile.total_orders
+
+deny[msg] {
+    total_orders > 40
+    msg := sprintf("total_orders is %d", [total_orders])
+}
+```""",
+    },
+    {
+        "scenario": "new_user_high_value_order",
+        "description": "New accounts that already placed orders",
+        "rego_policy": """package fraud_detection
+
+total_orders := count([e | some s in input.sessions; some e in s.events; e.event_type == "order_create"])
+
+deny[msg] {
+    total_orders >= 1
+    input.user_profile.account_age_days < 30
+    msg := "new account with orders (total_orders)"
+}
+""",
+    },
+    {
+        "scenario": "ip_change_suspicious",
+        "description": "Unverified profile",
+        "rego_policy": """package fraud_detection
+
+unverified {
+    input.user_profile.verification_status != "verified"
+}
+
+deny["unverified"] {
+    unverified
+    input.user_profile.total_orders > 0
+}
+""",
+    },
+]
+
+
+def users():
+    return list(generate_users(300, SynthConfig(), seed=7))
+
+
+def test_merge_renames_only_rule_references():
+    bundle = merge_policies(POLICIES)["bundle"]
+    assert "input.user_profile.total_orders\n" in bundle
+    assert "total_orders_velocity_fraud := input.user_profile.total_orders" in bundle
+    assert '"total_orders is %d"' in bundle
+    assert '"new account with orders (total_orders)"' in bundle
+
+
+def test_merged_bundle_denies_like_separate_policies():
+    merged = merge_policies(POLICIES)
+    assert "compile_error" not in merged
+    bundle = compile_policy(merged["bundle"])
+    separate = [compile_policy(p["rego_policy"]) for p in POLICIES]
+
+    population = users()
+    denied = 0
+    for user in population:
+        expected = set().union(*(policy.deny(user) for policy in separate))
+        assert set(bundle.deny(user)) == expected, user["uid"]
+        denied += bool(expected)
+    assert 0 < denied < len(population)  # The policies do discriminate on this population
+
+    frames = flatten_users(population)
+    assert np.array_equal(bundle.deny_mask(frames), PolicySet(POLICIES).deny_frame(frames)["any"].to_numpy())
+
+
+def test_same_scenario_with_another_body_is_kept_and_renamed_apart():
+    variant = {**POLICIES[0], "rego_policy": POLICIES[0]["rego_policy"].replace("> 40", "> 80")}
+    merged = merge_policies(POLICIES + [variant, dict(POLICIES[1])])
+    assert [p["scenario"] for p in merged["policies"]] == [p["scenario"] for p in POLICIES] + ["velocity_fraud"]
+    assert "compile_error" not in merged
+    assert "total_orders_velocity_fraud_2 := input.user_profile.total_orders" in merged["bundle"]
+
+    bundle = compile_policy(merged["bundle"])
+    separate = [compile_policy(p["rego_policy"]) for p in merged["policies"]]
+    for user in users():
+        assert set(bundle.deny(user)) == set().union(*(policy.deny(user) for policy in separate)), user["uid"]
+
+
+def streamed_response():
+    """A model reply with prose, two fenced blocks (one nested in a wrapper), a repeat and two unusable objects."""
+    blocks = [json.dumps(policy) for policy in POLICIES]
+    no_deny = json.dumps({"scenario": "empty", "rego_policy": "package fraud_detection\n\nallow { true }"})
+    no_name = json.dumps({"scenario": 7, "rego_policy": "deny[msg] { msg := \"x\" }"})
+    text = ("I looked at the sessions (some {braces} in prose too) and wrote these:\n\n```json\n"
+            f"[\n  {blocks[0]},\n  {no_deny},\n  {blocks[1]}\n]\n```\n\n"
+            "A third one, plus a repeat of the first:\n\n```json\n"
+            f'{{"policies": [{blocks[2]}, {blocks[0]}, {no_name}]}}\n```\nThat is all.')
+    closes = [text.index(block) + len(block) for block in blocks]  # First occurrence of each policy
+    return text, closes
+
+
+@pytest.mark.parametrize("size", [1, 3, 7])
+def test_stream_emits_each_policy_when_it_closes(size):
+    text, closes = streamed_response()
+    stream = PolicyStream()
+    emitted = []
+    for start in range(0, len(text), size):
+        for policy in stream.feed(text[start:start + size]):
+            emitted.append(policy["scenario"])
+            close = closes[[p["scenario"] for p in POLICIES].index(policy["scenario"])]
+            assert start < close <= start + size, policy["scenario"]
+
+    assert emitted == [policy["scenario"] for policy in POLICIES]
+    assert [policy["rego_policy"].startswith("package fraud_detection") for policy in stream.policies] == [True] * 3
+    assert [(r["scenario"], r["reason"]) for r in stream.rejected] == [
+        ("empty", "rego_policy has no deny rule"), (7, "needs string scenario and rego_policy")]
@@ -0,0 +1,146 @@
+# test_policy_engine.py
+"""
+The vectorized `deny_mask` must agree with the per-user interpreter (`deny`) on every policy shape
+it plans, and those shapes must actually be planned rather than fall back.
+
+    python -m pytest agent1
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # Flat sibling imports, as in the apps
+
+import numpy as np
+import pytest
+
+from features import flatten_users
+from policy_engine import PolicySet, compile_policy
+from synth import SynthConfig, generate_users
+
+SHAPES = {
+    "user_fields": """
+deny[msg] {
+    input.user_profile.account_age_days < 30
+    input.user_profile.verification_status != "verified"
+    msg := "new unverified account"
+}""",
+    "negation": """
+deny["not verified"] {
+    not input.user_profile.verification_status == "verified"
+}""",
+    "session_iteration": """
+deny[msg] {
+    some session in input.sessions
+    session.network_info.location.country != "IN"
+    msg := sprintf("session from %s", [session.network_info.location.country])
+}""",
+    "event_iteration": """
+deny contains msg if {
+    some session in input.sessions
+    some event in session.events
+    event.event_type == "order_create"
+    event.details.declared_value > 50000
+    msg := "high value order"
+}""",
+    "wildcard": """
+deny["upi order"] {
+    input.sessions[_].events[_].details.payment_method == "upi"
+    input.user_profile.total_orders < 5
+}""",
+    "count_sessions": """
+deny["many sessions"] {
+    count(input.sessions) >= 3
+}""",
+    "count_distinct_alias": """
+deny["ip hopping"] {
+    count({ip | some s in input.sessions; ip := s.network_info.ip_address}) > 1
+}""",
+    "count_events": """
+deny["order burst"] {
+    count([e | some s in input.sessions; some e in s.events; e.event_type == "order_create"]) >= 2
+}""",
+    "count_distinct_session_head_over_events": """
+deny["orders from several IPs"] {
+    count({s.network_info.ip_address | some s in input.sessions; some e in s.events; e.event_type == "order_create"}) >= 2
+}""",
+    "count_field_head": """
+deny["several declared values"] {
+    count([e.details.declared_value | some s in input.sessions; some e in s.events]) >= 3
+}""",
+    "count_alias_head": """
+deny["several declared values"] {
+    count([v | some s in input.sessions; some e in s.events; v := e.details.declared_value]) >= 3
+}""",
+    "boolean_helper": """
+high_value {
+    some s in input.sessions
+    some e in s.events
+    e.details.declared_value > 10000
+}
+
+deny["high value from a young account"] {
+    high_value
+    input.user_profile.account_age_days < 60
+}""",
+    "value_helper": """
+max_age := 90
+
+deny["young account"] {
+    input.user_profile.account_age_days < max_age
+}
+
+deny["risky"] {
+    input.risk_score >= 0.7
+}""",
+}
+
+
+@pytest.fixture(scope="module")
+def population():
+    users = list(generate_users(400, SynthConfig(), seed=3))
+    return users, flatten_users(users)
+
+
+@pytest.mark.parametrize("shape", sorted(SHAPES))
+def test_vectorized_mask_matches_interpreter(shape, population):
+    users, frames = population
+    policy = compile_policy("package fraud_detection\n" + SHAPES[shape])
+    assert all(plan is not None for plan in policy._plans()), "shape fell back to the interpreter"
+
+    expected = np.array([bool(policy.deny(user)) for user in users])
+    assert 0 < expected.sum() < len(users)  # Each shape discriminates on this population
+    np.testing.assert_array_equal(policy.deny_mask(frames), expected)
+    np.testing.assert_array_equal(policy.deny_mask(frames, users), expected)
+
+
+RING_POLICY = {"scenario": "ring", "rego_policy": """package fraud_detection
+
+deny["ring"] {
+    input.link.component_size >= 3
+}"""}
+
+
+def test_link_component_is_part_of_every_input(population, tmp_path):
+    from log_cache import load_frames
+    from stream import StreamScorer, events_from_users
+
+    users = [dict(user) for user in population[0]]
+    ring = [user["uid"] for user in users[10:15]]
+    for user in users[10:15]:  # Five accounts on one device
+        user["sessions"] = [{**session, "device_info": {**session.get("device_info", {}), "device_id": "DEV_SHARED"}}
+                            for session in user["sessions"]]
+    path = tmp_path / "ring.json"
+    path.write_text(json.dumps({"fraud_detection_logs": {"users": users}}))
+
+    policy = compile_policy(RING_POLICY["rego_policy"])
+    flattened = policy.deny_mask(flatten_users(users))
+    assert set(ring) <= {users[i]["uid"] for i in np.flatnonzero(flattened)}
+    np.testing.assert_array_equal(policy.deny_mask(load_frames(str(path), str(tmp_path / "cache"))), flattened)
+    policy_set = PolicySet([RING_POLICY])
+    np.testing.assert_array_equal(policy_set.deny_frame(flatten_users(users), users)["ring"].to_numpy(), flattened)
+
+    # The stream keeps its own link index when a policy reads input.link, without --links
+    scorer = StreamScorer([RING_POLICY])
+    denied = {decision["uid"] for decision in map(scorer.score, events_from_users(users)) if decision["deny"]}
+    assert set(ring) <= denied
@@ -0,0 +1,85 @@
+# test_stream.py
+"""
+`StreamScorer` must keep deciding on a user's profile and session metadata after their window is
+evicted, since the feed sends those only once. `serve` must never remove a path it does not own.
+
+    python -m pytest agent1
+"""
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # Flat sibling imports, as in the apps
+
+import pytest
+
+from stream import StreamScorer, serve
+
+POLICIES = [{
+    "scenario": "new_user_high_value_order",
+    "rego_policy": """package fraud_detection
+
+deny[msg] {
+    input.user_profile.account_age_days < 1
+    some session in input.sessions
+    some event in session.events
+    event.event_type == "order_create"
+    msg := "order from a new account"
+}
+""",
+}]
+
+SESSION = {"start_time": "2025-07-11T09:00:00Z", "device_info": {"device_id": "DEV_1"},
+           "network_info": {"ip_address": "10.0.0.1", "location": {"city": "Pune", "country": "IN"}}}
+
+
+def order(uid, timestamp, **keys):
+    return {"uid": uid, "session_id": f"{uid}_S1", "event_type": "order_create", "timestamp": timestamp,
+            "details": {"declared_value": 900}, **keys}
+
+
+def feed():
+    return [
+        order("NEW", "2025-07-11T09:00:00Z", session=SESSION, user_profile={"account_age_days": 0}),
+        # Someone else's event moves the clock past NEW's idle timeout, evicting its window
+        order("OTHER", "2025-07-11T09:09:00Z", session=SESSION, user_profile={"account_age_days": 400}),
+        order("NEW", "2025-07-11T09:10:00Z"),
+    ]
+
+
+def test_profile_and_session_outlive_eviction():
+    scorer = StreamScorer(POLICIES, window_seconds=3600, idle_seconds=300)
+    first, other, second = map(scorer.score, feed())
+    assert scorer.evicted == 1
+    assert first["decision"] == second["decision"] == "deny"
+    assert other["decision"] == "allow"
+    assert second["window"]["last_ip"] == "10.0.0.1"
+    assert scorer.users["NEW"].user["sessions"][0]["device_info"] == {"device_id": "DEV_1"}
+
+
+def test_forgotten_profile_is_skipped_not_allowed():
+    scorer = StreamScorer(POLICIES, window_seconds=3600, idle_seconds=300, max_profiles=0)
+    decisions = [scorer.score(record)["decision"] for record in feed()]
+    assert decisions == ["deny", "allow", "skipped"]
+    assert scorer.stats()["no_profile"] == 1
+
+
+def test_serve_refuses_files_and_live_sockets():
+    scorer = StreamScorer(POLICIES)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "feed.sock")
+        with open(path, "w") as f:
+            f.write("not a socket")
+        with pytest.raises(FileExistsError):
+            asyncio.run(serve(scorer, path))
+        assert os.path.isfile(path)
+
+        os.remove(path)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as live:
+            live.bind(path)
+            live.listen()
+            with pytest.raises(FileExistsError):
+                asyncio.run(serve(scorer, path))
+            assert os.path.exists(path)
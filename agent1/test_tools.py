@@ -0,0 +1,33 @@
+# test_tools.py
+"""
+`iter_users` must stream the `fraud_detection_logs.users` (or top-level `users`) array only, at
+any chunk size, however other "users" keys or brackets inside strings precede it.
+
+    python -m pytest agent1
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))  # Flat sibling imports, as in the apps
+
+import pytest
+
+import tools
+
+DOCUMENTS = [
+    ({"fraud_detection_logs": {"note": 'a "users": [ key and { brackets ] in a string',
+                               "reviewers": {"users": [{"uid": "R1"}]},
+                               "users": [{"uid": "U1", "text": "]}"}, {"uid": "U2"}]}}, ["U1", "U2"]),
+    ({"meta": {"users": [1, 2]}, "users": [{"uid": "T1"}]}, ["T1"]),
+    ({"meta": {"users": [{"uid": "R1"}]}}, []),
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 1 << 20])
+@pytest.mark.parametrize("document,uids", DOCUMENTS)
+def test_iter_users_reads_only_the_log_users(tmp_path, monkeypatch, chunk_size, document, uids):
+    path = tmp_path / "log.json"
+    path.write_text(json.dumps(document, indent=2))
+    monkeypatch.setattr(tools, "CHUNK_SIZE", chunk_size)
+    assert [user["uid"] for user in tools.iter_users(str(path))] == uids
@@ -1,23 +1,167 @@
 # tools.py
+import gzip
+import io
 import json
-from typing import List, Dict, Any
+import re
+from typing import List, Dict, Any, Iterator, Optional, TextIO
 # from google.adk.tools import tool # <--- Import the tool decorator
 
+CHUNK_SIZE = 1 << 20  # Characters read per refill while streaming the nested 'users' array
+JSONL_SUFFIXES = (".jsonl", ".ndjson")
+USERS_PATHS = ((), ("fraud_detection_logs",))  # Objects whose "users" key holds the user array
+_STRUCTURE = re.compile(r'["{}\[\]]')
+_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"\s*')
+_decoder = json.JSONDecoder()
+
+
+def open_log(file_path: str) -> TextIO:
+    """
+    Opens a log file for text reading, transparently decompressing .gz and .zst inputs.
+    """
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, "rt", encoding="utf-8")
+    if file_path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("Reading .zst logs requires the 'zstandard' package: pip install zstandard")
+        raw = open(file_path, "rb")
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw, closefd=True), encoding="utf-8")
+    return open(file_path, "r", encoding="utf-8")
+
+
+def _is_jsonl(file_path: str) -> bool:
+    base = file_path
+    for suffix in (".gz", ".zst"):
+        if base.endswith(suffix):
+            base = base[: -len(suffix)]
+    return base.endswith(JSONL_SUFFIXES)
+
+
+def _iter_jsonl_users(f: TextIO) -> Iterator[Dict[str, Any]]:
+    # One user object per line; a line holding a whole export is expanded in place.
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        if "fraud_detection_logs" in record:
+            yield from record["fraud_detection_logs"].get("users", [])
+        else:
+            yield record
+
+
+def _seek_users(f: TextIO) -> Optional[str]:
+    """
+    Reads `f` up to the opening `[` of the top-level or `fraud_detection_logs` "users" array and
+    returns the text read past it, or None if there is none. Only strings and brackets are looked
+    at, so values before the array are skipped without being parsed, and a "users" key nested
+    anywhere else (e.g. under another object) is not mistaken for it.
+    """
+    buf, pos = "", 0
+    path: List[Optional[str]] = []  # Key each open object/array was opened under; None for the root and array items
+    key = None  # Key whose value comes next
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        buf = buf[pos:] + chunk
+        pos = 0
+        while True:
+            match = _STRUCTURE.search(buf, pos)
+            if not match:
+                pos = len(buf)
+                break
+            ch = match.group()
+            if ch == '"':
+                string = _STRING.match(buf, match.start())
+                if not string or (string.end() == len(buf) and chunk):
+                    pos = match.start()  # Cut off (or its ':' not read yet): rescan after refilling
+                    break
+                pos = string.end()
+                key = string.group(1) if buf.startswith(":", pos) else None
+                continue
+            pos = match.end()
+            if ch in "{[":
+                if ch == "[" and key == "users" and tuple(path[1:]) in USERS_PATHS:
+                    return buf[pos:]
+                path.append(key)
+            elif path:
+                path.pop()
+            key = None
+        if not chunk:
+            return None
+
+
+def _iter_nested_users(f: TextIO) -> Iterator[Dict[str, Any]]:
+    # Find the start of fraud_detection_logs.users without parsing the document around it.
+    buf = _seek_users(f)
+    if buf is None:
+        return
+
+    # Decode one user object at a time, refilling the buffer only when an object is cut off.
+    eof = False
+    while True:
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                return
+            try:
+                user, pos = _decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                break
+            yield user
+        buf = buf[pos:]
+        if eof:
+            if buf.strip():
+                raise json.JSONDecodeError("Unterminated 'users' array", buf, 0)
+            return
+        chunk = f.read(CHUNK_SIZE)
+        eof = not chunk
+        buf += chunk
+
+
+def iter_users(file_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Streams user objects one at a time from a fraud log file.
+
+    Supports the nested `{"fraud_detection_logs": {"users": [...]}}` export as well as JSONL
+    (one user per line), optionally gzip (.gz) or zstd (.zst) compressed. Memory use is bounded
+    by the largest single user object rather than the size of the file.
+    """
+    with open_log(file_path) as f:
+        if _is_jsonl(file_path):
+            yield from _iter_jsonl_users(f)
+        else:
+            yield from _iter_nested_users(f)
+
 
 async def log_reader_tool(file_path: str) -> List[Dict]: # Renamed to lowercase per Python conventions, removed 'self'
     """
-    Reads a JSON file from the specified path and returns its content.
+    Reads a JSON, JSONL, .gz or .zst log file from the specified path and returns its user objects.
+    Large logs are returned as a sample covering every fraud_scenario and its outliers, without
+    contact/payment identifiers; repeated identical sessions carry a `repeat_count`.
     """
-    file_path="D:/Projects/ups_hackathon/agent1/sample_logs_v2.json"
     try:
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-            # Ensure safe access to nested keys
-            return data.get("fraud_detection_logs", {}).get("users", [])
+        # Users are held as a compact columnar log, not nested dicts; the sample is built from its views
+        from records import CompactLog
+        try:
+            from log_cache import load_frames
+        except ImportError:  # pyarrow not installed: parse the log directly
+            users = CompactLog.from_file(file_path)
+        else:
+            # Repeat reads of an unchanged file are served from the columnar cache
+            users = CompactLog.from_frames(load_frames(file_path))
+        from compaction import compact_users
+        return compact_users(users)[0]
     except FileNotFoundError:
         # Return a structured error that the LLM can interpret
         return {"error": f"File not found: {file_path}"}
     except json.JSONDecodeError:
         return {"error": f"Invalid JSON format in file: {file_path}"}
     except Exception as e:
-        return {"error": f"An unexpected error occurred: {str(e)}"}
\ No newline at end of file
+        return {"error": f"An unexpected error occurred: {str(e)}"}
@@ -1,16 +1,26 @@
 # agent.py
 from google.adk.agents import LlmAgent
 
-from google.adk.tools import google_search
-from google.adk.models.lite_llm import LiteLlm
+from search_tool import web_search
 import os
+import sys
 from pydantic import BaseModel, Field
 from typing import Dict, Any
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for the shared `common` package
+from common.llm_cache import LlmResponseCache
+from common.router import model_from_env
+from common.telemetry import Telemetry
 
-# Initialize the model
-model = LiteLlm(
-    model="openrouter/google/gemma-3-27b-it:free",
+
+# Repeat runs with the same instruction and log_data are answered from disk instead of the model
+llm_cache = LlmResponseCache.from_env()
+# Per-event and per-run timings and token counts, appended to telemetry.jsonl
+telemetry = Telemetry.from_env()
+
+# Initialize the model (hedged across MODEL_FALLBACKS when that is set)
+model = model_from_env(
+    "openrouter/google/gemma-3-27b-it:free",
     api_key="",
 )
 
@@ -30,7 +40,7 @@ class PolicyAnalystAgent(LlmAgent):
 
             1.  **Understand Input Template:** The `log_data` provided is a sample JSON structure. Your purpose for this `log_data` is *solely* to understand the available parameters and the template of the customer session data (e.g., `user_profile`, `sessions`, `device_info`, `network_info`, `events`, `event_type`, `declared_value`, `ip_address`, `account_age_days`, etc.). **You must NOT analyze this `log_data` for specific fraud patterns or derive policy conditions from its values.**
 
-            2.  **Search for New Fraud Scenarios/Informative Things:** Use the `WebSearchTool` to actively search for "new fraud scenarios in package delivery industry", "emerging delivery fraud techniques", or "informative articles about package theft and scams". The goal is to identify hypothetical or real-world fraud patterns not explicitly present in the provided `log_data` values.
+            2.  **Search for New Fraud Scenarios/Informative Things:** Use the `web_search` tool to actively search for "new fraud scenarios in package delivery industry", "emerging delivery fraud techniques", or "informative articles about package theft and scams". The goal is to identify hypothetical or real-world fraud patterns not explicitly present in the provided `log_data` values.
 
             3.  **Create Scenarios & Generate Rego Policies:** For *each* distinct fraud scenario or informative insight you gather from your web search, you must:
                 * **Create a detailed hypothetical fraud scenario:** Describe the new fraud pattern clearly.
@@ -42,7 +52,7 @@ class PolicyAnalystAgent(LlmAgent):
 
             **Here's your refined workflow:**
             1.  **Understand the Request and Template:** Acknowledge that `log_data` is only for understanding the JSON structure of user and session objects.
-            2.  **Perform Web Search:** Execute a web search using `WebSearchTool` for relevant queries like "new fraud scenarios in package delivery industry" or "emerging delivery fraud techniques". Gather information about common and emerging fraud types.
+            2.  **Perform Web Search:** Execute a web search using `web_search` tool for relevant queries like "new fraud scenarios in package delivery industry" or "emerging delivery fraud techniques". Gather information about common and emerging fraud types.
             3.  **Create Detailed Scenarios & Generate Rego Policies:**
                 * For each new or emerging fraud scenario identified from your web search (e.g., "ATO - Account Takeover", "Refund Fraud", "Delivery Rerouting Scam"), create a concise description.
                 * Based on your understanding of the `log_data` structure, formulate a Rego policy for each of these *newly identified/hypothesized* fraud scenarios.
@@ -70,5 +80,7 @@ class PolicyAnalystAgent(LlmAgent):
             """,
             input_schema=JSONInput,
             output_key="rego policies",  # Store final JSON response
-            tools=[google_search()] # Retain WebSearchTool here
+            before_model_callback=llm_cache.before_model,
+            after_model_callback=llm_cache.after_model,
+            tools=[telemetry.tool(web_search)] # Cached web search; the google_search built-in only works on Gemini models
         )
\ No newline at end of file
@@ -1,53 +1,125 @@
 
 from google.adk.agents import Agent
+from google.adk.models.base_llm import BaseLlm
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
 from google.adk.tools import google_search
 from google.genai import types
-from google.adk.models.lite_llm import LiteLlm
+from litellm.llms.custom_httpx.http_handler import AsyncHTTPHandler
+from typing import List, Optional
 import asyncio
+import os
+import sys
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for the shared `common` package
+from common.router import model_from_env
 
 APP_NAME="google_search_agent"
 USER_ID="user1234"
-SESSION_ID="1234"
+MODEL_NAME = "openrouter/openai/gpt-4.1"
 
 
-model = LiteLlm(
-    model="openrouter/openai/gpt-4.1",
+# Hedged across MODEL_FALLBACKS when that is set
+model = model_from_env(
+    MODEL_NAME,
     api_key="",
 )
 
-root_agent = Agent(
-    name="basic_search_agent",
-    model=model,
-    description="Agent to answer questions using Google Search.",
-    instruction="I can answer your questions by searching the internet. Just ask me anything!",
-    # google_search is a pre-built tool which allows the agent to perform Google searches.
-    tools=[google_search]
-)
 
-async def setup_session_and_runner():
-    session_service = InMemorySessionService()
-    session = await session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID)
-    runner = Runner(agent=root_agent, app_name=APP_NAME, session_service=session_service)
-    return session, runner
+def build_agent(model: BaseLlm) -> Agent:
+    return Agent(
+        name="basic_search_agent",
+        model=model,
+        description="Agent to answer questions using Google Search.",
+        instruction="I can answer your questions by searching the internet. Just ask me anything!",
+        # google_search is a pre-built tool which allows the agent to perform Google searches.
+        tools=[google_search]
+    )
 
 
+root_agent = build_agent(model)
 
-# Agent Interaction
-async def call_agent_async(query):
-    content = types.Content(role='user', parts=[types.Part(text=query)])
-    session, runner = await setup_session_and_runner()
-    events = runner.run_async(user_id=USER_ID, session_id=SESSION_ID, new_message=content)
 
-    async for event in events:
-        if event.is_final_response():
-            final_response = event.content.parts[0].text
-            print("Agent Response: ", final_response)
+class SearchAgentClient:
+    """
+    Long-lived client for the search agent.
+
+    One Runner and session service are built once and stay warm, and every model call goes
+    through one pooled HTTP client, so connections to the model endpoint are kept alive between
+    queries. Each query gets its own lightweight session (dropped afterwards unless a session_id
+    is passed to continue a conversation), so `gather` can answer many queries at once.
+
+        async with SearchAgentClient() as client:
+            answers = await client.gather(["question 1", "question 2"])
+    """
+
+    def __init__(self, max_concurrency: int = 16, timeout: float = 120.0, app_name: str = APP_NAME,
+                 user_id: str = USER_ID):
+        self.http_client = AsyncHTTPHandler(timeout=timeout, concurrent_limit=max_concurrency)
+        self.agent = build_agent(model_from_env(MODEL_NAME, api_key="", client=self.http_client))
+        self.app_name = app_name
+        self.user_id = user_id
+        self.session_service = InMemorySessionService()
+        self.runner = Runner(agent=self.agent, app_name=app_name, session_service=self.session_service)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def ask(self, query: str, session_id: Optional[str] = None) -> Optional[str]:
+        """Returns the agent's final response text to `query`."""
+        ephemeral = session_id is None
+        session_id = session_id or uuid.uuid4().hex
+        if ephemeral or await self.session_service.get_session(app_name=self.app_name, user_id=self.user_id,
+                                                               session_id=session_id) is None:
+            await self.session_service.create_session(app_name=self.app_name, user_id=self.user_id,
+                                                      session_id=session_id)
+        content = types.Content(role='user', parts=[types.Part(text=query)])
+        final_response = None
+        try:
+            async with self._semaphore:
+                async for event in self.runner.run_async(user_id=self.user_id, session_id=session_id,
+                                                         new_message=content):
+                    if event.is_final_response() and event.content and event.content.parts:
+                        final_response = event.content.parts[0].text
+        finally:
+            if ephemeral:
+                await self.session_service.delete_session(app_name=self.app_name, user_id=self.user_id,
+                                                          session_id=session_id)
+        return final_response
+
+    async def gather(self, queries: List[str], return_exceptions: bool = False) -> List[Optional[str]]:
+        """Answers `queries` concurrently (up to `max_concurrency` in flight); results keep the input order."""
+        return await asyncio.gather(*(self.ask(query) for query in queries), return_exceptions=return_exceptions)
+
+    async def aclose(self) -> None:
+        await self.http_client.close()
+
+    async def __aenter__(self) -> "SearchAgentClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+
+# Agent Interaction
+async def call_agent_async(query, client: Optional[SearchAgentClient] = None):
+    # Pass a long-lived client to keep it warm across queries; otherwise one is opened and closed here
+    if client is not None:
+        final_response = await client.ask(query)
+    else:
+        async with SearchAgentClient() as client:
+            final_response = await client.ask(query)
+    print("Agent Response: ", final_response)
 
 # Note: In Colab, you can directly use 'await' at the top level.
 # If running this code as a standalone Python script, you'll need to use asyncio.run() or manage the event loop.
 
 
+async def main(queries: List[str]) -> None:
+    async with SearchAgentClient() as client:
+        answers = await client.gather(queries, return_exceptions=True)
+    for query, answer in zip(queries, answers):
+        print(f"Q: {query}\nAgent Response: {answer}\n")
+
+
 if __name__ == "__main__":
-    asyncio.run(call_agent_async("what's the latest ai news?"))
\ No newline at end of file
+    asyncio.run(main(sys.argv[1:] or ["what's the latest ai news?"]))
@@ -1,22 +1,24 @@
 # main.py
 import asyncio
-from google.adk.sessions import InMemorySessionService
 from google.adk.runners import Runner
 from google.genai import types
 import json
 import os
+import uuid
 from dotenv import load_dotenv
-from agent import PolicyAnalystAgent
+from agent import PolicyAnalystAgent, telemetry
+from common.session_store import get_or_create_session, session_service_from_env  # `common` is on sys.path once agent.py is imported
 
 load_dotenv() # Load environment variables from .env
 
 
 async def main():
     
-    session_service = InMemorySessionService()
+    # Persistent and size-capped; each run gets its own session, so one analysis never carries another's turns
+    session_service = session_service_from_env()
     app_name = "fraud_policy_generator_app_v2"
     user_id = "user_rego_gen"
-    session_id = "policy_gen_session_v2_001"
+    session_id = f"policy_gen_session_v2_{uuid.uuid4().hex}"
     sample_logs_content = {
           "fraud_detection_logs": {
             "analysis_date": "2025-07-11",
@@ -51,8 +53,8 @@ async def main():
           }
         }
 
-    # Create a session
-    await session_service.create_session(app_name=app_name, user_id=user_id, session_id=session_id)
+    # Create this run's session
+    await get_or_create_session(session_service, app_name=app_name, user_id=user_id, session_id=session_id)
 
     # Initialize your agent
     policy_agent = PolicyAnalystAgent()
@@ -73,13 +75,13 @@ async def main():
         user_content = types.Content(role='user', parts=[types.Part(text=query_json_string)])
 
         final_response_content = "No final response received."
-        async for event in runner_instance.run_async(user_id=user_id, session_id=session_id, new_message=user_content):
+        async for event in telemetry.run(runner_instance, user_id=user_id, session_id=session_id, new_message=user_content):
             if event.is_final_response() and event.content and event.content.parts:
                 final_response_content = event.content.parts[0].text
 
         print(f"<<< Agent '{agent_instance.name}' Response: {final_response_content}")
 
-        current_session = session_service.get_session(app_name=app_name,
+        current_session = await session_service.get_session(app_name=app_name,
                                                     user_id=user_id,
                                                     session_id=session_id)
         stored_output = current_session.state.get(agent_instance.output_key)
@@ -102,6 +104,7 @@ async def main():
     user_message_json_string = json.dumps(query_payload, indent=2)
 
     await call_agent_and_print(runner, policy_agent, session_id, user_message_json_string)
+    telemetry.print_summary()
 
 if __name__ == "__main__":
     print("Starting Fraud Policy Generation Agent...")
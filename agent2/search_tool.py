@@ -0,0 +1,265 @@
+# search_tool.py
+"""
+Caching web search tool for PolicyAnalystAgent.
+
+`google_search` is a Gemini built-in that runs inside the model call, so it can neither be cached
+nor used through LiteLlm. `web_search` is a plain function tool instead; it answers from a disk
+cache when it can and otherwise asks a backend:
+
+* `GoogleSearchBackend` runs a small Gemini agent with `google_search` and returns its summary
+  plus the grounding sources (needs GOOGLE_API_KEY).
+* `OfflineSearchBackend` answers from a JSON file of recorded results, for offline runs and CI.
+  `SearchCache.export` writes such a file from the cache.
+
+Queries are normalized before lookup ("New fraud scenarios in the package-delivery industry" and
+"package delivery industry new fraud scenario" share an entry), identical queries in flight share
+one backend call, and entries older than the TTL are still served for a stale window while a
+background refresh replaces them (stale-while-revalidate; also used when the backend fails).
+
+Configuration comes from the environment (see `SearchCache.from_env` and `backend_from_env`):
+SEARCH_CACHE_PATH, SEARCH_CACHE_TTL_SECONDS, SEARCH_CACHE_STALE_SECONDS, SEARCH_CACHE_DISABLED,
+SEARCH_BACKEND (google | offline), SEARCH_OFFLINE_PATH and SEARCH_MODEL.
+"""
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional, Protocol, Tuple
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ups_hackathon", "search_cache.sqlite3")
+DEFAULT_OFFLINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_fixtures.json")
+STOPWORDS = {"a", "an", "and", "are", "about", "for", "from", "how", "in", "is", "of", "on", "or", "the",
+             "to", "what", "with", "latest", "new", "recent"}
+
+
+def normalize_query(query: str) -> str:
+    """Lowercased, punctuation-free, stopword-free, singularized tokens in sorted order."""
+    tokens = set()
+    for token in re.findall(r"[a-z0-9]+", query.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.add(token)
+    return " ".join(sorted(tokens)) or query.strip().lower()
+
+
+class SearchBackend(Protocol):
+    async def search(self, query: str) -> Dict[str, Any]: ...
+
+
+class OfflineSearchBackend:
+    """
+    Answers from a JSON file mapping queries to results (`{"query": {"summary": ..., "sources": [...]}}`).
+
+    Keys are normalized on load; a query without an exact match gets the entry with the largest
+    token overlap, if it shares at least half of its tokens.
+    """
+
+    def __init__(self, path: str = DEFAULT_OFFLINE_PATH):
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for query, result in json.load(f).items():
+                    self.entries[normalize_query(query)] = result if isinstance(result, dict) else {"summary": result}
+
+    async def search(self, query: str) -> Dict[str, Any]:
+        key = normalize_query(query)
+        if key in self.entries:
+            return self.entries[key]
+        tokens = set(key.split())
+        best, best_overlap = None, 0.0
+        for candidate, result in self.entries.items():
+            overlap = len(tokens & set(candidate.split())) / max(len(tokens), 1)
+            if overlap > best_overlap:
+                best, best_overlap = result, overlap
+        if best is not None and best_overlap >= 0.5:
+            return best
+        return {"summary": "", "sources": [], "note": f"No offline results for '{query}'"}
+
+
+class GoogleSearchBackend:
+    """Runs a one-shot Gemini agent with the `google_search` built-in and returns its grounded summary."""
+
+    def __init__(self, model: str = "gemini-2.0-flash"):
+        from google.adk.agents import LlmAgent
+        from google.adk.runners import Runner
+        from google.adk.sessions import InMemorySessionService
+        from google.adk.tools import google_search
+
+        self.agent = LlmAgent(
+            name="web_searcher",
+            model=model,
+            instruction="Search the web for the user's query and reply with a concise factual summary of the findings.",
+            tools=[google_search],
+        )
+        self.session_service = InMemorySessionService()
+        self.runner = Runner(agent=self.agent, app_name="web_search", session_service=self.session_service)
+
+    async def search(self, query: str) -> Dict[str, Any]:
+        from google.genai import types
+
+        session_id = uuid.uuid4().hex
+        await self.session_service.create_session(app_name="web_search", user_id="search", session_id=session_id)
+        summary, sources = "", []
+        try:
+            content = types.Content(role="user", parts=[types.Part(text=query)])
+            async for event in self.runner.run_async(user_id="search", session_id=session_id, new_message=content):
+                grounding = event.grounding_metadata
+                for chunk in (grounding.grounding_chunks or []) if grounding else []:
+                    if chunk.web and chunk.web.uri:
+                        sources.append({"title": chunk.web.title, "url": chunk.web.uri})
+                if event.is_final_response() and event.content and event.content.parts:
+                    summary = "".join(part.text or "" for part in event.content.parts)
+        finally:
+            await self.session_service.delete_session(app_name="web_search", user_id="search", session_id=session_id)
+        return {"summary": summary, "sources": sources}
+
+
+def backend_from_env() -> SearchBackend:
+    if os.environ.get("SEARCH_BACKEND", "google").lower() == "offline":
+        return OfflineSearchBackend(os.environ.get("SEARCH_OFFLINE_PATH", DEFAULT_OFFLINE_PATH))
+    return GoogleSearchBackend(os.environ.get("SEARCH_MODEL", "gemini-2.0-flash"))
+
+
+class SearchCache:
+    """
+    SQLite-backed search result cache keyed by normalized query.
+
+    Entries younger than `ttl_seconds` are fresh; up to `stale_seconds` past that they are served
+    while a refresh runs in the background; older entries are only used if the backend fails.
+    """
+
+    def __init__(self, backend: Optional[SearchBackend] = None, path: str = DEFAULT_PATH,
+                 ttl_seconds: float = 24 * 3600, stale_seconds: float = 7 * 24 * 3600, enabled: bool = True):
+        self._backend = backend
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.enabled = enabled
+        self.hits = self.stale_hits = self.misses = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refreshing: Dict[str, asyncio.Task] = {}  # Strong references to background refreshes
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def from_env(cls, backend: Optional[SearchBackend] = None) -> "SearchCache":
+        return cls(
+            backend=backend,
+            path=os.environ.get("SEARCH_CACHE_PATH", DEFAULT_PATH),
+            ttl_seconds=float(os.environ.get("SEARCH_CACHE_TTL_SECONDS", 24 * 3600)),
+            stale_seconds=float(os.environ.get("SEARCH_CACHE_STALE_SECONDS", 7 * 24 * 3600)),
+            enabled=os.environ.get("SEARCH_CACHE_DISABLED", "").lower() not in ("1", "true", "yes"),
+        )
+
+    @property
+    def backend(self) -> SearchBackend:
+        # Built on first use, so offline runs with a warm cache never construct the Gemini agent
+        if self._backend is None:
+            self._backend = backend_from_env()
+        return self._backend
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, query TEXT NOT NULL,"
+                " value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+        return self._conn
+
+    def get(self, key: str) -> Optional[Tuple[Dict[str, Any], float]]:
+        """Returns (result, age in seconds) for a normalized key, or None."""
+        with self._lock:
+            row = self._db().execute("SELECT value, created FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), time.time() - row[1]
+
+    def put(self, key: str, query: str, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._db().execute("INSERT OR REPLACE INTO results (key, query, value, created) VALUES (?, ?, ?, ?)",
+                               (key, query, json.dumps(result), time.time()))
+
+    def export(self, path: str) -> int:
+        """Writes every cached result as an `OfflineSearchBackend` file; returns the entry count."""
+        with self._lock:
+            rows = self._db().execute("SELECT query, value FROM results ORDER BY key").fetchall()
+        with open(path, "w") as f:
+            json.dump({query: json.loads(value) for query, value in rows}, f, indent=2)
+        return len(rows)
+
+    async def _fetch(self, key: str, query: str) -> Dict[str, Any]:
+        # One backend call per key at a time; concurrent callers await the same future.
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self.backend.search(query)
+            if self.enabled:
+                self.put(key, query, result)
+            future.set_result(result)
+            return result
+        except BaseException as exc:
+            future.set_exception(exc)
+            future.exception()  # Mark retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _refresh(self, key: str, query: str) -> None:
+        try:
+            await self._fetch(key, query)
+        except Exception:
+            pass  # Keep serving the stale entry; the next lookup tries again
+        finally:
+            self._refreshing.pop(key, None)
+
+    async def search(self, query: str) -> Dict[str, Any]:
+        key = normalize_query(query)
+        cached = self.get(key) if self.enabled else None
+        if cached is not None:
+            result, age = cached
+            if age <= self.ttl_seconds:
+                self.hits += 1
+                return result
+            if age <= self.ttl_seconds + self.stale_seconds:
+                self.stale_hits += 1
+                if key not in self._refreshing:
+                    self._refreshing[key] = asyncio.get_running_loop().create_task(self._refresh(key, query))
+                return result
+        self.misses += 1
+        try:
+            return await self._fetch(key, query)
+        except Exception:
+            if cached is not None:
+                return cached[0]  # Stale-if-error
+            raise
+
+
+search_cache = SearchCache.from_env()
+
+
+async def web_search(query: str) -> Dict[str, Any]:
+    """
+    Searches the web and returns a summary of the findings with their sources.
+
+    Args:
+        query: What to search for, e.g. "emerging delivery fraud techniques".
+
+    Returns:
+        A dict with `summary` (text) and `sources` (list of {title, url}), or `error` on failure.
+    """
+    try:
+        return await search_cache.search(query)
+    except Exception as e:
+        return {"error": f"Search failed: {e}"}
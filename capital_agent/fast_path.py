@@ -0,0 +1,141 @@
+# fast_path.py
+"""
+Answers capital-city queries from a local knowledge table before they reach the model.
+
+`FastPath.lookup` takes the agent's `{"country": "..."}` query and returns a schema-valid output
+(`CapitalInfoOutput` in main.py) on a hit: first from the memo of answers already given (including
+earlier model answers that validated against the schema), then from `KNOWLEDGE`, indexed by a
+normalized country name and its common aliases. A miss returns None and the caller asks the
+model; `remember` memoizes that answer so the next identical query is a hit. `stats()` reports
+hits, misses and the mean lookup time.
+
+    fast_path = FastPath(CapitalInfoOutput)
+    answer = fast_path.lookup('{"country": "France"}') or await ask_model(...)
+"""
+import json
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Type
+
+from pydantic import BaseModel, ValidationError
+
+# country: (capital, estimated population of the capital)
+KNOWLEDGE = {
+    "united states": ("Washington, D.C.", "approximately 690,000"),
+    "canada": ("Ottawa", "approximately 1 million"),
+    "mexico": ("Mexico City", "approximately 9.2 million"),
+    "brazil": ("Brasília", "approximately 2.8 million"),
+    "argentina": ("Buenos Aires", "approximately 3.1 million"),
+    "united kingdom": ("London", "approximately 8.9 million"),
+    "france": ("Paris", "approximately 2.1 million"),
+    "germany": ("Berlin", "approximately 3.7 million"),
+    "italy": ("Rome", "approximately 2.8 million"),
+    "spain": ("Madrid", "approximately 3.3 million"),
+    "russia": ("Moscow", "approximately 13 million"),
+    "egypt": ("Cairo", "approximately 10 million"),
+    "nigeria": ("Abuja", "approximately 1.2 million"),
+    "kenya": ("Nairobi", "approximately 4.4 million"),
+    "south africa": ("Pretoria", "approximately 2.5 million"),
+    "india": ("New Delhi", "approximately 250,000 (over 30 million in the Delhi metropolitan area)"),
+    "china": ("Beijing", "approximately 21.5 million"),
+    "japan": ("Tokyo", "approximately 14 million"),
+    "south korea": ("Seoul", "approximately 9.4 million"),
+    "australia": ("Canberra", "approximately 460,000"),
+}
+
+ALIASES = {
+    "usa": "united states", "us": "united states", "united states of america": "united states",
+    "america": "united states", "uk": "united kingdom", "great britain": "united kingdom",
+    "britain": "united kingdom", "russian federation": "russia", "republic of korea": "south korea",
+    "peoples republic of china": "china", "prc": "china",
+}
+
+
+def normalize(country: str) -> str:
+    """Case-, accent- and punctuation-insensitive key for a country name, with aliases resolved."""
+    key = unicodedata.normalize("NFKD", country.casefold()).encode("ascii", "ignore").decode()
+    key = re.sub(r"[^a-z ]+", "", key.replace("-", " "))
+    key = re.sub(r"\s+", " ", key).strip()
+    key = re.sub(r"^the ", "", key)
+    return ALIASES.get(key, key)
+
+
+def capital_of(country: str) -> Optional[str]:
+    entry = KNOWLEDGE.get(normalize(country))
+    return entry[0] if entry else None
+
+
+def _country(query: Any) -> Optional[str]:
+    if isinstance(query, str):
+        try:
+            query = json.loads(query)
+        except json.JSONDecodeError:
+            return None
+    country = query.get("country") if isinstance(query, dict) else None
+    return country if isinstance(country, str) and country.strip() else None
+
+
+def parse_output(schema: Type[BaseModel], text: Optional[str]) -> Optional[BaseModel]:
+    """The first JSON object in a model response, validated against `schema`, or None."""
+    if not text or "{" not in text:
+        return None
+    try:
+        return schema.model_validate_json(text[text.index("{"):text.rindex("}") + 1])
+    except (ValidationError, ValueError):
+        return None
+
+
+class FastPath:
+    """Knowledge table plus a bounded memo of earlier answers, consulted before the model."""
+
+    def __init__(self, schema: Type[BaseModel], max_memo: int = 10000):
+        self.schema = schema
+        self.max_memo = max_memo
+        self.memo: "OrderedDict[str, BaseModel]" = OrderedDict()
+        self.hits = self.memo_hits = self.misses = 0
+        self._lookup_seconds = 0.0
+
+    def lookup(self, query: Any) -> Optional[BaseModel]:
+        """The answer to `query` (a JSON string or dict with "country") if it is known locally."""
+        started = time.perf_counter()
+        country = _country(query)
+        answer = None
+        if country is not None:
+            key = normalize(country)
+            answer = self.memo.get(key)
+            if answer is not None:
+                self.memo.move_to_end(key)
+                self.memo_hits += 1
+            elif key in KNOWLEDGE:
+                capital, population = KNOWLEDGE[key]
+                answer = self._remember(key, self.schema(capital=capital, population_estimate=population))
+        if answer is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        self._lookup_seconds += time.perf_counter() - started
+        return answer
+
+    def remember(self, query: Any, response_text: Optional[str]) -> Optional[BaseModel]:
+        """Memoizes a model answer to `query` if it validates against the schema; returns it."""
+        country = _country(query)
+        answer = parse_output(self.schema, response_text)
+        if country is None or answer is None:
+            return None
+        return self._remember(normalize(country), answer)
+
+    def _remember(self, key: str, answer: BaseModel) -> BaseModel:
+        self.memo[key] = answer
+        self.memo.move_to_end(key)
+        while len(self.memo) > self.max_memo:
+            self.memo.popitem(last=False)
+        return answer
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "memo_hits": self.memo_hits, "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "mean_lookup_us": round(self._lookup_seconds / lookups * 1e6, 2) if lookups else 0.0,
+                "memo_size": len(self.memo)}
@@ -2,11 +2,17 @@ import json # Needed for pretty printing dicts
 import asyncio
 from google.adk.agents import LlmAgent
 from google.adk.runners import Runner
-from google.adk.sessions import InMemorySessionService
 from google.genai import types
 from pydantic import BaseModel, Field
-from google.adk.models.lite_llm import LiteLlm
 import os
+import sys
+import uuid
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for the shared `common` package
+from common.router import model_from_env
+from common.session_store import get_or_create_session, session_service_from_env
+from common.telemetry import Telemetry
+from fast_path import FastPath, capital_of
 
 
 APP_NAME = "agent_comparison_app"
@@ -26,8 +32,9 @@ class CapitalInfoOutput(BaseModel):
     population_estimate: str = Field(description="An estimated population of the capital city.")
 
 
-model = LiteLlm(
-    model=MODEL_NAME,
+# Hedged across MODEL_FALLBACKS when that is set
+model = model_from_env(
+    MODEL_NAME,
     api_key="",
     # headers={
     #     "HTTP-Referer": "https://github.com/JasperSheldon/machine-learning-models",
@@ -36,17 +43,18 @@ model = LiteLlm(
 )
 
 
+# Per-event, per-run and per-tool timings and token counts, appended to telemetry.jsonl
+telemetry = Telemetry.from_env()
+# Known countries and earlier answers are served locally; only misses reach the model
+fast_path = FastPath(CapitalInfoOutput)
+
+
 # --- 3. Define the Tool (Only for the first agent) ---
+@telemetry.tool
 def get_capital_city(country: str) -> str:
     """Retrieves the capital city of a given country."""
     print(f"\n-- Tool Call: get_capital_city(country='{country}') --")
-    country_capitals = {
-        "united states": "Washington, D.C.",
-        "canada": "Ottawa",
-        "france": "Paris",
-        "japan": "Tokyo",
-    }
-    result = country_capitals.get(country.lower(), f"Sorry, I couldn't find the capital for {country}.")
+    result = capital_of(country) or f"Sorry, I couldn't find the capital for {country}."
     print(f"-- Tool Result: '{result}' --")
     return result
 
@@ -85,13 +93,15 @@ Use your knowledge to determine the capital and estimate the population. Do not
     output_key="structured_info_result", # Store final JSON response
 )
 
-async def main():
+async def main(countries=("France", "Japan")):
 # --- 5. Set up Session Management and Runners ---
-    session_service = InMemorySessionService()
+    # Persistent and size-capped; each run gets its own session, so earlier runs' turns are never resent
+    session_service = session_service_from_env()
+    session_id = f"{SESSION_ID_SCHEMA_AGENT}_{uuid.uuid4().hex}"
     print("Session Service Initialized.")
     # Create separate sessions for clarity, though not strictly necessary if context is managed
     # await session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID_TOOL_AGENT)
-    await session_service.create_session(app_name=APP_NAME, user_id=USER_ID, session_id=SESSION_ID_SCHEMA_AGENT)
+    await get_or_create_session(session_service, app_name=APP_NAME, user_id=USER_ID, session_id=session_id)
 
 # Create a runner for EACH agent
     # capital_runner = Runner(
@@ -115,10 +125,16 @@ async def main():
         """Sends a query to the specified agent/runner and prints results."""
         print(f"\n>>> Calling Agent: '{agent_instance.name}' | Query: {query_json}")
 
+        answer = fast_path.lookup(query_json)
+        if answer is not None:
+            print(f"<<< Fast path (no model call): {answer.model_dump_json()}")
+            print("-" * 30)
+            return answer
+
         user_content = types.Content(role='user', parts=[types.Part(text=query_json)])
 
         final_response_content = "No final response received."
-        async for event in runner_instance.run_async(user_id=USER_ID, session_id=session_id, new_message=user_content):
+        async for event in telemetry.run(runner_instance, user_id=USER_ID, session_id=session_id, new_message=user_content):
             # print(f"Event: {event.type}, Author: {event.author}") # Uncomment for detailed logging
             if event.is_final_response() and event.content and event.content.parts:
                 # For output_schema, the content is the JSON string itself
@@ -126,7 +142,7 @@ async def main():
 
         print(f"<<< Agent '{agent_instance.name}' Response: {final_response_content}")
 
-        current_session = session_service.get_session(app_name=APP_NAME,
+        current_session = await session_service.get_session(app_name=APP_NAME,
                                                     user_id=USER_ID,
                                                     session_id=session_id)
         stored_output = current_session.state.get(agent_instance.output_key)
@@ -141,6 +157,7 @@ async def main():
             # Otherwise, print as string
             print(stored_output)
         print("-" * 30)
+        return fast_path.remember(query_json, final_response_content)
 
 
 # --- 7. Run Interactions ---
@@ -150,8 +167,11 @@ async def main():
     # await call_agent_and_print(capital_runner, capital_agent_with_tool, SESSION_ID_TOOL_AGENT, '{"country": "Canada"}')
 
     print("\n\n--- Testing Agent with Output Schema (No Tool Use) ---")
-    await call_agent_and_print(structured_runner, structured_info_agent_schema, SESSION_ID_SCHEMA_AGENT, '{"country": "France"}')
-    await call_agent_and_print(structured_runner, structured_info_agent_schema, SESSION_ID_SCHEMA_AGENT, '{"country": "Japan"}')
+    for country in countries:
+        await call_agent_and_print(structured_runner, structured_info_agent_schema, session_id,
+                                   json.dumps({"country": country}))
+    telemetry.print_summary()
+    print("fast path: " + " ".join(f"{k}={v}" for k, v in fast_path.stats().items()))
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    asyncio.run(main(sys.argv[1:] or ("France", "Japan")))
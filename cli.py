@@ -0,0 +1,296 @@
+# cli.py
+"""
+One entry point for the three apps, with lazy imports and an optional warm daemon.
+
+Only the standard library is imported up front, so `--help`, `imports` and talking to a daemon
+are instant; an app (and google.adk, litellm, google.genai, dotenv) is imported the first time a
+command needs it, and `--timings` reports what each import cost.
+
+    python cli.py policies agent1/sample_logs_v2.json     # agent1/main.py
+    python cli.py analyst                                   # agent2/main.py
+    python cli.py search "latest ai news" "weather in Delhi"  # agent2/google_agent.py
+    python cli.py capital France Peru                       # capital_agent/main.py
+    python cli.py imports                                   # cold import cost of each dependency and app
+
+`serve` keeps the apps' modules loaded, with what they build at import time (model clients, the
+LLM response cache, telemetry, capital_agent's fast path), plus a pooled search client, and answers
+commands on a Unix socket; with `--socket` (or CLI_SOCKET) a command is sent to that daemon
+instead of paying the cold start, and runs locally if no daemon is listening:
+
+    python cli.py serve --socket /tmp/ups.sock --preload agent1,capital_agent &
+    python cli.py --socket /tmp/ups.sock capital France
+
+The daemon runs one command at a time, in the caller's working directory, and sends back its
+output and exit status. Each command still builds its own Runner and session service (cheap next to
+the imports), so every run starts a fresh session. `serve` refuses a socket another daemon is
+listening on; `imports` always runs locally.
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import io
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+from common.unix_socket import claim_socket_path
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+APPS = ("agent1", "agent2", "capital_agent")
+HEAVY_MODULES = ("dotenv", "google.genai", "litellm", "google.adk")
+ENTRY_POINTS = {"agent1": "main", "agent2": "main", "capital_agent": "main"}
+
+IMPORT_SECONDS: Dict[str, float] = {}
+_app_modules: Dict[str, Dict[str, Any]] = {}  # app -> its flat sibling modules, kept out of sys.modules between uses
+_state: Dict[str, Any] = {}  # Warm objects reused across daemon requests
+
+
+@contextlib.contextmanager
+def app_context(app: str):
+    """
+    Makes `app`'s directory and flat sibling modules (`main`, `agent`, ...) importable by their bare
+    names. The apps share module names, so each app's modules are swapped in only while it runs.
+    """
+    directory = os.path.join(ROOT, app)
+    local = {name[:-3] for name in os.listdir(directory) if name.endswith(".py")}
+    saved = {name: sys.modules.pop(name) for name in local if name in sys.modules}
+    sys.modules.update(_app_modules.get(app, {}))
+    sys.path.insert(0, directory)
+    try:
+        yield
+    finally:
+        sys.path.remove(directory)
+        _app_modules[app] = {name: sys.modules.pop(name) for name in local if name in sys.modules}
+        sys.modules.update(saved)
+
+
+def timed_import(name: str, label: Optional[str] = None) -> Any:
+    """Imports `name`, recording the seconds it took the first time under `label`."""
+    label = label or name
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_SECONDS.setdefault(label, time.perf_counter() - started)
+    return module
+
+
+def load(app: str, module: str) -> Any:
+    """Imports one module of `app` (inside `app_context`), after timing the heavy dependencies one by one."""
+    for name in HEAVY_MODULES:
+        timed_import(name)
+    return timed_import(module, f"{app}/{module}.py")
+
+
+# Commands. Each runs inside its app's context and prints its results.
+
+async def run_policies(args: argparse.Namespace) -> None:
+    with app_context("agent1"):
+        main = load("agent1", "main")
+        kwargs = {"token_budget": args.token_budget} if args.token_budget else {}
+        await main.main(os.path.abspath(args.log_file) if args.log_file else None, **kwargs)
+
+
+async def run_analyst(args: argparse.Namespace) -> None:
+    with app_context("agent2"):
+        await load("agent2", "main").main()
+
+
+async def run_search(args: argparse.Namespace) -> None:
+    with app_context("agent2"):
+        google_agent = load("agent2", "google_agent")
+        client = _state.get("search_client")
+        if client is None:
+            client = google_agent.SearchAgentClient()
+        try:
+            answers = await client.gather(args.queries, return_exceptions=True)
+        finally:
+            if args.daemon:
+                _state["search_client"] = client  # Stays warm for the next request
+            else:
+                await client.aclose()
+    for query, answer in zip(args.queries, answers):
+        print(f"Q: {query}\nAgent Response: {answer}\n")
+
+
+async def run_capital(args: argparse.Namespace) -> None:
+    with app_context("capital_agent"):
+        await load("capital_agent", "main").main(args.countries)
+
+
+def run_imports(args: argparse.Namespace) -> None:
+    """Cold import cost of each heavy dependency and app entry point, each in a fresh interpreter."""
+    probe = "import importlib, sys, time; sys.path.insert(0, {path!r}); t = time.perf_counter(); " \
+            "importlib.import_module({module!r}); print(time.perf_counter() - t)"
+    targets = [(name, ROOT, name) for name in HEAVY_MODULES]
+    targets += [(f"{app}/{ENTRY_POINTS[app]}.py", os.path.join(ROOT, app), ENTRY_POINTS[app]) for app in APPS]
+    targets.append(("agent2/google_agent.py", os.path.join(ROOT, "agent2"), "google_agent"))
+    print(f"{'module':<28} {'cold import (s)':>16}")
+    for label, path, module in targets:
+        result = subprocess.run([sys.executable, "-c", probe.format(path=path, module=module)], cwd=path,
+                                capture_output=True, text=True)
+        lines = result.stdout.strip().splitlines()
+        seconds = f"{float(lines[-1]):.3f}" if result.returncode == 0 and lines else "failed"
+        print(f"{label:<28} {seconds:>16}")
+
+
+COMMANDS = {"policies": run_policies, "analyst": run_analyst, "search": run_search, "capital": run_capital,
+            "imports": run_imports}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run the fraud-policy and helper agents from one CLI.")
+    parser.add_argument("--socket", default=os.environ.get("CLI_SOCKET"),
+                        help="Send the command to the warm daemon on this Unix socket (env CLI_SOCKET)")
+    parser.add_argument("--timings", action="store_true", help="Print the import time of each module loaded")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    policies = commands.add_parser("policies", help="Generate Rego policies from a log file (agent1)")
+    policies.add_argument("log_file", nargs="?", help="Log file (JSON, JSONL, .gz or .zst); built-in sample if omitted")
+    policies.add_argument("--token-budget", type=int, help="Token budget of the log_data sent to the model")
+    commands.add_parser("analyst", help="Run the policy analyst on its sample logs (agent2)")
+    search = commands.add_parser("search", help="Answer questions with the search agent (agent2)")
+    search.add_argument("queries", nargs="+")
+    capital = commands.add_parser("capital", help="Capital city and population of countries (capital_agent)")
+    capital.add_argument("countries", nargs="+")
+    commands.add_parser("imports", help="Measure the cold import cost of each dependency and app")
+
+    serve = commands.add_parser("serve", help="Keep the apps loaded and answer commands on a Unix socket")
+    serve.add_argument("--socket", default=argparse.SUPPRESS, help="Unix socket to listen on")
+    serve.add_argument("--preload", default="", help="Comma-separated apps to import before listening")
+    return parser
+
+
+def print_timings(file=None) -> None:
+    file = file or sys.stderr
+    for label, seconds in IMPORT_SECONDS.items():
+        print(f"import {label}: {seconds:.3f}s", file=file)
+
+
+async def run_command(args: argparse.Namespace) -> None:
+    result = COMMANDS[args.command](args)
+    if asyncio.iscoroutine(result):
+        await result
+
+
+# Daemon
+
+async def serve(path: str, preload: List[str]) -> None:
+    for app in preload:
+        with app_context(app):
+            load(app, ENTRY_POINTS[app])
+    if preload:
+        print_timings()
+    lock = asyncio.Lock()
+    parser = build_parser()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            line = await reader.readline()
+            if not line.strip():
+                return  # Connected and closed without a request, e.g. a `listening` probe
+            request = json.loads(line)
+            output = io.StringIO()
+            started = time.perf_counter()
+            status = 0
+            async with lock:  # One command at a time: commands share sys.modules, stdout and the working directory
+                before = dict(IMPORT_SECONDS)
+                cwd = os.getcwd()
+                try:
+                    os.chdir(request.get("cwd") or cwd)
+                    with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+                        args = parser.parse_args(request.get("argv", []))
+                        args.daemon = True
+                        if args.command in ("serve", "imports"):
+                            raise ValueError(f"{args.command} cannot be sent to a daemon")
+                        await run_command(args)
+                        if args.timings:
+                            print_timings(output)
+                except SystemExit as e:
+                    status = e.code if isinstance(e.code, int) else 1
+                except Exception as e:
+                    output.write(f"{type(e).__name__}: {e}\n")
+                    status = 1
+                finally:
+                    os.chdir(cwd)
+            response = {"output": output.getvalue(), "status": status,
+                        "seconds": round(time.perf_counter() - started, 3),
+                        "cold_imports": {k: round(v, 3) for k, v in IMPORT_SECONDS.items() if k not in before}}
+            try:
+                writer.write((json.dumps(response) + "\n").encode())
+                await writer.drain()
+            except ConnectionError:
+                pass  # The client went away; the command already ran
+        finally:
+            writer.close()
+
+    claim_socket_path(path)
+    server = await asyncio.start_unix_server(handle, path=path, limit=1 << 24)
+    # Stop cleanly (removing the socket file) on SIGTERM as well as Ctrl-C
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    print(f"Serving on {path}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        client = _state.pop("search_client", None)
+        if client is not None:
+            await client.aclose()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def send(path: str, argv: List[str]) -> Optional[int]:
+    """Runs `argv` on the daemon at `path`; returns its exit status, or None if no daemon is listening."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(path)
+            conn.sendall((json.dumps({"argv": argv, "cwd": os.getcwd()}) + "\n").encode())
+            with conn.makefile("rb") as f:
+                response = json.loads(f.readline())
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+    sys.stdout.write(response["output"])
+    return response["status"]
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    args.daemon = False
+
+    if args.command == "serve":
+        if not args.socket:
+            parser.error("serve needs --socket (or CLI_SOCKET)")
+        preload = [app.strip() for app in args.preload.split(",") if app.strip()]
+        unknown = set(preload) - set(APPS)
+        if unknown:
+            parser.error(f"unknown apps to preload: {', '.join(sorted(unknown))}")
+        try:
+            asyncio.run(serve(args.socket, preload))
+        except FileExistsError as e:
+            parser.error(str(e))
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+        return
+
+    if args.socket and args.command != "imports":
+        status = send(args.socket, argv)  # The daemon ignores --socket
+        if status is not None:
+            sys.exit(status)
+        print(f"No daemon on {args.socket}; running locally", file=sys.stderr)
+
+    try:
+        asyncio.run(run_command(args))
+    finally:
+        if args.timings:
+            print_timings()
+
+
+if __name__ == "__main__":
+    main()
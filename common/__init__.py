@@ -0,0 +1 @@
+# Shared runtime helpers used by the agent1, agent2 and capital_agent apps.
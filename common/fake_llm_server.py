@@ -0,0 +1,200 @@
+# fake_llm_server.py
+"""
+Local OpenAI-compatible chat completions server with scripted latency and failures, for testing
+model routing, retries and rate limiting without a real endpoint or API key.
+
+Each model name gets a `Profile`: median latency, log-normal jitter, a slow tail (`slow_rate` of
+requests take `slow_latency`), an error rate with the HTTP status to fail with (429 responses carry
+a Retry-After header) and the reply text. Both plain and streaming (SSE) completions are served.
+
+    with FakeModelServer({"fast": Profile(latency=0.05), "flaky": Profile(error_rate=0.5)}) as server:
+        model = LiteLlm(model="openai/fast", api_base=server.url, api_key="fake")
+
+    python fake_llm_server.py --port 8765 --model fast:latency=0.05 --model slow:latency=2,slow_rate=0.1
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, fields
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class Profile:
+    latency: float = 0.1  # Median seconds before the first byte
+    jitter: float = 0.2  # Log-normal sigma around `latency`
+    slow_rate: float = 0.0
+    slow_latency: float = 5.0
+    error_rate: float = 0.0
+    error_status: int = 503
+    retry_after: float = 1.0  # Sent with 429 responses
+    reply: str = "ok from {model}"
+    chunk_delay: float = 0.01  # Between streamed chunks
+
+    @classmethod
+    def parse(cls, spec: str) -> "Profile":
+        """Builds a profile from "key=value,key=value" (e.g. "latency=0.5,error_rate=0.1")."""
+        types = {f.name: f.type for f in fields(cls)}
+        values = {}
+        for item in filter(None, spec.split(",")):
+            key, _, value = item.partition("=")
+            values[key.strip()] = types[key.strip()](value)
+        return cls(**values)
+
+
+class FakeModelServer:
+    """Serves `/v1/chat/completions` on 127.0.0.1 from a background thread; `url` is the api_base."""
+
+    def __init__(self, profiles: Optional[Dict[str, Profile]] = None, default: Optional[Profile] = None,
+                 port: int = 0, seed: int = 0):
+        self.profiles = profiles or {}
+        self.default = default or Profile()
+        self.requests: Dict[str, int] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def profile(self, model: str) -> Profile:
+        # LiteLlm sends the name without its provider prefix; accept either form.
+        return self.profiles.get(model) or self.profiles.get(model.split("/")[-1]) or self.default
+
+    def _draw(self, profile: Profile) -> tuple:
+        with self._lock:
+            fail = self._random.random() < profile.error_rate
+            slow = self._random.random() < profile.slow_rate
+            noise = self._random.gauss(0, profile.jitter)
+        return fail, (profile.slow_latency if slow else profile.latency * math.exp(noise))
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self) -> None:
+                if not self.path.rstrip("/").endswith("chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                model = request.get("model", "fake")
+                with server._lock:
+                    server.requests[model] = server.requests.get(model, 0) + 1
+                profile = server.profile(model)
+                fail, delay = server._draw(profile)
+                try:
+                    time.sleep(delay)
+                    if fail:
+                        headers = {"Retry-After": str(profile.retry_after)} if profile.error_status == 429 else {}
+                        self._send_json(profile.error_status, {"error": {"message": "scripted failure",
+                                                                         "type": "fake_error"}}, headers)
+                        return
+                    text = profile.reply.format(model=model)
+                    if request.get("stream"):
+                        self._stream(model, text, profile)
+                    else:
+                        self._send_json(200, _completion(model, text, request.get("messages", [])))
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # The client gave up (e.g. a cancelled hedge)
+
+            def _stream(self, model: str, text: str, profile: Profile) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+                words = text.split(" ")
+                for i, word in enumerate(words):
+                    delta = {"role": "assistant", "content": word + (" " if i < len(words) - 1 else "")}
+                    self._event(_chunk(completion_id, model, delta, None))
+                    time.sleep(profile.chunk_delay)
+                self._event(_chunk(completion_id, model, {}, "stop"))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def _event(self, body: Dict[str, Any]) -> None:
+                self.wfile.write(f"data: {json.dumps(body)}\n\n".encode())
+                self.wfile.flush()
+
+        return Handler
+
+    def start(self) -> "FakeModelServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeModelServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+def _usage(messages: List[Dict[str, Any]], text: str) -> Dict[str, int]:
+    prompt = sum(len(str(m.get("content", ""))) for m in messages) // 4
+    completion = max(1, len(text) // 4)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def _completion(model: str, text: str, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "object": "chat.completion", "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": _usage(messages, text),
+    }
+
+
+def _chunk(completion_id: str, model: str, delta: Dict[str, Any], finish_reason: Optional[str]) -> Dict[str, Any]:
+    return {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve fake OpenAI-compatible models with scripted latency and errors.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--model", action="append", default=[], metavar="NAME:KEY=VALUE,...",
+                        help="Profile for one model name, e.g. slow:latency=2,error_rate=0.1 (repeatable)")
+    parser.add_argument("--default", default="", help="Profile for any other model name")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    profiles = {}
+    for spec in args.model:
+        name, _, options = spec.partition(":")
+        profiles[name] = Profile.parse(options)
+    server = FakeModelServer(profiles, Profile.parse(args.default), args.port, args.seed)
+    print(f"Serving {', '.join(profiles) or 'any model'} at {server.url} (api_key can be anything)")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server._server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+# llm_cache.py
+"""
+Content-addressed, disk-backed cache of LLM responses for ADK agents.
+
+Responses are keyed by model name, system instruction, tool/schema configuration and a canonical
+hash of the request contents (JSON message text is re-serialized with sorted keys, so whitespace
+and key order do not matter). Entries live in a SQLite file with a TTL, an entry cap and a byte
+cap; the least recently used entries are evicted first.
+
+Attach it to an agent through ADK's model callbacks:
+
+    cache = LlmResponseCache()
+    LlmAgent(..., before_model_callback=cache.before_model, after_model_callback=cache.after_model)
+
+Configuration comes from the environment (see `from_env`): LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS,
+LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_BYTES and LLM_CACHE_DISABLED.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ups_hackathon", "llm_cache.sqlite3")
+
+
+def _canonical_text(text: str) -> str:
+    try:
+        return json.dumps(json.loads(text), sort_keys=True, separators=(",", ":"))
+    except (json.JSONDecodeError, TypeError):
+        return text.strip()
+
+
+def _canonical_part(part: Any) -> Any:
+    if getattr(part, "text", None) is not None:
+        return {"text": _canonical_text(part.text)}
+    return part.model_dump(mode="json", exclude_none=True)
+
+
+def _instruction_text(instruction: Any) -> str:
+    if instruction is None:
+        return ""
+    if isinstance(instruction, str):
+        return instruction
+    parts = getattr(instruction, "parts", None) or []
+    return "\n".join(part.text or "" for part in parts)
+
+
+def request_key(llm_request: Any) -> str:
+    """Returns the SHA-256 cache key of an ADK `LlmRequest`."""
+    config = llm_request.config
+    payload = {
+        "model": llm_request.model or "",
+        "instruction": _instruction_text(config.system_instruction if config else None),
+        "tools": sorted(llm_request.tools_dict),
+        "response_schema": config.response_schema.model_dump(mode="json", exclude_none=True)
+        if config is not None and hasattr(config.response_schema, "model_dump") else None,
+        "contents": [
+            {"role": content.role, "parts": [_canonical_part(part) for part in content.parts or []]}
+            for content in llm_request.contents
+        ],
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class LlmResponseCache:
+    """SQLite-backed response cache with TTL, LRU eviction and entry/byte caps."""
+
+    def __init__(self, path: str = DEFAULT_PATH, ttl_seconds: float = 7 * 24 * 3600,
+                 max_entries: int = 10_000, max_bytes: int = 256 * 1024 * 1024, enabled: bool = True):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._pending: Dict[str, Tuple[str, str]] = {}  # invocation_id -> (key, model) of the request in flight
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def from_env(cls) -> "LlmResponseCache":
+        return cls(
+            path=os.environ.get("LLM_CACHE_PATH", DEFAULT_PATH),
+            ttl_seconds=float(os.environ.get("LLM_CACHE_TTL_SECONDS", 7 * 24 * 3600)),
+            max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", 10_000)),
+            max_bytes=int(os.environ.get("LLM_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+            enabled=os.environ.get("LLM_CACHE_DISABLED", "").lower() not in ("1", "true", "yes"),
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, value TEXT NOT NULL, size INTEGER NOT NULL,"
+                " created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        return self._conn
+
+    def get(self, key: str) -> Optional[str]:
+        """Returns the stored value for `key`, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def put(self, key: str, value: str, model: str = "") -> None:
+        """Stores `value` under `key`, then evicts least recently used entries past the caps."""
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, model, value, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, value, size, now, now),
+            )
+            self._evict(db, now)
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        if self.ttl_seconds:
+            db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            count -= 1
+            total -= size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM responses")
+
+    # ADK model callbacks
+
+    def before_model(self, callback_context: Any, llm_request: Any) -> Optional[Any]:
+        """`before_model_callback`: returns the cached `LlmResponse` on a hit, skipping the model call."""
+        if not self.enabled:
+            return None
+        from google.adk.models.llm_response import LlmResponse
+
+        key = request_key(llm_request)
+        value = self.get(key)
+        if value is None:
+            self.misses += 1
+            self._pending[callback_context.invocation_id] = (key, llm_request.model or "")
+            return None
+        self.hits += 1
+        return LlmResponse.model_validate_json(value)
+
+    def after_model(self, callback_context: Any, llm_response: Any) -> None:
+        """`after_model_callback`: stores complete, error-free responses for the request in flight."""
+        if llm_response.partial:
+            return None  # The request is still in flight; the final response follows
+        # Popped whatever the outcome, so failed or empty responses do not leave entries behind
+        pending = self._pending.pop(callback_context.invocation_id, None)
+        if pending is None or not self.enabled or llm_response.error_code or not llm_response.content:
+            return None
+        key, model = pending
+        self.put(key, llm_response.model_dump_json(exclude_none=True), model=model)
+        return None
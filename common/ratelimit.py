@@ -0,0 +1,87 @@
+# ratelimit.py
+"""
+Token-bucket rate limiting and retry-with-backoff for calls to rate-limited model endpoints.
+"""
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+RETRY_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens per second, at most `capacity` banked for bursts.
+
+    Waiters are served in arrival order. Can be used directly (`await bucket.acquire()`) or as an
+    ADK `before_model_callback` to throttle every model call an agent makes.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+    async def before_model(self, callback_context: Any, llm_request: Any) -> None:
+        await self.acquire()
+        return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """True for timeouts, connection errors and HTTP 429/5xx errors (litellm, httpx and OpenAI style)."""
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        response = getattr(exc, "response", None)
+        status = getattr(response, "status_code", None)
+    if status is not None:
+        return status in RETRY_STATUS_CODES
+    return type(exc).__name__ in ("RateLimitError", "Timeout", "APIConnectionError", "ServiceUnavailableError",
+                                  "InternalServerError")
+
+
+async def retry_async(
+    fn: Callable[[int], Awaitable[T]],
+    attempts: int = 4,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    retryable: Callable[[BaseException], bool] = is_retryable,
+    on_retry: Optional[Callable[[int, BaseException, float], None]] = None,
+) -> T:
+    """
+    Awaits `fn(attempt)` until it succeeds, retrying retryable errors with full-jitter exponential backoff.
+
+    The last error is re-raised once `attempts` are used up or an error is not retryable.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return await fn(attempt)
+        except Exception as exc:
+            if attempt == attempts or not retryable(exc):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+            if on_retry is not None:
+                on_retry(attempt, exc, delay)
+            await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
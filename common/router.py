@@ -0,0 +1,239 @@
+# router.py
+"""
+Hedged, failover model routing over an ordered pool of ADK models (usually `LiteLlm`).
+
+`ModelRouter` is itself a `BaseLlm`, so it drops in wherever an agent takes `model=`:
+
+    router = ModelRouter(models=[LiteLlm(model="openrouter/google/gemma-3-27b-it:free"),
+                                 LiteLlm(model="openrouter/meta-llama/llama-3.3-70b-instruct:free")])
+    LlmAgent(..., model=router)
+
+Each call goes to the first healthy model in the pool. If it has not produced its first response
+after its own `hedge_percentile` time-to-first-response (or `hedge_after` seconds until enough
+samples exist), the next model is started as a hedge; whichever answers first wins and the other
+request is cancelled. A 429, 5xx, timeout or connection error before any output fails over to the
+next model at once; a 429 also cools the model down for its Retry-After (or `cooldown`) seconds.
+Models cooling down or with a recent error rate above `max_error_rate` move to the back of the
+pool until they recover. `stats()` reports per-model calls, errors, wins and latency percentiles.
+
+`model_from_env` builds the pool from an app's own model plus MODEL_FALLBACKS (comma-separated
+model names); MODEL_HEDGE_PERCENTILE and MODEL_HEDGE_AFTER_SECONDS tune hedging. For tests,
+`common.fake_llm_server` serves OpenAI-compatible models with configurable latency and errors.
+"""
+import asyncio
+import os
+import sys
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Deque, Dict, List, Optional, TextIO
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from pydantic import PrivateAttr
+
+from .ratelimit import is_retryable
+from .telemetry import percentile
+
+WINDOW = 200  # Recent calls per model used for percentiles and error rates
+
+
+def _status(exc: BaseException) -> Optional[int]:
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    # litellm keeps the provider's headers on the exception; its `response` is a synthetic one.
+    for headers in (getattr(exc, "litellm_response_headers", None),
+                    getattr(getattr(exc, "response", None), "headers", None)):
+        try:
+            return float((headers or {}).get("retry-after"))
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class ModelStats:
+    """Rolling latency and outcome counters for one model of the pool."""
+
+    def __init__(self):
+        self.latencies: Deque[float] = deque(maxlen=WINDOW)  # Seconds to first response, successful calls
+        self.outcomes: Deque[bool] = deque(maxlen=WINDOW)
+        self.calls = self.errors = self.wins = self.hedges = self.cancelled = 0
+        self.cooldown_until = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def error_rate(self) -> float:
+        return 1 - sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        latencies = list(self.latencies)
+        result = {"calls": self.calls, "wins": self.wins, "errors": self.errors, "hedges": self.hedges,
+                  "cancelled": self.cancelled, "error_rate": round(self.error_rate, 3)}
+        if latencies:
+            result.update({f"p{q}_s": round(percentile(latencies, q), 3) for q in (50, 95, 99)})
+        cooldown = self.cooldown_until - time.monotonic()
+        if cooldown > 0:
+            result["cooldown_s"] = round(cooldown, 1)
+        if self.last_error:
+            result["last_error"] = self.last_error
+        return result
+
+
+class ModelRouter(BaseLlm):
+    """Routes each request over `models`, with hedging and failover; see the module docstring."""
+
+    models: List[BaseLlm]
+    hedge_percentile: float = 95.0
+    hedge_after: float = 10.0  # Seconds before hedging while a model has fewer than `min_samples` latencies
+    min_samples: int = 20
+    max_hedges: int = 1  # Extra requests started by hedging per call (failover is not limited)
+    max_error_rate: float = 0.5
+    cooldown: float = 30.0
+
+    _stats: Dict[str, ModelStats] = PrivateAttr(default_factory=dict)
+
+    def __init__(self, models: List[BaseLlm], **kwargs: Any):
+        if not models:
+            raise ValueError("ModelRouter needs at least one model")
+        kwargs.setdefault("model", models[0].model)  # Keeps cache keys and telemetry on the primary's name
+        super().__init__(models=models, **kwargs)
+
+    def stats_for(self, model: BaseLlm) -> ModelStats:
+        return self._stats.setdefault(model.model, ModelStats())
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {model.model: self.stats_for(model).summary() for model in self.models}
+
+    def print_stats(self, file: Optional[TextIO] = None) -> None:
+        file = file or sys.stderr
+        for name, stats in self.stats().items():
+            print(f"{name}: " + " ".join(f"{k}={v}" for k, v in stats.items()), file=file)
+
+    def order(self) -> List[BaseLlm]:
+        """The pool in try order: healthy models first (pool order), then the rest by soonest recovery."""
+        now = time.monotonic()
+        healthy, degraded = [], []
+        for model in self.models:
+            stats = self.stats_for(model)
+            if stats.cooldown_until > now or (len(stats.outcomes) >= 5 and stats.error_rate > self.max_error_rate):
+                degraded.append(model)
+            else:
+                healthy.append(model)
+        degraded.sort(key=lambda m: self.stats_for(m).cooldown_until)
+        return healthy + degraded
+
+    def hedge_delay(self, model: BaseLlm) -> float:
+        latencies = list(self.stats_for(model).latencies)
+        if len(latencies) < self.min_samples:
+            return self.hedge_after
+        return percentile(latencies, self.hedge_percentile)
+
+    async def _pump(self, model: BaseLlm, llm_request: LlmRequest, stream: bool, queue: asyncio.Queue) -> None:
+        try:
+            async for response in model.generate_content_async(llm_request, stream=stream):
+                await queue.put(("item", model, response))
+            await queue.put(("done", model, None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            await queue.put(("error", model, exc))
+
+    def _record_error(self, model: BaseLlm, exc: BaseException) -> None:
+        stats = self.stats_for(model)
+        stats.errors += 1
+        stats.outcomes.append(False)
+        stats.last_error = f"{type(exc).__name__}: {str(exc)[:200]}"
+        if _status(exc) == 429:
+            stats.cooldown_until = time.monotonic() + (_retry_after(exc) or self.cooldown)
+
+    async def generate_content_async(self, llm_request: LlmRequest,
+                                     stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        pending = self.order()
+        queue: asyncio.Queue = asyncio.Queue()
+        tasks: Dict[str, asyncio.Task] = {}
+        started: Dict[str, float] = {}
+        hedges = 0
+        winner: Optional[BaseLlm] = None
+
+        def launch() -> BaseLlm:
+            model = pending.pop(0)
+            self.stats_for(model).calls += 1
+            started[model.model] = time.monotonic()
+            # Each attempt gets its own copy: models append to and rewrite the request in place.
+            tasks[model.model] = asyncio.ensure_future(
+                self._pump(model, llm_request.model_copy(deep=True), stream, queue))
+            return model
+
+        newest = launch()
+        try:
+            while True:
+                timeout = None
+                if winner is None and pending and hedges < self.max_hedges:
+                    timeout = max(0.0, started[newest.model] + self.hedge_delay(newest) - time.monotonic())
+                try:
+                    kind, model, payload = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    hedges += 1
+                    newest = launch()
+                    self.stats_for(newest).hedges += 1
+                    continue
+
+                if winner is None:
+                    if kind == "error":
+                        self._record_error(model, payload)
+                        tasks.pop(model.model, None)
+                        if is_retryable(payload) and pending:
+                            newest = launch()  # Failover
+                        elif not tasks:
+                            raise payload
+                        continue
+                    winner = model
+                    stats = self.stats_for(model)
+                    stats.wins += 1
+                    stats.latencies.append(time.monotonic() - started[model.model])
+                    for name, task in list(tasks.items()):
+                        if name != model.model:
+                            task.cancel()
+                            self._stats[name].cancelled += 1
+                            tasks.pop(name)
+                elif model is not winner:
+                    continue  # Output of a cancelled attempt that was already queued
+
+                if kind == "item":
+                    yield payload
+                elif kind == "done":
+                    self.stats_for(model).outcomes.append(True)
+                    return
+                else:
+                    self._record_error(model, payload)
+                    raise payload  # Output already streamed; too late to switch models
+        finally:
+            for task in tasks.values():
+                task.cancel()
+
+
+def model_from_env(model: str, **kwargs: Any) -> BaseLlm:
+    """
+    A `LiteLlm` for `model`, or a `ModelRouter` over it plus the MODEL_FALLBACKS models (same
+    `kwargs` for each) when that variable is set.
+    """
+    from google.adk.models.lite_llm import LiteLlm
+
+    fallbacks = [name.strip() for name in os.environ.get("MODEL_FALLBACKS", "").split(",") if name.strip()]
+    if not fallbacks:
+        return LiteLlm(model=model, **kwargs)
+    # The router fails over instead; the client's own retries would sit out a Retry-After first.
+    kwargs.setdefault("max_retries", 0)
+    primary = LiteLlm(model=model, **kwargs)
+    options = {}
+    if os.environ.get("MODEL_HEDGE_PERCENTILE"):
+        options["hedge_percentile"] = float(os.environ["MODEL_HEDGE_PERCENTILE"])
+    if os.environ.get("MODEL_HEDGE_AFTER_SECONDS"):
+        options["hedge_after"] = float(os.environ["MODEL_HEDGE_AFTER_SECONDS"])
+    return ModelRouter(models=[primary] + [LiteLlm(model=name, **kwargs) for name in fallbacks if name != model],
+                       **options)
@@ -0,0 +1,339 @@
+# session_store.py
+"""
+SQLite-backed ADK session service with bounded history, for long-running or restarted apps.
+
+`SqliteSessionService` is a drop-in replacement for `InMemorySessionService`: sessions, their
+state (including `app:` and `user:` state) and events are written to one SQLite file, so a run
+that reuses a fixed session ID picks up where the last process stopped, and nothing is held in
+memory between calls.
+
+History is kept bounded:
+  - When a session's stored events exceed `max_tokens` (estimated at 4 characters per token) or
+    `max_events`, its oldest turns (whole invocations, so tool calls stay paired with their
+    responses) are folded into one summary event of at most `summary_tokens`, which the model
+    sees in place of the dropped turns. The turn in progress is never compacted.
+  - Sessions idle for longer than `idle_seconds`, and the least recently used sessions past
+    `max_sessions`, are deleted.
+
+    session_service = session_service_from_env()
+    session = await get_or_create_session(session_service, app_name=..., user_id=..., session_id=...)
+
+Configuration comes from the environment (see `SqliteSessionService.from_env`): SESSION_STORE_PATH,
+SESSION_MAX_TOKENS, SESSION_MAX_EVENTS, SESSION_MAX_SESSIONS, SESSION_IDLE_SECONDS and
+SESSION_STORE_DISABLED (which falls back to `InMemorySessionService`).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.adk.events.event import Event
+from google.adk.sessions import BaseSessionService, InMemorySessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+from google.genai import types
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "ups_hackathon", "sessions.sqlite3")
+SUMMARY_AUTHOR = "user"  # Summaries go to the model as earlier user context
+SUMMARY_MARKER = "[Compacted history]"
+
+
+def _estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def _split_state(state: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any], Dict[str, Any]]:
+    """Splits a state delta into (app, user, session) parts, dropping `temp:` keys."""
+    app, user, session = {}, {}, {}
+    for key, value in state.items():
+        if key.startswith(State.APP_PREFIX):
+            app[key.removeprefix(State.APP_PREFIX)] = value
+        elif key.startswith(State.USER_PREFIX):
+            user[key.removeprefix(State.USER_PREFIX)] = value
+        elif not key.startswith(State.TEMP_PREFIX):
+            session[key] = value
+    return app, user, session
+
+
+def _event_line(event: Event, width: int = 200) -> str:
+    parts = event.content.parts if event.content and event.content.parts else []
+    pieces = []
+    for part in parts:
+        if part.text:
+            pieces.append(" ".join(part.text.split())[:width])
+        elif part.function_call:
+            pieces.append(f"called {part.function_call.name}({json.dumps(part.function_call.args, default=str)[:width]})")
+        elif part.function_response:
+            pieces.append(f"{part.function_response.name} returned "
+                          f"{json.dumps(part.function_response.response, default=str)[:width]}")
+    return f"{event.author}: {' | '.join(pieces)}" if pieces else ""
+
+
+def summarize(events: List[Event], max_tokens: int) -> str:
+    """A truncated transcript of `events`, keeping the most recent lines that fit in `max_tokens`."""
+    lines = []
+    for event in events:
+        text = event.content.parts[0].text if event.content and event.content.parts else None
+        if text and text.startswith(SUMMARY_MARKER):
+            lines.extend(text.splitlines()[1:])  # An earlier summary: carry its lines over as they are
+        elif _event_line(event):
+            lines.append(_event_line(event))
+    header = f"{SUMMARY_MARKER} {len(events)} earlier events, truncated:"
+    kept, budget = [], max_tokens - _estimate_tokens(header)
+    for line in reversed(lines):
+        cost = _estimate_tokens(line) + 1
+        if cost > budget:
+            break
+        kept.append(line)
+        budget -= cost
+    return "\n".join([header] + kept[::-1])
+
+
+class SqliteSessionService(BaseSessionService):
+    """Persistent session service with history compaction and idle/LRU eviction; see the module docstring."""
+
+    def __init__(self, path: str = DEFAULT_PATH, max_tokens: int = 8000, max_events: int = 200,
+                 summary_tokens: int = 1000, max_sessions: int = 1000, idle_seconds: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_tokens = max_tokens
+        self.max_events = max_events
+        self.summary_tokens = summary_tokens
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.compactions = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def from_env(cls) -> "SqliteSessionService":
+        return cls(
+            path=os.environ.get("SESSION_STORE_PATH", DEFAULT_PATH),
+            max_tokens=int(os.environ.get("SESSION_MAX_TOKENS", 8000)),
+            max_events=int(os.environ.get("SESSION_MAX_EVENTS", 200)),
+            max_sessions=int(os.environ.get("SESSION_MAX_SESSIONS", 1000)),
+            idle_seconds=float(os.environ.get("SESSION_IDLE_SECONDS", 7 * 24 * 3600)),
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " app_name TEXT, user_id TEXT, id TEXT, state TEXT NOT NULL, tokens INTEGER NOT NULL,"
+                " events INTEGER NOT NULL, updated REAL NOT NULL, accessed REAL NOT NULL,"
+                " PRIMARY KEY (app_name, user_id, id));"
+                "CREATE INDEX IF NOT EXISTS sessions_accessed ON sessions (accessed);"
+                "CREATE TABLE IF NOT EXISTS events ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT, app_name TEXT, user_id TEXT, session_id TEXT,"
+                " invocation_id TEXT, timestamp REAL, tokens INTEGER NOT NULL, event TEXT NOT NULL);"
+                "CREATE INDEX IF NOT EXISTS events_session ON events (app_name, user_id, session_id, seq);"
+                "CREATE TABLE IF NOT EXISTS app_state (app_name TEXT PRIMARY KEY, state TEXT NOT NULL);"
+                "CREATE TABLE IF NOT EXISTS user_state ("
+                " app_name TEXT, user_id TEXT, state TEXT NOT NULL, PRIMARY KEY (app_name, user_id));"
+            )
+        return self._conn
+
+    # State
+
+    def _load_state(self, db: sqlite3.Connection, table: str, where: str, args: tuple) -> Dict[str, Any]:
+        row = db.execute(f"SELECT state FROM {table} WHERE {where}", args).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _merge_shared_state(self, db: sqlite3.Connection, app_name: str, user_id: str,
+                            app: Dict[str, Any], user: Dict[str, Any]) -> None:
+        if app:
+            state = {**self._load_state(db, "app_state", "app_name = ?", (app_name,)), **app}
+            db.execute("INSERT OR REPLACE INTO app_state VALUES (?, ?)", (app_name, json.dumps(state)))
+        if user:
+            state = {**self._load_state(db, "user_state", "app_name = ? AND user_id = ?", (app_name, user_id)),
+                     **user}
+            db.execute("INSERT OR REPLACE INTO user_state VALUES (?, ?, ?)", (app_name, user_id, json.dumps(state)))
+
+    def _with_shared_state(self, db: sqlite3.Connection, session: Session) -> Session:
+        app = self._load_state(db, "app_state", "app_name = ?", (session.app_name,))
+        user = self._load_state(db, "user_state", "app_name = ? AND user_id = ?", (session.app_name, session.user_id))
+        session.state.update({State.APP_PREFIX + k: v for k, v in app.items()})
+        session.state.update({State.USER_PREFIX + k: v for k, v in user.items()})
+        return session
+
+    # BaseSessionService
+
+    async def create_session(self, *, app_name: str, user_id: str, state: Optional[Dict[str, Any]] = None,
+                             session_id: Optional[str] = None) -> Session:
+        session_id = session_id.strip() if session_id and session_id.strip() else str(uuid.uuid4())
+        now = time.time()
+        app, user, own = _split_state(state or {})
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            # Like InMemorySessionService, creating an existing ID starts that session over.
+            db.execute("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                       (app_name, user_id, session_id))
+            db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, 0, 0, ?, ?)",
+                       (app_name, user_id, session_id, json.dumps(own), now, now))
+            self._merge_shared_state(db, app_name, user_id, app, user)
+            db.execute("COMMIT")
+            self._evict(db, now)
+            session = Session(app_name=app_name, user_id=user_id, id=session_id, state=own, last_update_time=now)
+            return self._with_shared_state(db, session)
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str,
+                          config: Optional[GetSessionConfig] = None) -> Optional[Session]:
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT state, updated FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                             (app_name, user_id, session_id)).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE sessions SET accessed = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+                       (time.time(), app_name, user_id, session_id))
+            query = "SELECT event FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?"
+            args: tuple = (app_name, user_id, session_id)
+            if config and config.after_timestamp:
+                query += " AND timestamp >= ?"
+                args += (config.after_timestamp,)
+            query += " ORDER BY seq"
+            events = [Event.model_validate_json(text) for (text,) in db.execute(query, args)]
+            if config and config.num_recent_events:
+                events = events[-config.num_recent_events:]
+            session = Session(app_name=app_name, user_id=user_id, id=session_id, state=json.loads(row[0]),
+                              events=events, last_update_time=row[1])
+            return self._with_shared_state(db, session)
+
+    async def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        with self._lock:
+            rows = self._db().execute("SELECT id, updated FROM sessions WHERE app_name = ? AND user_id = ?",
+                                      (app_name, user_id)).fetchall()
+        return ListSessionsResponse(sessions=[Session(app_name=app_name, user_id=user_id, id=session_id,
+                                                      last_update_time=updated) for session_id, updated in rows])
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            self._delete(db, app_name, user_id, session_id)
+            db.execute("COMMIT")
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+        app, user, own = _split_state(event.actions.state_delta if event.actions else {})
+        encoded = event.model_dump_json(exclude_none=True)
+        tokens = _estimate_tokens(event.content.model_dump_json(exclude_none=True)) if event.content else 0
+        key = (session.app_name, session.user_id, session.id)
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN")
+            row = db.execute("SELECT state, tokens, events FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?",
+                             key).fetchone()
+            if row is None:
+                db.execute("ROLLBACK")
+                return event  # Deleted or evicted meanwhile; the caller's copy still has the event
+            state = {**json.loads(row[0]), **own}
+            db.execute("INSERT INTO events (app_name, user_id, session_id, invocation_id, timestamp, tokens, event)"
+                       " VALUES (?, ?, ?, ?, ?, ?, ?)", key + (event.invocation_id, event.timestamp, tokens, encoded))
+            db.execute("UPDATE sessions SET state = ?, tokens = ?, events = ?, updated = ?, accessed = ?"
+                       " WHERE app_name = ? AND user_id = ? AND id = ?",
+                       (json.dumps(state), row[1] + tokens, row[2] + 1, event.timestamp, time.time()) + key)
+            self._merge_shared_state(db, session.app_name, session.user_id, app, user)
+            if row[1] + tokens > self.max_tokens or row[2] + 1 > self.max_events:
+                self._compact(db, key, event.invocation_id)
+            db.execute("COMMIT")
+        return event
+
+    # Bounds
+
+    def _compact(self, db: sqlite3.Connection, key: Tuple[str, str, str], current_invocation: str) -> None:
+        """Folds the oldest whole invocations of a session into one summary event until it is within bounds."""
+        rows = db.execute("SELECT seq, invocation_id, tokens, event FROM events"
+                          " WHERE app_name = ? AND user_id = ? AND session_id = ? ORDER BY seq", key).fetchall()
+        turns: List[List[tuple]] = []
+        for row in rows:
+            if turns and turns[-1][0][1] == row[1]:
+                turns[-1].append(row)
+            else:
+                turns.append([row])
+        tokens, count = sum(r[2] for r in rows), len(rows)
+        # Room for the summary itself; the newest turn and the one in progress are always kept.
+        target_tokens = max(0, self.max_tokens - self.summary_tokens)
+        target_events = max(1, self.max_events - 1)
+        dropped: List[tuple] = []
+        for turn in turns[:-1]:
+            if (tokens <= target_tokens and count <= target_events) or turn[0][1] == current_invocation:
+                break
+            dropped.extend(turn)
+            tokens -= sum(r[2] for r in turn)
+            count -= len(turn)
+        if not dropped or (len(dropped) == 1 and SUMMARY_MARKER in dropped[0][3]):
+            return  # Nothing to gain: at most an earlier summary would be replaced by a new one
+        events = [Event.model_validate_json(r[3]) for r in dropped]
+        text = summarize(events, self.summary_tokens)
+        summary = Event(author=SUMMARY_AUTHOR, invocation_id=events[0].invocation_id, timestamp=events[-1].timestamp,
+                        content=types.Content(role="user", parts=[types.Part(text=text)]))
+        summary_tokens = _estimate_tokens(summary.content.model_dump_json(exclude_none=True))
+        db.execute("DELETE FROM events WHERE seq <= ? AND app_name = ? AND user_id = ? AND session_id = ?",
+                   (dropped[-1][0],) + key)
+        # Keep the summary's place at the start of the history by reusing the first dropped sequence number.
+        db.execute("INSERT INTO events (seq, app_name, user_id, session_id, invocation_id, timestamp, tokens, event)"
+                   " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                   (dropped[0][0],) + key + (summary.invocation_id, summary.timestamp, summary_tokens,
+                                            summary.model_dump_json(exclude_none=True)))
+        db.execute("UPDATE sessions SET tokens = ?, events = ? WHERE app_name = ? AND user_id = ? AND id = ?",
+                   (tokens + summary_tokens, count + 1) + key)
+        self.compactions += 1
+
+    def _delete(self, db: sqlite3.Connection, app_name: str, user_id: str, session_id: str) -> None:
+        db.execute("DELETE FROM events WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                   (app_name, user_id, session_id))
+        db.execute("DELETE FROM sessions WHERE app_name = ? AND user_id = ? AND id = ?", (app_name, user_id, session_id))
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        stale = []
+        if self.idle_seconds:
+            stale = db.execute("SELECT app_name, user_id, id FROM sessions WHERE accessed < ?",
+                               (now - self.idle_seconds,)).fetchall()
+        (count,) = db.execute("SELECT COUNT(*) FROM sessions").fetchone()
+        excess = count - len(stale) - self.max_sessions
+        if excess > 0:
+            stale += db.execute("SELECT app_name, user_id, id FROM sessions WHERE accessed >= ?"
+                                " ORDER BY accessed LIMIT ?", (now - self.idle_seconds if self.idle_seconds else 0,
+                                                               excess)).fetchall()
+        if not stale:
+            return
+        db.execute("BEGIN")
+        for key in stale:
+            self._delete(db, *key)
+        db.execute("COMMIT")
+        self.evictions += len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions, tokens, events = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(tokens), 0), COALESCE(SUM(events), 0) FROM sessions").fetchone()
+        return {"sessions": sessions, "events": events, "tokens": tokens, "compactions": self.compactions,
+                "evictions": self.evictions}
+
+
+def session_service_from_env() -> BaseSessionService:
+    """A `SqliteSessionService` configured from the environment, or in-memory with SESSION_STORE_DISABLED."""
+    if os.environ.get("SESSION_STORE_DISABLED", "").lower() in ("1", "true", "yes"):
+        return InMemorySessionService()
+    return SqliteSessionService.from_env()
+
+
+async def get_or_create_session(session_service: BaseSessionService, *, app_name: str, user_id: str,
+                                session_id: str, state: Optional[Dict[str, Any]] = None) -> Session:
+    """Resumes `session_id` if the store still has it, else creates it."""
+    session = await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+    if session is None:
+        session = await session_service.create_session(app_name=app_name, user_id=user_id, state=state,
+                                                       session_id=session_id)
+    return session
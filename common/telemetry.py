@@ -0,0 +1,219 @@
+# telemetry.py
+"""
+Timing, token and latency instrumentation for ADK runs and tool calls.
+
+`Telemetry.run` wraps `Runner.run_async` and passes every event through unchanged while recording
+one JSON line per event (time since the run started and since the previous event, author, tool
+calls, token usage) and one per run (time to first event, total latency, prompt/completion tokens,
+tool call count, status). `Telemetry.tool` wraps a tool function and records its duration under
+the run that called it. Records are appended to a JSONL file and kept in memory for `summary`,
+which reports count, percentiles and a log-scale histogram per metric:
+
+    telemetry = Telemetry.from_env()
+    LlmAgent(..., tools=[telemetry.tool(log_reader_tool)])
+    async for event in telemetry.run(runner, user_id=..., session_id=..., new_message=...):
+        ...
+    telemetry.print_summary()
+
+Configuration comes from the environment (see `from_env`): TELEMETRY_PATH and TELEMETRY_DISABLED.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, TextIO
+
+DEFAULT_PATH = "telemetry.jsonl"
+MAX_SAMPLES = 100_000  # Per metric, for the in-memory summary; the JSONL file keeps everything
+
+_current_run: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("telemetry_run", default=None)
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 3)
+
+
+def _usage(event: Any) -> Dict[str, int]:
+    usage = getattr(event, "usage_metadata", None)
+    if usage is None:
+        return {}
+    return {
+        "prompt_tokens": usage.prompt_token_count or 0,
+        "completion_tokens": usage.candidates_token_count or 0,
+    }
+
+
+def _calls(event: Any) -> Dict[str, List[str]]:
+    content = getattr(event, "content", None)
+    calls, responses = [], []
+    for part in (content.parts or []) if content else []:
+        if part.function_call:
+            calls.append(part.function_call.name)
+        if part.function_response:
+            responses.append(part.function_response.name)
+    return {"function_calls": calls, "function_responses": responses}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, `q` in 0..100."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class Telemetry:
+    """Collects per-event, per-run and per-tool records; see the module docstring."""
+
+    def __init__(self, path: Optional[str] = DEFAULT_PATH, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self.samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "Telemetry":
+        return cls(
+            path=os.environ.get("TELEMETRY_PATH", DEFAULT_PATH) or None,
+            enabled=os.environ.get("TELEMETRY_DISABLED", "").lower() not in ("1", "true", "yes"),
+        )
+
+    def record(self, record: Dict[str, Any], metrics: Optional[Dict[str, float]] = None) -> None:
+        """Appends `record` to the JSONL file and adds `metrics` to the in-memory samples."""
+        if not self.enabled:
+            return
+        record = {"ts": round(time.time(), 3), **record}
+        with self._lock:
+            for name, value in (metrics or {}).items():
+                samples = self.samples.setdefault(name, [])
+                if len(samples) < MAX_SAMPLES:
+                    samples.append(value)
+            if self.path:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+
+    async def run(self, runner: Any, *, user_id: str, session_id: str, new_message: Any,
+                  **kwargs: Any) -> AsyncIterator[Any]:
+        """`runner.run_async(...)` with per-event and per-run records."""
+        if not self.enabled:
+            async for event in runner.run_async(user_id=user_id, session_id=session_id,
+                                                new_message=new_message, **kwargs):
+                yield event
+            return
+
+        run_id = uuid.uuid4().hex[:12]
+        token = _current_run.set(run_id)
+        agent = getattr(getattr(runner, "agent", None), "name", None)
+        started = last = time.perf_counter()
+        first_event_ms = None
+        totals = {"events": 0, "prompt_tokens": 0, "completion_tokens": 0, "tool_calls": 0}
+        status, error = "ok", None
+        try:
+            async for event in runner.run_async(user_id=user_id, session_id=session_id,
+                                                new_message=new_message, **kwargs):
+                now = time.perf_counter()
+                if first_event_ms is None:
+                    first_event_ms = _ms(now - started)
+                usage, calls = _usage(event), _calls(event)
+                totals["events"] += 1
+                totals["prompt_tokens"] += usage.get("prompt_tokens", 0)
+                totals["completion_tokens"] += usage.get("completion_tokens", 0)
+                totals["tool_calls"] += len(calls["function_calls"])
+                self.record({
+                    "kind": "event", "run_id": run_id, "agent": agent, "seq": totals["events"],
+                    "author": event.author, "t_ms": _ms(now - started), "gap_ms": _ms(now - last),
+                    "partial": bool(event.partial), "final": event.is_final_response(),
+                    **usage, **{k: v for k, v in calls.items() if v},
+                }, {"event_gap_ms": _ms(now - last)})
+                last = now
+                yield event
+        except GeneratorExit:
+            status = "closed"  # The caller stopped iterating early
+            raise
+        except BaseException as exc:
+            status, error = "error", f"{type(exc).__name__}: {exc}"
+            raise
+        finally:
+            try:
+                _current_run.reset(token)
+            except ValueError:  # Closed from a different context (e.g. garbage-collected)
+                pass
+            latency = _ms(time.perf_counter() - started)
+            metrics = {"run_latency_ms": latency}
+            if first_event_ms is not None:
+                metrics["time_to_first_event_ms"] = first_event_ms
+            if totals["prompt_tokens"] or totals["completion_tokens"]:
+                metrics["prompt_tokens"] = totals["prompt_tokens"]
+                metrics["completion_tokens"] = totals["completion_tokens"]
+            self.record({
+                "kind": "run", "run_id": run_id, "agent": agent, "session_id": session_id,
+                "time_to_first_event_ms": first_event_ms, "latency_ms": latency, **totals,
+                "status": status, **({"error": error} if error else {}),
+            }, metrics)
+
+    def tool(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """Wraps a sync or async tool function, keeping its signature and docstring for ADK."""
+        name = fn.__name__
+
+        def done(started: float, status: str) -> None:
+            duration = _ms(time.perf_counter() - started)
+            self.record({"kind": "tool", "run_id": _current_run.get(), "name": name,
+                         "duration_ms": duration, "status": status}, {f"tool:{name}_ms": duration})
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started, status = time.perf_counter(), "error"
+                try:
+                    result = await fn(*args, **kwargs)
+                    status = "ok"
+                    return result
+                finally:
+                    done(started, status)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started, status = time.perf_counter(), "error"
+            try:
+                result = fn(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                done(started, status)
+        return wrapper
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Per metric: count, p50/p90/p99/max and a histogram of power-of-two buckets (`<=2^k`: count)."""
+        with self._lock:
+            samples = {name: list(values) for name, values in self.samples.items()}
+        result = {}
+        for name, values in sorted(samples.items()):
+            histogram: Dict[str, int] = {}
+            for value in values:
+                bound = 2 ** max(0, math.ceil(math.log2(value))) if value > 0 else 0
+                histogram[f"<={bound}"] = histogram.get(f"<={bound}", 0) + 1
+            result[name] = {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p90": percentile(values, 90),
+                "p99": percentile(values, 99),
+                "max": max(values),
+                "histogram": dict(sorted(histogram.items(), key=lambda kv: float(kv[0][2:]))),
+            }
+        return result
+
+    def print_summary(self, file: Optional[TextIO] = None, width: int = 40) -> None:
+        """Prints `summary()` as text histograms (to stderr by default)."""
+        file = file or sys.stderr  # Looked up per call, so a redirected stderr is honoured
+        for name, stats in self.summary().items():
+            print(f"{name}: n={stats['count']} p50={stats['p50']} p90={stats['p90']} "
+                  f"p99={stats['p99']} max={stats['max']}", file=file)
+            peak = max(stats["histogram"].values())
+            for bucket, count in stats["histogram"].items():
+                bar = "#" * max(1, round(count / peak * width))
+                print(f"  {bucket:>10} {bar} {count}", file=file)
@@ -0,0 +1,43 @@
+# test_llm_cache.py
+"""
+`LlmResponseCache` callbacks: only complete, error-free responses are stored, and every finished
+request (stored or not) is dropped from the in-flight table.
+
+    python -m pytest common
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for the `common` package
+
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from common.llm_cache import LlmResponseCache
+
+
+def request(text):
+    return LlmRequest(model="stub", contents=[types.Content(role="user", parts=[types.Part(text=text)])])
+
+
+def reply(text, **fields):
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]), **fields)
+
+
+def test_failed_and_empty_responses_are_not_stored_or_kept_pending(tmp_path):
+    cache = LlmResponseCache(path=str(tmp_path / "cache.sqlite3"))
+    outcomes = {"error": LlmResponse(error_code="429", error_message="rate limited"), "empty": LlmResponse(),
+                "ok": reply("fine")}
+    for name, response in outcomes.items():
+        context = SimpleNamespace(invocation_id=name)
+        assert cache.before_model(context, request(name)) is None
+        cache.after_model(context, reply("partial", partial=True))
+        assert name in cache._pending  # A partial response leaves the request in flight
+        cache.after_model(context, response)
+        assert cache._pending == {}
+
+    hits = {name: cache.before_model(SimpleNamespace(invocation_id="again"), request(name)) for name in outcomes}
+    assert hits["error"] is None and hits["empty"] is None
+    assert hits["ok"].content.parts[0].text == "fine"
@@ -0,0 +1,92 @@
+# test_router.py
+"""
+`ModelRouter` against stub models: a hedge that answers first wins and cancels the slow attempt, a
+429 fails over and cools the model down, and a non-retryable error reaches the caller untouched.
+
+    python -m pytest common
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Repo root, for the `common` package
+
+import pytest
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from common.router import ModelRouter
+
+
+class HttpError(Exception):
+    """Shaped like a litellm API error: `status_code` plus the provider's response headers."""
+
+    def __init__(self, status_code: int, retry_after: float = None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.litellm_response_headers = {"retry-after": str(retry_after)} if retry_after else {}
+
+
+class StubModel(BaseLlm):
+    """Answers with its own name after `delay` seconds, or raises `error`; records calls and cancellations."""
+
+    delay: float = 0.0
+    error: Exception = None
+    calls: int = 0
+    cancelled: int = 0
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error is not None:
+            raise self.error
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=self.model)]))
+
+
+def ask(router):
+    async def run():
+        return [response.content.parts[0].text async for response in router.generate_content_async(LlmRequest())]
+    return asyncio.run(run())
+
+
+def test_hedge_wins_and_cancels_the_slow_attempt():
+    slow, fast = StubModel(model="slow", delay=5.0), StubModel(model="fast", delay=0.01)
+    router = ModelRouter(models=[slow, fast], hedge_after=0.05)
+    started = time.monotonic()
+    assert ask(router) == ["fast"]
+    assert time.monotonic() - started < 1.0
+    assert slow.cancelled == 1 and fast.cancelled == 0
+    stats = router.stats()
+    assert stats["slow"]["cancelled"] == 1 and stats["slow"]["wins"] == 0
+    assert stats["fast"]["hedges"] == 1 and stats["fast"]["wins"] == 1
+
+
+def test_rate_limit_fails_over_and_cools_down():
+    limited, backup = StubModel(model="limited", error=HttpError(429, retry_after=30)), StubModel(model="backup")
+    router = ModelRouter(models=[limited, backup], hedge_after=5.0)
+    started = time.monotonic()
+    assert ask(router) == ["backup"]
+    assert time.monotonic() - started < 1.0  # Failed over at once, without waiting to hedge
+    assert router.stats()["limited"]["cooldown_s"] > 25
+    assert router.order() == [backup, limited]
+
+    assert ask(router) == ["backup"]
+    assert limited.calls == 1 and backup.calls == 2
+
+
+def test_non_retryable_error_propagates():
+    error = HttpError(400)
+    broken, backup = StubModel(model="broken", error=error), StubModel(model="backup")
+    router = ModelRouter(models=[broken, backup], hedge_after=5.0)
+    with pytest.raises(HttpError) as raised:
+        ask(router)
+    assert raised.value is error
+    assert backup.calls == 0
+    assert "cooldown_s" not in router.stats()["broken"]
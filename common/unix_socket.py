@@ -0,0 +1,29 @@
+# unix_socket.py
+"""
+Claiming a Unix socket path for a server, shared by the CLI daemon and the stream scorer.
+"""
+import os
+import socket
+import stat
+
+
+def listening(path: str) -> bool:
+    """Whether a process accepts connections on the Unix socket at `path`."""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(path)
+    except OSError:
+        return False
+    return True
+
+
+def claim_socket_path(path: str) -> None:
+    """
+    Makes `path` free to bind: removes a stale socket left by a server that did not shut down
+    cleanly, and raises FileExistsError if the path is not a socket or a server still listens on it.
+    """
+    if not os.path.exists(path):
+        return
+    if not stat.S_ISSOCK(os.stat(path).st_mode) or listening(path):
+        raise FileExistsError(f"{path} is in use: a server is already listening there, or it is not a socket")
+    os.remove(path)